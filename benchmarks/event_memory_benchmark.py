@@ -0,0 +1,113 @@
+"""
+イベントの保持形式ごとのメモリ量・絞り込み時間のベンチマーク
+
+1年分（既定: 1日30件 × 365日）のイベントを次の3つの形で持ったときの1行あたりのメモリ量と、
+「直近14日のミルク」の切り出しにかかる時間を比べる。
+
+    dicts   : Supabaseのレスポンスそのまま（辞書のリスト。datetimeは文字列）
+    object  : 以前のイベント用DataFrame（datetime64[ns]・文字列の列・float64）
+    compact : event_store.events_to_frame（datetime64[ms]・カテゴリ型・float32）。select_events で切り出す
+
+使い方:
+    python benchmarks/event_memory_benchmark.py
+    python benchmarks/event_memory_benchmark.py --days 730 --events-per-day 40 --repeat 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from event_store import JST, events_to_frame, select_events  # noqa: E402
+
+EVENT_TYPES = [("formula", "ミルク"), ("breast", "母乳"), ("diaper_pee", "おしっこ"), ("diaper_poop", "うんち"),
+               ("sleep_start", "寝る"), ("sleep_end", "起きる")]
+
+
+def build_rows(days: int, events_per_day: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    start = datetime.now() - timedelta(days=days)
+    offsets = np.sort(rng.uniform(0, days * 86400, days * events_per_day))
+    kinds = rng.integers(0, len(EVENT_TYPES), offsets.size)
+    rows = []
+    for i, (offset, kind) in enumerate(zip(offsets, kinds)):
+        slug, label = EVENT_TYPES[kind]
+        rows.append({
+            "id": i + 1,
+            "datetime": (start + timedelta(seconds=float(offset))).replace(microsecond=0).isoformat(),
+            "type_slug": slug,
+            "type_jp": label,
+            "amount_ml": int(rng.integers(60, 200)) if slug == "formula" else None,
+        })
+    return rows
+
+
+def _deep_size(rows: list[dict]) -> int:
+    # リスト・辞書・キー・値それぞれのオブジェクトの大きさを足す（同じ文字列オブジェクトは1回だけ数える）
+    seen = set()
+    total = sys.getsizeof(rows)
+    for row in rows:
+        total += sys.getsizeof(row)
+        for obj in (*row.keys(), *row.values()):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += sys.getsizeof(obj)
+    return total
+
+
+def object_frame(rows: list[dict]) -> pd.DataFrame:
+    """以前の events_to_frame と同じ型のDataFrame"""
+    df = pd.DataFrame(rows)
+    df['datetime'] = pd.to_datetime(df['datetime']).dt.tz_localize(JST).dt.as_unit('ns')
+    df['type_slug'] = df['type_slug'].astype(object)
+    df['type_jp'] = df['type_jp'].astype(object)
+    df['amount_ml'] = pd.to_numeric(df['amount_ml']).astype('float64')
+    return df
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="イベントの保持形式ごとのメモリ量・絞り込み時間を計測する")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--events-per-day", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=100, help="絞り込みの計測回数（中央値を表示）")
+    args = parser.parse_args()
+
+    rows = build_rows(args.days, args.events_per_day)
+    legacy = object_frame(rows)
+    compact = events_to_frame(rows)
+    since = JST.localize(datetime.now() - timedelta(days=14))
+    since_text = since.replace(tzinfo=None).isoformat()
+
+    results = {
+        "dicts": (_deep_size(rows),
+                  lambda: [row for row in rows if row["datetime"] >= since_text and row["type_slug"] == "formula"]),
+        "object": (int(legacy.memory_usage(deep=True).sum()),
+                   lambda: legacy[(legacy['datetime'] >= since) & (legacy['type_slug'] == 'formula')]),
+        "compact": (int(compact.memory_usage(deep=True).sum()),
+                    lambda: select_events(compact, start=since, type_slugs=['formula'])),
+    }
+
+    print(f"{len(rows):,} events ({args.days} days x {args.events_per_day}/day)")
+    print(f"{'format':<8} {'total':>12} {'bytes/row':>10} {'filter':>10}")
+    for name, (size, select) in results.items():
+        print(f"{name:<8} {size:>12,} {size / len(rows):>10.1f} {_median_ms(select, args.repeat):>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
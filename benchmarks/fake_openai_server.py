@@ -0,0 +1,161 @@
+"""
+OpenAIの Chat Completions を真似るローカルのサーバー（digest_worker.py・ダッシュボードの動作確認・負荷試験用）
+
+POST /v1/chat/completions に、決まった文面の回答を返す（stream=true ならSSEで少しずつ返し、
+stream_options.include_usage があれば最後に usage を送る）。APIキーは確認しない。
+- usage の prompt_tokens は文字数からの見積もり（kpi_prompt.count_tokens）。
+  先頭から1024トークン以上のメッセージの並びが以前と同じなら、その分を cached_tokens として返す（プロンプトキャッシュの真似）
+- --latency で回答までの秒数、--rate-limit-every N で N 件ごとに 429（Retry-After 付き）を返す
+
+使い方:
+    python benchmarks/fake_openai_server.py --port 8765 --latency 0.5 --rate-limit-every 5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=sk-local python digest_worker.py
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=sk-local streamlit run dashboard.py
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kpi_prompt import count_tokens  # noqa: E402
+
+ANSWER = """\
+## 要点
+- ローカルの代替サーバーからの回答です
+- 記録の傾向は安定しています
+## 補足
+- 実際のモデルは呼んでいません
+## 次の一歩
+- OPENAI_BASE_URL を外して本番のAPIに接続してください
+"""
+CACHE_MIN_TOKENS = 1024  # これ未満の一致はキャッシュしない（OpenAIのプロンプトキャッシュと同じ）
+CACHE_BLOCK_TOKENS = 128  # キャッシュ済みトークンはこの単位で数える
+
+
+class FakeOpenAIState:
+    """サーバー全体で共有する状態（受けたリクエストの数・見たことのあるメッセージの先頭）"""
+
+    def __init__(self, latency: float = 0.0, rate_limit_every: int = 0, retry_after: float = 1.0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.prefixes: set[str] = set()
+
+    def admit(self) -> bool:
+        """このリクエストに回答するか（False なら 429 を返す）"""
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                return False
+            return True
+
+    def usage(self, messages: list[dict], completion: str) -> dict:
+        # 最後のuserメッセージより前（毎回同じ部分）をキャッシュの対象にする
+        prefix = "\n".join(message.get("content") or "" for message in messages[:-1])
+        prompt_tokens = sum(count_tokens(message.get("content") or "")[0] for message in messages)
+        prefix_tokens = count_tokens(prefix)[0]
+        with self.lock:
+            seen = prefix in self.prefixes
+            self.prefixes.add(prefix)
+        cached = prefix_tokens // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS if seen and prefix_tokens >= CACHE_MIN_TOKENS else 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count_tokens(completion)[0],
+            "total_tokens": prompt_tokens + count_tokens(completion)[0],
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+
+def make_handler(state: FakeOpenAIState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._json(404, {"error": {"message": f"not found: {self.path}", "type": "invalid_request_error"}})
+            if not state.admit():
+                return self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_error"}},
+                                  {"retry-after": f"{state.retry_after:g}"})
+            time.sleep(state.latency)
+            model = body.get("model", "gpt-4o-mini")
+            usage = state.usage(body.get("messages") or [], ANSWER)
+            created = int(time.time())
+            if not body.get("stream"):
+                return self._json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model}
+            for line in ANSWER.splitlines(keepends=True):
+                self._event({**chunk, "choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}]})
+            self._event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._event({**chunk, "choices": [], "usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def _json(self, status: int, payload: dict, headers: dict | None = None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _event(self, payload: dict):
+            self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_server(port: int = 0, latency: float = 0.0, rate_limit_every: int = 0,
+                 retry_after: float = 1.0) -> tuple[ThreadingHTTPServer, FakeOpenAIState]:
+    """バックグラウンドのスレッドでサーバーを起動する（port=0 なら空いているポート。server.server_address で確認）"""
+    state = FakeOpenAIState(latency, rate_limit_every, retry_after)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAIの Chat Completions を真似るローカルのサーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="回答までの秒数")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="N件ごとに429を返す（0なら返さない）")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429に付ける Retry-After の秒数")
+    args = parser.parse_args()
+
+    server, state = start_server(args.port, args.latency, args.rate_limit_every, args.retry_after)
+    print(f"OPENAI_BASE_URL=http://127.0.0.1:{server.server_address[1]}/v1 で待ち受けています（Ctrl+C で終了）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"リクエスト {state.requests} 件（うち429 {state.rate_limited} 件）")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+グラフ（Plotly Figure）の作成・送信コストのベンチマーク
+
+画面全体を描き直すたびに、ダッシュボードは棒グラフ2枚（カード2・5）と円形プログレスバー2枚（カード1・4）を
+st.plotly_chart でブラウザへ送る。1枚ごとに次を計測し、2×3グリッド分（4枚）の合計も表示する。
+
+    build_cold : キャッシュなしでFigureを作る時間（charts.py のキャッシュを消してから作成）
+    build_warm : 2回目以降（棒グラフは作成済みのFigure、円形は土台に値を差し替えるだけ）
+    serialize  : st.plotly_chart と同じ処理（to_dict + plotly.io.to_json）でJSONにする時間
+    bytes      : ブラウザへ送るJSONの大きさ（うちテンプレート部分 template_bytes）
+
+使い方:
+    python benchmarks/figure_benchmark.py
+    python benchmarks/figure_benchmark.py --repeat 500 --json
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import warnings
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+import plotly.io as pio  # noqa: E402
+import plotly.tools  # noqa: E402
+import streamlit.elements.plotly_chart  # noqa: E402,F401  st.plotly_chart と同じテンプレート（streamlit）を既定にする
+
+import charts  # noqa: E402
+
+
+def _median_ms(fn, repeat: int, before=None) -> float:
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1000
+
+
+def _serialize(fig) -> str:
+    # streamlit/elements/plotly_chart.py と同じ変換
+    return pio.to_json(plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True), validate=False)
+
+
+def _clear_caches():
+    charts._ring_base.clear()
+    charts._bar_chart_figure.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="グラフの作成・JSON化の時間と送信量を計測する")
+    parser.add_argument("--repeat", type=int, default=200, help="各計測の回数（中央値を表示）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    days = [date.today() - timedelta(days=i) for i in range(13, -1, -1)]
+    sleep = pd.DataFrame({'date': days, 'count': [10.5, 11.25, 9.75, 12.0, 10.0, 11.5, 9.0] * 2})
+    milk = pd.DataFrame({'date': days, 'amount': [620, 700, 0, 680, 710, 650, 690] * 2})
+    figures = {
+        "sleep_chart": lambda: charts.create_bar_chart(sleep, "睡眠時間 前週平均比較", "#4A90E2", 10.6),
+        "feeding_chart": lambda: charts.create_bar_chart(milk, "ミルク量  前週平均比較", "#4A90E2", 640),
+        "diaper_progress": lambda: charts.create_circular_progress(95, 180),
+        "feeding_progress": lambda: charts.create_circular_progress(150, 180),
+    }
+
+    results = {}
+    for name, make in figures.items():
+        spec = _serialize(make())
+        template = json.dumps(json.loads(spec)["layout"].get("template", {}))
+        results[name] = {
+            "build_cold_ms": _median_ms(make, args.repeat, before=_clear_caches),
+            "build_warm_ms": _median_ms(make, args.repeat),
+            "serialize_ms": _median_ms(lambda: _serialize(make()), args.repeat),
+            "bytes": len(spec.encode("utf-8")),
+            "template_bytes": len(template.encode("utf-8")),
+        }
+    results["total"] = {key: round(sum(r[key] for r in results.values()), 3) for key in next(iter(results.values()))}
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'figure':<18} {'build_cold':>11} {'build_warm':>11} {'serialize':>10} {'bytes':>8} {'template':>9}")
+    for name, r in results.items():
+        print(f"{name:<18} {r['build_cold_ms']:>9.2f}ms {r['build_warm_ms']:>9.2f}ms {r['serialize_ms']:>8.2f}ms "
+              f"{r['bytes']:>8,} {r['template_bytes']:>9,}")
+
+
+if __name__ == "__main__":
+    # st.cache_resource をStreamlitの実行環境の外で使うときの警告を抑える
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore")
+    main()
@@ -0,0 +1,57 @@
+"""
+授乳・おむつ替えの間隔の集計（event_intervals.py）の計算時間ベンチマーク
+
+期間（既定: 14 / 90 / 365日、1日30件）ごとに、授乳・おむつの2分類について
+compute_intervals → daily_interval_stats → summarize_intervals を行う時間を計測する。
+画面表示のたびに計算しても問題ない（期間に比例して増える）ことを確認する。
+
+使い方:
+    python benchmarks/interval_benchmark.py
+    python benchmarks/interval_benchmark.py --days 30 180 730 --repeat 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from event_intervals import INTERVAL_CATEGORIES, compute_intervals, daily_interval_stats, summarize_intervals  # noqa: E402
+from event_memory_benchmark import build_rows  # noqa: E402
+from event_store import events_to_frame  # noqa: E402
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1000
+
+
+def analyze(frame):
+    for category in INTERVAL_CATEGORIES:
+        intervals = compute_intervals(frame, category)
+        daily_interval_stats(intervals)
+        summarize_intervals(intervals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="授乳・おむつ替えの間隔の集計時間を計測する")
+    parser.add_argument("--days", type=int, nargs="+", default=[14, 90, 365])
+    parser.add_argument("--events-per-day", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=30, help="各計測の回数（中央値を表示）")
+    args = parser.parse_args()
+
+    print(f"{'days':>6} {'events':>8} {'analyze':>10}")
+    for days in args.days:
+        frame = events_to_frame(build_rows(days, args.events_per_day))
+        print(f"{days:>6} {len(frame):>8,} {_median_ms(lambda: analyze(frame), args.repeat):>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
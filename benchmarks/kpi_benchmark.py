@@ -0,0 +1,100 @@
+"""
+KPIの派生統計（平均・標準偏差・傾き・日常語ラベル）の計算時間ベンチマーク
+
+    per_call : 以前の build_kpi_payload_for_gpt と同じく、毎回7日分から series_stats（np.polyfit）と qualitative_labels を計算
+    engine   : KpiEngine（締まった日の和を保持）から、今日の値を含めた統計量とラベルを取り出す
+    close_day: KpiEngine に1日分を追加する（4指標 × 7/14/28日）
+    batch    : 多数の赤ちゃん（--babies）の28日分の日次合計から、batch_kpis で全員・全指標の7日統計とラベルを計算
+    loop     : batch と同じ計算を赤ちゃんごとに series_stats / qualitative_labels で行う
+
+使い方:
+    python benchmarks/kpi_benchmark.py
+    python benchmarks/kpi_benchmark.py --babies 5000 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kpi_engine import METRICS, KpiEngine, batch_kpis, qualitative_labels, series_stats  # noqa: E402
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1000
+
+
+def build_daily(babies: int, days: int, end: date, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = babies * days
+    return pd.DataFrame({
+        "baby_id": np.repeat([f"baby-{b:05d}" for b in range(babies)], days),
+        "date": [end - timedelta(days=i) for i in range(days - 1, -1, -1)] * babies,
+        "sleep_hours": rng.uniform(8, 14, n).round(2),
+        "milk_ml": rng.integers(400, 1000, n).astype(float),
+        "diaper_count": rng.integers(4, 12, n),
+        "feeding_count": rng.integers(5, 10, n),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KPIの派生統計の計算時間を計測する")
+    parser.add_argument("--babies", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50, help="各計測の回数（中央値を表示）")
+    args = parser.parse_args()
+
+    today = date.today()
+    daily = build_daily(args.babies, 28, today)
+    one = daily[daily["baby_id"] == daily["baby_id"].iloc[0]]
+    last7 = {metric: one[metric].astype(float).tolist()[-7:] for metric in METRICS}
+
+    def per_call():
+        for metric, spec in METRICS.items():
+            stats = series_stats(last7[metric])
+            qualitative_labels(mean=stats["mean"], std=stats["std"], slope=stats["trend_slope_per_day"], **spec)
+
+    engine = KpiEngine()
+    engine.sync(one, today, since=one["date"].iloc[0])
+
+    def from_engine():
+        for metric in METRICS:
+            engine.labels(metric, 7, today_value=last7[metric][-1])
+
+    day = [today]
+
+    def close_day():
+        day[0] += timedelta(days=1)
+        engine.close_day(day[0], {metric: 1.0 for metric in METRICS})
+
+    def loop():
+        window = daily[daily["date"] > today - timedelta(days=7)]
+        for _, rows in window.groupby("baby_id", sort=False):
+            for metric, spec in METRICS.items():
+                stats = series_stats(rows[metric].astype(float).tolist())
+                qualitative_labels(mean=stats["mean"], std=stats["std"], slope=stats["trend_slope_per_day"], **spec)
+
+    results = {
+        "per_call": _median_ms(per_call, args.repeat),
+        "engine": _median_ms(from_engine, args.repeat),
+        "close_day": _median_ms(close_day, args.repeat),
+        f"batch ({args.babies})": _median_ms(lambda: batch_kpis(daily, today, window=7), max(1, args.repeat // 10)),
+        f"loop ({args.babies})": _median_ms(loop, max(1, args.repeat // 10)),
+    }
+    for name, ms in results.items():
+        print(f"{name:<16} {ms:>10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+テナント（赤ちゃん）ごとの問い合わせ時間ベンチマーク
+
+baby_events 全体の行数を増やしながら（既定: 1万 / 10万 / 100万行）、1人分のダッシュボード表示で
+発行する問い合わせの時間を計測する。baby_id を先頭にした複合索引があれば、表全体が大きくなっても
+1人分の時間はほぼ一定になる（--no-tenant-indexes で索引なしの場合と比べられる）。
+
+計測する問い合わせ（dashboard.py と同じ形）:
+    snapshot : 直近15日分のスナップショット（baby_id で絞り込み、datetime の範囲読み）
+    probe    : 鮮度トークン（その赤ちゃんの最新id）
+    latest   : RPC baby_latest_events（分類ごとの最新イベント＋最新id。経過時間カードと鮮度トークンを兼ねる）
+    totals   : RPC baby_daily_totals（14日分の日次集計）
+    rollup   : 日次ロールアップ表の14行読み
+
+ネットワークを使わないよう、SQLiteのローカル代替（local_backend.py）で計測する。
+Postgresでも索引の効き方は同じだが、絶対値は Supabase の環境で測り直すこと。
+
+使い方:
+    python benchmarks/tenant_query_benchmark.py
+    python benchmarks/tenant_query_benchmark.py --sizes 10000 100000 --repeat 20
+    python benchmarks/tenant_query_benchmark.py --no-tenant-indexes
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from local_backend import create_local_client  # noqa: E402
+from tenancy import Tenant  # noqa: E402
+
+EVENT_COLUMNS = "id, datetime, type_slug, type_jp, amount_ml"
+SLUGS = np.array(["formula", "breast", "diaper_pee", "diaper_poop", "sleep_start", "sleep_end"])
+TENANT_INDEXES = ["baby_events_baby_type_slug_datetime_idx", "baby_events_baby_datetime_idx", "baby_events_baby_id_idx"]
+
+
+def build_db(path: str, total_rows: int, events_per_day: int, days: int, tenant_indexes: bool, seed: int = 0):
+    """
+    1人あたり events_per_day × days 行の赤ちゃんを、合計 total_rows 行になるまで作る。
+    計測対象の赤ちゃん（baby-0000）の行数はどのサイズでも同じ。
+    """
+    client = create_local_client(f"sqlite:///{path}")
+    conn = client._conn
+    if not tenant_indexes:
+        for name in TENANT_INDEXES:
+            conn.execute(f"drop index if exists {name}")
+
+    rng = np.random.default_rng(seed)
+    per_baby = events_per_day * days
+    babies = max(1, total_rows // per_baby)
+    start = datetime.now() - timedelta(days=days)
+    for b in range(babies):
+        offsets = np.sort(rng.uniform(0, days * 86400, per_baby))
+        stamps = (np.datetime64(start.replace(microsecond=0)) + offsets.astype("timedelta64[s]")).astype(str)
+        slugs = rng.choice(SLUGS, per_baby)
+        amounts = np.where(slugs == "formula", rng.choice([80.0, 100.0, 120.0], per_baby), np.nan)
+        baby_id = f"baby-{b:04d}"
+        conn.executemany(
+            "insert into baby_events (datetime, type_slug, type_jp, amount_ml, household_id, baby_id) values (?, ?, ?, ?, ?, ?)",
+            (
+                (ts, slug, slug, None if np.isnan(ml) else float(ml), f"household-{b // 2:04d}", baby_id)
+                for ts, slug, ml in zip(stamps, slugs, amounts)
+            ),
+        )
+    conn.commit()
+    # 計測対象の赤ちゃんの日次ロールアップだけを作る（トリガー相当の処理は行数に比例して遅いため）
+    client.rpc("baby_rollup_backfill", {
+        "p_from": (datetime.now() - timedelta(days=14)).date().isoformat(),
+        "p_to": datetime.now().date().isoformat(),
+        "p_baby_id": "baby-0000",
+    }).execute()
+    conn.execute("analyze")
+    return client, babies
+
+
+def _time(fn, repeat: int) -> float:
+    fn()  # ウォームアップ
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1000
+
+
+def measure(client, tenant: Tenant, repeat: int) -> dict:
+    today = datetime.now().date()
+    since = (datetime.now() - timedelta(days=15)).isoformat()
+    return {
+        "snapshot": _time(lambda: tenant.apply(client.table("baby_events").select(EVENT_COLUMNS))
+                          .gte("datetime", since).order("datetime", desc=False).execute(), repeat),
+        "probe": _time(lambda: tenant.apply(client.table("baby_events").select("id, datetime"))
+                       .order("id", desc=True).limit(1).execute(), repeat),
+        "latest": _time(lambda: client.rpc("baby_latest_events", {
+            "p_baby_id": tenant.baby_id,
+        }).execute(), repeat),
+        "totals": _time(lambda: client.rpc("baby_daily_totals", {
+            "p_today": today.isoformat(), "p_days": 14, "p_baby_id": tenant.baby_id,
+        }).execute(), repeat),
+        "rollup": _time(lambda: client.table("baby_daily_rollup").select("day, milk_ml, sleep_hours")
+                        .eq("baby_id", tenant.rollup_key).gte("day", (today - timedelta(days=13)).isoformat())
+                        .lte("day", today.isoformat()).order("day").execute(), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="表全体の行数に対する、1人分の問い合わせ時間を計測する")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="baby_events 全体の行数")
+    parser.add_argument("--events-per-day", type=int, default=30, help="1人1日あたりのイベント数")
+    parser.add_argument("--days", type=int, default=120, help="1人あたりの記録日数")
+    parser.add_argument("--repeat", type=int, default=10, help="各問い合わせの計測回数（中央値を表示）")
+    parser.add_argument("--no-tenant-indexes", action="store_true", help="baby_id の複合索引を作らずに計測する")
+    args = parser.parse_args()
+
+    tenant = Tenant(household_id="household-0000", baby_id="baby-0000")
+    print(f"索引: {'なし' if args.no_tenant_indexes else 'あり'} / 1人あたり {args.events_per_day * args.days:,} 行")
+    print(f"{'total_rows':>12} {'babies':>7} {'snapshot':>10} {'probe':>10} {'latest':>10} {'totals':>10} {'rollup':>10}  (ms)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.db")
+            client, babies = build_db(path, size, args.events_per_day, args.days, not args.no_tenant_indexes)
+            result = measure(client, tenant, args.repeat)
+            total = client._fetch("select count(*) as n from baby_events", [])[0]["n"]
+            print(f"{total:>12,} {babies:>7} " + " ".join(f"{result[k]:>10.2f}" for k in ("snapshot", "probe", "latest", "totals", "rollup")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+ダッシュボードのグラフ（円形プログレスバー＜カード1・4＞・棒グラフ＜カード2・5＞）
+
+画面を描き直すたびに go.Figure を一から作ると、Plotlyの検証処理だけで1枚あたり数ミリ秒かかる。
+- 棒グラフ: (日付, 値, タイトル, 色, 前週平均) が同じなら、作成済みのFigureをそのまま返す（新しい記録が入るまで同じ）
+- 長期の推移・授乳/おむつ替えの間隔: 棒グラフと同じく、(日付・期間, 値, 色) が同じなら作成済みのFigureを返す
+- 円形プログレスバー: 色の段階（青・オレンジ・赤）と上限値ごとに土台のFigureを1回だけ作り、
+  経過分（扇形の値と中央の表示）だけを差し替えた軽いFigureを返す（フラグメントが30秒ごとに描き直すため）
+
+キャッシュしたFigureはセッション間で共有するため、呼び出し側で変更しないこと
+（st.plotly_chart は送信時に to_dict() でコピーするだけで、Figure自体は変更しない）。
+送信量・作成時間は benchmarks/figure_benchmark.py で計測できる。
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+FIGURE_CACHE_MAX_ENTRIES = 32
+
+# ---------------------------------------------------------
+# 円形プログレスバー＜カード1・4＞
+# ---------------------------------------------------------
+RING_TRACK_COLOR = '#d3d3d3'
+RING_LABEL_TEMPLATE = '<span style="color:black; font-size:30px; font-weight:bold;">{value}</span><br><span style="color:black; font-size:16px;"><br>分経過</span>'
+
+def ring_color(actual_value: int) -> str:
+    """
+    時間経過に応じた色の段階
+    - 0-119分: 青色 (#4A90E2)
+    - 120-179分: オレンジ色 (#FFA500)
+    - 180分以上: 赤色 (#FF4500)
+    """
+    if actual_value <= 119:
+        return "#4A90E2"  # 青色
+    elif actual_value <= 179:
+        return "#FFA500"  # オレンジ色
+    return "#FF4500"  # 赤色
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def _ring_base(progress_color: str, max_value: int) -> dict:
+    """色の段階・上限値ごとの土台（検証済みのFigureを辞書にしたもの）。値と中央の表示は create_circular_progress で差し替える"""
+    #円形プログレスバー作成
+    fig = go.Figure(data=[go.Pie(
+        values=[0, max_value],
+        hole=.7,
+        marker_colors=[progress_color, RING_TRACK_COLOR],
+        textinfo='none',
+        showlegend=False,
+        hoverinfo='skip',
+        direction='clockwise', # 時計回り
+        sort=False,
+        #rotation=90　←最初から12時の方向に開始されるので不要
+    )])
+
+    fig.update_layout(
+        showlegend=False,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(t=0, b=0, l=0, r=0),
+        autosize=True,
+        height=150,  # 高さを半分に設定
+        annotations=[
+            dict(
+                text=RING_LABEL_TEMPLATE.format(value=0),
+                x=0.5,
+                y=0.5,
+                showarrow=False,
+                align='center'
+            )
+        ]
+    )
+    return fig.to_dict()
+
+def create_circular_progress(actual_value, max_value):
+    """
+    円形プログレスバーを作成し、中央に値を表示する
+    時間経過に応じて色を動的に変更する（ring_color）。
+
+    Args:
+        actual_value (int): 実際の経過時間（分）。中央に表示される値。
+        max_value (int): グラフの上限（分）。プログレスバーが一周する値。
+
+    Returns:
+        go.Figure: PlotlyのFigureオブジェクト。
+    """
+    base = _ring_base(ring_color(actual_value), max_value)
+
+    # グラフの色付きの領域として表示する値。最大値を超えないように制限する。
+    display_value = min(actual_value, max_value)
+
+    # 土台は検証済みなので、差し替えた値だけを持つ辞書から検証なしでFigureを作る（土台の辞書は変更しない）
+    pie = {**base['data'][0], 'values': [display_value, max_value - display_value]}
+    annotation = {**base['layout']['annotations'][0], 'text': RING_LABEL_TEMPLATE.format(value=actual_value)}
+    layout = {**base['layout'], 'annotations': [annotation]}
+    return go.Figure({'data': [pie], 'layout': layout}, _validate=False)
+
+# ---------------------------------------------------------
+# 棒グラフの作成（デスクトップ1画面対応）＜カード2・5＞
+# ---------------------------------------------------------
+def create_bar_chart(data, title, color="#4A90E2", average_value=None):
+    df = pd.DataFrame(data)
+
+    # DataFrameの2列目（index 1）をデータの値の列とする
+    value_column = df.columns[1]
+
+    # 日付列を 'date' に統一する (get_feeding_summary_dataが出力する形式に合わせる)
+    if 'date' not in df.columns:
+        df.columns = ['date', value_column]
+
+    # 日付・値・前週平均が同じなら作成済みのFigureを返す（キャッシュのキーにするためタプルにする）
+    average = float(average_value) if average_value is not None else None
+    return _bar_chart_figure(tuple(df['date']), tuple(df[value_column].tolist()), title, color, average)
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def _bar_chart_figure(dates: tuple, values: tuple, title: str, color: str, average_value: float | None) -> go.Figure:
+    """create_bar_chartの実処理（キャッシュ対象）"""
+    y = np.asarray(values)  # 整数のデータは整数のまま送る（Plotlyが小さい型に詰めて送信量を減らす）
+    num_days = len(dates)
+    x_range_indices = None
+
+    # データが7日分以上ある場合、直近7日間の範囲を設定する
+    if num_days >= 7:
+        # PlotlyはX軸をカテゴリカルデータとして扱うため、インデックスで範囲を指定する。
+        # 直近7日間はインデックスの (num_days - 7) から (num_days - 1) に対応。
+        # グラフの棒が途切れないように、開始と終了のインデックスに +/- 0.5 の調整を加える。
+        x_range_indices = [num_days - 7 - 0.5, num_days - 1 + 0.5]
+
+    # 棒の中の数値（整数に切り捨て。0は表示しない）を配列でまとめて作る
+    labels = np.where(y > 0, np.char.mod('%d', np.nan_to_num(y)), '')
+
+    # 棒グラフの作成
+    fig = go.Figure(data=[
+        go.Bar(
+            x=list(dates),
+            y=y,
+            text=labels,
+            marker_color=color,
+            textposition='inside',
+            insidetextanchor='end',
+            marker_cornerradius=3,
+            textfont=dict(color='white', size=12),
+            showlegend=False # 凡例を非表示にする
+        )
+    ])
+
+    # 前週平均線の作成 (average_value が渡された場合にのみ実行)
+    if average_value is not None and average_value > 0:
+        # 前週の平均値を今週の棒グラフ領域に表示したい
+        # 前週のデータには線を引かないように、直近7日分だけ平均値、残りはNone(Plotlyは無視する)を設定
+        y_line = [None] * (num_days - 7) + [average_value] * min(num_days, 7)
+        fig.add_trace(
+            go.Scatter(
+                x=list(dates),
+                y=y_line, # ← 14日間のうち直近7日間にのみ平均値を設定
+                mode='lines',
+                line=dict(color='red', width=2, dash='dash'),
+                name='前週平均',
+                showlegend=False
+            )
+        )
+
+    # Y軸の最大値を調整して平均線が入りやすいようにする (平均値が存在する場合)
+    y_max = float(np.nanmax(y)) if np.isfinite(y).any() else 0.0
+    y_top = y_max * 1.1 if average_value is None or y_max * 1.1 > average_value * 1.1 else average_value * 1.1
+
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#2c3e50', size=10),
+        xaxis=dict(
+            showgrid=False,
+            zeroline=False,
+            #tickformat='%m/%d',
+            title="",
+            tickfont=dict(size=9),
+            range=x_range_indices,# ★★★ X軸の表示範囲を適用 ★★★
+            rangeslider=dict(visible=False),
+            type='category' # X軸をカテゴリカルとして扱う
+        ),
+        yaxis=dict(
+            showgrid=False,
+            zeroline=False,
+            title="",
+            tickfont=dict(size=9),
+            range=[0, y_top]
+        ),
+        margin=dict(t=5, b=5, l=15, r=15),
+        autosize=True,
+        height=180
+    )
+
+    return fig
+
+# ---------------------------------------------------------
+# 長期の推移（日・週・月ごとの平均）＜長期表示＞
+# ---------------------------------------------------------
+HISTORY_LABEL_MAX_BARS = 16  # これより棒が多いときは棒の中の数値を省く（ホバーで確認できる）
+
+def create_history_chart(buckets: pd.DataFrame, value_column: str, color="#4A90E2", unit=""):
+    """
+    bucket_daily_totals の結果から、期間ごとの1日あたり平均の棒グラフを作る。
+
+    Args:
+        buckets: label, days 列と value_column 列を持つDataFrame
+        value_column: 'milk_ml' / 'sleep_hours'
+        unit: ホバーに表示する単位
+    """
+    values = buckets[value_column].round(1)
+    return _history_chart_figure(tuple(buckets['label']), tuple(values.tolist()), tuple(buckets['days'].tolist()), color, unit)
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def _history_chart_figure(labels: tuple, values: tuple, days: tuple, color: str, unit: str) -> go.Figure:
+    """create_history_chartの実処理（キャッシュ対象）"""
+    y = np.asarray(values, dtype=float)
+    show_text = len(labels) <= HISTORY_LABEL_MAX_BARS
+    text = np.where(np.nan_to_num(y) > 0, np.char.mod('%g', np.nan_to_num(y)), '') if show_text else None
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=list(labels),
+            y=y,
+            text=text,
+            customdata=np.asarray(days),
+            hovertemplate=f'%{{x}}<br>%{{y}}{unit}/日<br>記録 %{{customdata}}日<extra></extra>',
+            marker_color=color,
+            textposition='inside',
+            insidetextanchor='end',
+            marker_cornerradius=3,
+            textfont=dict(color='white', size=12),
+            showlegend=False
+        )
+    ])
+    y_max = float(np.nanmax(y)) if np.isfinite(y).any() else 0.0
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#2c3e50', size=10),
+        xaxis=dict(showgrid=False, zeroline=False, title="", tickfont=dict(size=9), type='category'),
+        yaxis=dict(showgrid=False, zeroline=False, title="", tickfont=dict(size=9), range=[0, y_max * 1.1 or 1]),
+        margin=dict(t=5, b=5, l=15, r=15),
+        autosize=True,
+        height=180
+    )
+    return fig
+
+# ---------------------------------------------------------
+# 授乳・おむつ替えの間隔（日ごとの中央値と90%）＜間隔の表示＞
+# ---------------------------------------------------------
+def create_interval_chart(daily: pd.DataFrame, color="#4A90E2"):
+    """
+    daily_interval_stats の結果から、日ごとの間隔の中央値（棒）と90パーセンタイル（点）のグラフを作る（単位: 時間）。
+
+    Args:
+        daily: date（「月/日」の文字列）, median, p90, count 列を持つDataFrame（分）
+    """
+    to_hours = lambda column: tuple((daily[column] / 60).round(2).tolist())
+    return _interval_chart_figure(tuple(daily['date']), to_hours('median'), to_hours('p90'), tuple(daily['count'].tolist()), color)
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_MAX_ENTRIES)
+def _interval_chart_figure(dates: tuple, medians: tuple, p90s: tuple, counts: tuple, color: str) -> go.Figure:
+    """create_interval_chartの実処理（キャッシュ対象）"""
+    y = np.asarray(medians, dtype=float)
+    p90 = np.asarray(p90s, dtype=float)
+    fig = go.Figure(data=[
+        go.Bar(
+            x=list(dates),
+            y=y,
+            text=np.where(np.nan_to_num(y) > 0, np.char.mod('%.1f', np.nan_to_num(y)), ''),
+            customdata=np.asarray(counts),
+            hovertemplate='%{x}<br>中央値 %{y}時間<br>間隔 %{customdata}回<extra></extra>',
+            marker_color=color,
+            textposition='inside',
+            insidetextanchor='end',
+            marker_cornerradius=3,
+            textfont=dict(color='white', size=12),
+            showlegend=False
+        ),
+        go.Scatter(
+            x=list(dates),
+            y=p90,
+            mode='markers',
+            marker=dict(color='red', size=7, symbol='line-ew-open', line=dict(width=2)),
+            hovertemplate='%{x}<br>90%: %{y}時間<extra></extra>',
+            showlegend=False
+        ),
+    ])
+    finite = np.concatenate([y, p90])
+    y_max = float(np.nanmax(finite)) if np.isfinite(finite).any() else 0.0
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#2c3e50', size=10),
+        xaxis=dict(showgrid=False, zeroline=False, title="", tickfont=dict(size=9), type='category'),
+        yaxis=dict(showgrid=False, zeroline=False, title="", tickfont=dict(size=9), range=[0, y_max * 1.1 or 1]),
+        margin=dict(t=5, b=5, l=15, r=15),
+        autosize=True,
+        height=180
+    )
+    return fig
@@ -1,14 +1,29 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import numpy as np
-from openai import OpenAI
 import os
-from supabase import create_client
 import pytz #タイムゾーンデータベースを提供するライブラリ
 import json #GPTでの分析の際にJson化させるため記載
+import logging #GPTの応答時間（TTFT）の記録用
+import time
+import threading #カード用データの並行取得
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from response_cache import ResponseCache, make_cache_key #GPT回答のキャッシュ
+from kpi_engine import KpiEngine #KPIの派生統計（日ごとの差分更新）
+from versioned_cache import VersionedCache #KPI_JSONの事前計算（データの版ごと）
+from kpi_prompt import analysis_type, encode_kpi_json, prompt_token_report #KPI_JSONの圧縮（質問ごとの絞り込み・列形式）とトークン数
+from gpt_metrics import GptMetricsLog #GPT呼び出しの使用量・応答時間の記録
+from digest_store import DigestStore #夜間に作成した分析（ダイジェスト）
+from event_intervals import (INTERVAL_CATEGORIES, compute_intervals, daily_interval_stats, intervals_since,
+                             summarize_intervals) #授乳・おむつ替えの間隔
+from charts import create_bar_chart, create_circular_progress, create_history_chart, create_interval_chart #グラフの作成（Figureの再利用）
+from tenancy import SINGLE_TENANT, Tenant, TenantTokenError, tenant_from_params, tenant_from_token #家庭・赤ちゃんごとの絞り込み
+from event_store import (CATEGORY_SLUGS, EVENT_COLUMNS, UNPARSED_ATTR, EventStore, events_to_frame, latest_events_from_frame,
+                         pair_sleep_sessions, select_events, split_sleep_sessions_by_day) #差分取得つきイベントストア
 
 # ページ設定
 st.set_page_config(
@@ -235,8 +250,7 @@ def get_api_key(env_key: str = "OPENAI_API_KEY") -> str | None:
     except Exception:
         return None
 
-API_KEY = get_api_key()
-if not API_KEY:
+def show_missing_api_key_error():
     st.error(
         "OpenAI APIキーが見つかりません。\n\n"
         "■ 推奨（ローカル学習向け）\n"
@@ -246,9 +260,25 @@ if not API_KEY:
         "  .streamlit/secrets.toml に OPENAI_API_KEY を記載（※リポジトリにコミットしない）\n"
         "  公式: st.secrets / secrets.toml の使い方はドキュメント参照"
     )
-    st.stop()
 
-client = OpenAI(api_key=API_KEY)
+# OpenAIクライアントはプロセスで1つだけ作り、再実行のたびに作り直さない。
+# openai パッケージの読み込みは重い（1秒近くかかる）ため、質問・分析ボタンが
+# 実際に使われたときに初めて import する（ダッシュボードの初回表示を待たせない）。
+# 429・5xxなどの自動再試行の回数は BABY_OPENAI_MAX_RETRIES（digest_worker.py は0にして自分で再試行する）。
+OPENAI_MAX_RETRIES = int(os.getenv("BABY_OPENAI_MAX_RETRIES", "2"))
+
+@st.cache_resource
+def get_openai_client(api_key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
+
+def get_openai_client_or_none():
+    """APIキーがあればOpenAIクライアントを返す。無ければ設定方法を表示してNoneを返す"""
+    api_key = get_api_key()
+    if not api_key:
+        show_missing_api_key_error()
+        return None
+    return get_openai_client(api_key)
 
 #---------------------------------------------------------
 #ChatGPTによる回答生成
@@ -273,29 +303,238 @@ FORMAT_HINT = """\
 ## 次の一歩
 - 1~3個の具体的行動
 """
+GPT_MODEL = "gpt-4o-mini"
+GPT_TEMPERATURE = 0.3
+
+# メッセージの並び（プロンプトキャッシュ向け）
+# OpenAIのプロンプトキャッシュは、前回と先頭から一致する部分（1024トークン以上、128トークン単位）の処理を省く。
+# 毎回同じ部分（SYSTEM_PROMPT・FORMAT_HINT、次に質問の種類ごとの分析指示）を先頭に置き、
+# 毎回変わる部分（ユーザー質問・KPI_JSON）は最後のuserメッセージだけに入れる。
+def build_chat_messages(user_query: str, system_prompt: str = SYSTEM_PROMPT, format_hint: str = FORMAT_HINT,
+                        instruction: str | None = None) -> list[dict]:
+    """
+    GPTに送るメッセージ。変わらない部分から順に並べる。
+        system: system_prompt + format_hint（全呼び出しで同じ）
+        system: instruction（質問の種類ごとに同じ。build_gpt_instruction）
+        user  : user_query（ユーザー質問・KPI_JSON。build_gpt_prompt）
+    """
+    messages = [{"role": "system", "content": f"{system_prompt}\n{format_hint}"}]
+    if instruction:
+        messages.append({"role": "system", "content": instruction})
+    messages.append({"role": "user", "content": user_query})
+    return messages
+
+def _usage_metrics(usage) -> dict | None:
+    """OpenAIの応答の usage から、入力・うちキャッシュ済み・出力のトークン数を取り出す"""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+def _error_details(e: Exception) -> dict:
+    """OpenAIの例外から、HTTPステータスと Retry-After（秒）を取り出す（バッチの再試行の判断に使う）"""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    retry_after = None
+    try:
+        if headers.get("retry-after-ms"):
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            retry_after = float(headers["retry-after"])
+    except ValueError:
+        pass
+    return {"error_status": getattr(e, "status_code", None), "retry_after": retry_after}
+
 def get_chat_response(
     user_query: str,
     system_prompt: str = SYSTEM_PROMPT,
     format_hint: str = FORMAT_HINT,
-    model: str = "gpt-4o-mini",
-    temperature: float = 0.3,
+    model: str = GPT_MODEL,
+    temperature: float = GPT_TEMPERATURE,
     max_tokens: int | None = None,
+    instruction: str | None = None,
+    metrics: dict | None = None,
 ) -> str:
-    if not client.api_key:
+    """metrics を渡すと usage（トークン数）/ total_sec / completed（失敗時は error / error_status / retry_after）を書き込む"""
+    client = get_openai_client_or_none()
+    if client is None:
         return "APIキーが設定されていません。"
+    metrics = metrics if metrics is not None else {}
+    started = time.perf_counter()
     try:
         response = client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"{user_query}\n\n{format_hint}"},
-            ],
+            messages=build_chat_messages(user_query, system_prompt, format_hint, instruction),
             temperature=temperature,
             max_tokens=max_tokens,
         )
+        metrics["usage"] = _usage_metrics(getattr(response, "usage", None))
+        metrics["completed"] = True
         return response.choices[0].message.content
     except Exception as e:
+        metrics.update(error=str(e), **_error_details(e))
         return f"エラーが発生しました: {e}"  #環境変数の初期化　ターミナルで実行→set OPENAI_API_KEY=
+    finally:
+        metrics["total_sec"] = round(time.perf_counter() - started, 3)
+
+#---------------------------------------------------------
+# ChatGPTによる回答生成（ストリーミング）
+#---------------------------------------------------------
+# 回答全体を待つと生成中（5〜15秒）ずっと画面が止まるため、stream=True で受け取り
+# 届いたトークンから順に「AIによる育児アドバイス」欄へ表示する（st.write_stream に渡す）。
+# 体感の待ち時間は最初のトークンが届くまでの時間（TTFT）になる。
+GPT_STREAMING = os.getenv("BABY_GPT_STREAM", "1") == "1"
+
+logger = logging.getLogger("baby_dashboard")
+
+def stream_chat_response(
+    user_query: str,
+    system_prompt: str = SYSTEM_PROMPT,
+    format_hint: str = FORMAT_HINT,
+    model: str = GPT_MODEL,
+    temperature: float = GPT_TEMPERATURE,
+    max_tokens: int | None = None,
+    metrics: dict | None = None,
+    instruction: str | None = None,
+):
+    """
+    目的:
+        get_chat_response のストリーミング版。回答の断片（文字列）を届いた順に yield する。
+    引数:
+        metrics: 渡すと ttft_sec（最初のトークンまでの秒数）/ total_sec / chunks / usage（トークン数）を書き込む
+        instruction: 質問の種類ごとの分析指示（build_chat_messages を参照）
+    実装メモ:
+        - 新しい質問でスクリプトが再実行されると、呼び出し側が generator.close() する。
+          finally で HTTP のストリームを閉じ、生成途中の回答を打ち切る（キャンセル）。
+    """
+    client = get_openai_client_or_none()
+    if client is None:
+        yield "APIキーが設定されていません。"
+        return
+    metrics = metrics if metrics is not None else {}
+    started = time.perf_counter()
+    stream = None
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=build_chat_messages(user_query, system_prompt, format_hint, instruction),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},  # 最後のチャンク（choicesが空）で usage を受け取る
+        )
+        chunks = 0
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                metrics["usage"] = _usage_metrics(chunk.usage)
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if chunks == 0:
+                metrics["ttft_sec"] = round(time.perf_counter() - started, 3)
+                logger.info("GPT time-to-first-token: %.3fs (model=%s)", metrics["ttft_sec"], model)
+            chunks += 1
+            yield text
+        metrics["chunks"] = chunks
+        metrics["completed"] = True
+    except Exception as e:
+        metrics.update(error=str(e), **_error_details(e))
+        yield f"エラーが発生しました: {e}"
+    finally:
+        metrics["total_sec"] = round(time.perf_counter() - started, 3)
+        if stream is not None:
+            stream.close()
+
+#---------------------------------------------------------
+# GPT回答キャッシュ（response_cache.py / SQLite・LRU）
+#---------------------------------------------------------
+# (モデル, temperature, SYSTEM_PROMPT, FORMAT_HINT, 質問ごとの指示, 質問, sha256(KPI_JSON)) が同じなら
+# OpenAIを呼ばずに保存済みの回答を返す。BABY_GPT_CACHE=0 で無効化。
+# KPI_JSONの経過分（elapsed の *_minutes）は ELAPSED_STEP_MINUTES 刻みに切り下げて送るため、
+# 同じ刻みの間は同じキーになり、刻みが変われば（送る内容が変わるので）別のキーになる。
+GPT_CACHE_ENABLED = os.getenv("BABY_GPT_CACHE", "1") == "1"
+GPT_CACHE_PATH = os.getenv("BABY_GPT_CACHE_PATH", "gpt_response_cache.db")
+GPT_CACHE_MAX_ENTRIES = int(os.getenv("BABY_GPT_CACHE_MAX_ENTRIES", "256"))
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache | None:
+    if not GPT_CACHE_ENABLED:
+        return None
+    try:
+        return ResponseCache(GPT_CACHE_PATH, max_entries=GPT_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        st.error(f"回答キャッシュを開けませんでした（キャッシュなしで続行します）: {e}")
+        return None
+
+def _is_failed_response(text: str) -> bool:
+    """get_chat_response がエラー時に返す文言か（エラーはキャッシュしない）"""
+    return text.startswith(("エラーが発生しました", "APIキーが設定されていません"))
+
+def gpt_cache_key(user_question: str, kpi_json: str = "", tenant: Tenant = SINGLE_TENANT) -> str:
+    return make_cache_key(GPT_MODEL, GPT_TEMPERATURE, SYSTEM_PROMPT, FORMAT_HINT, user_question, kpi_json,
+                          scope=tenant.label() if tenant.is_scoped else "",
+                          instruction=build_gpt_instruction(user_question, bool(kpi_json)))
+
+#---------------------------------------------------------
+# GPT呼び出しの使用量・応答時間の記録（gpt_metrics.py / JSON Lines）
+#---------------------------------------------------------
+# 回答ごとに usage（入力・うちプロンプトキャッシュ済み・出力トークン）と応答時間を分析の種類つきで追記する。
+# 集計は python gpt_metrics.py で表示できる。BABY_GPT_METRICS_LOG を空にすると記録しない。
+GPT_METRICS_LOG_PATH = os.getenv("BABY_GPT_METRICS_LOG", "gpt_metrics.jsonl")
+
+@st.cache_resource
+def get_gpt_metrics_log() -> GptMetricsLog | None:
+    if not GPT_METRICS_LOG_PATH:
+        return None
+    try:
+        return GptMetricsLog(GPT_METRICS_LOG_PATH)
+    except Exception as e:
+        logger.warning("GPT metrics log is disabled: %s", e)
+        return None
+
+def record_gpt_metrics(user_question: str, metrics: dict, include_kpi: bool = True):
+    """回答1件分の metrics を記録する（自由質問は "free"、分析ボタンは質問の種類ごと）。記録の失敗で回答は止めない"""
+    metrics_log = get_gpt_metrics_log()
+    if metrics_log is None:
+        return
+    try:
+        metrics_log.record(analysis_type(user_question) if include_kpi else "free", GPT_MODEL, metrics)
+    except Exception as e:
+        logger.warning("Failed to record GPT metrics: %s", e)
+
+#---------------------------------------------------------
+# 夜間に作成した分析（digest_store.py / digest_worker.py）
+#---------------------------------------------------------
+# digest_worker.py が赤ちゃんごとに「ダッシュボード分析」の回答を作っておき、ボタンが押されたらOpenAIを呼ばずにそれを表示する。
+# BABY_DIGEST_MAX_AGE_HOURS より古いものは使わない。BABY_DIGEST_PATH を空にすると使わない。
+DIGEST_PATH = os.getenv("BABY_DIGEST_PATH", "gpt_digests.db")
+DIGEST_MAX_AGE_HOURS = float(os.getenv("BABY_DIGEST_MAX_AGE_HOURS", "24"))
+
+@st.cache_resource
+def get_digest_store() -> DigestStore | None:
+    if not DIGEST_PATH:
+        return None
+    try:
+        return DigestStore(DIGEST_PATH)
+    except Exception as e:
+        logger.warning("AI digests are disabled: %s", e)
+        return None
+
+def load_digest(tenant: Tenant, question: str) -> dict | None:
+    """tenant・質問の種類の夜間の分析（なければ・古ければNone）。読み込みの失敗で回答は止めない"""
+    store = get_digest_store()
+    if store is None or tenant.digest_scope is None or analysis_type(question) == "free":
+        return None
+    try:
+        return store.get(tenant.digest_scope, analysis_type(question), max_age_seconds=DIGEST_MAX_AGE_HOURS * 3600)
+    except Exception as e:
+        logger.warning("Failed to load AI digest: %s", e)
+        return None
 
 #---------------------------------------------------------
 # Supabase APIキー関連
@@ -307,16 +546,80 @@ def get_supabase_info():
     return url, key
 
 # Supabaseの情報を取得し、存在しない場合はエラーを表示して停止
+# SUPABASE_URL="sqlite:///local_baby.db" の場合はオフライン用のローカル代替（local_backend.py）を使う
 supabase_url, supabase_key = get_supabase_info()
-if not supabase_url or not supabase_key:
+use_local_backend = bool(supabase_url) and supabase_url.startswith("sqlite:///")
+if not supabase_url or (not supabase_key and not use_local_backend):
     st.error(
         "SupabaseのURLとキーが見つかりません。"
         "\n\n.envファイルに SUPABASE_URL=\"...\" と SUPABASE_KEY=\"...\" を記載してください。"
     )
     st.stop()
 
-#supabaseクライアントの初期化
-supabase_client = create_client(supabase_url, supabase_key)
+#supabaseクライアントの初期化（プロセスで1つだけ作り、再実行のたびに作り直さない）
+@st.cache_resource
+def get_supabase_client(url: str, key: str | None):
+    if url.startswith("sqlite:///"):
+        from local_backend import create_local_client
+        return create_local_client(url)
+    from supabase import create_client
+    return create_client(url, key)
+
+supabase_client = get_supabase_client(supabase_url, supabase_key)
+
+#---------------------------------------------------------
+# テナント（表示する家庭・赤ちゃん）
+#---------------------------------------------------------
+# URLのクエリパラメータ ?baby_id=...&household_id=...（無ければ環境変数 BABY_ID / BABY_HOUSEHOLD_ID）で指定する。
+# 指定がなければ従来どおり baby_events 全体を1人分として扱う。
+# 複数の家庭で共有する構成では BABY_REQUIRE_TENANT=1 にして、家庭ごとに発行した署名付きトークン（?token=...。
+# tenant_token.py で発行）のあるアクセスだけを受け付ける（誰でも書き換えられる ?baby_id= は使わない）。
+# トークンで開いた場合は、そのトークン（JWT）で Supabase に問い合わせ、RLSでその家庭の行だけを読む。
+# トークンはテナント（キャッシュのキー）に含めず、テナントごとに最後に確認できたものを tenant_access_tokens に覚えて使う
+# （同じ赤ちゃんを別のリンクから開いても、イベントストア・購読・キャッシュは1つを共有する）。
+REQUIRE_TENANT = os.getenv("BABY_REQUIRE_TENANT", "0") == "1"
+TENANT_TOKEN_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+# 1プロセスで保持するテナント（赤ちゃん）ごとのイベントストア・購読・クライアントの上限（古いものから破棄）
+TENANT_CACHE_MAX_ENTRIES = int(os.getenv("BABY_TENANT_CACHE_SIZE", "64"))
+
+def current_tenant() -> Tenant:
+    token = st.query_params.get("token")
+    if token:
+        try:
+            tenant = tenant_from_token(token, TENANT_TOKEN_SECRET)
+        except TenantTokenError as e:
+            st.error(f"URLのトークンを確認できませんでした（{e}）。家庭ごとのリンクを開き直してください。")
+            st.stop()
+        tenant_access_tokens()[tenant] = token
+    elif REQUIRE_TENANT:
+        st.error("表示する赤ちゃんが指定されていません。家庭ごとのリンク（URLに ?token=... の付いたもの）から開いてください。")
+        st.stop()
+    else:
+        tenant = tenant_from_params(st.query_params, os.environ)
+    if REQUIRE_TENANT and tenant.baby_id is None:
+        st.error("表示する赤ちゃんが指定されていません。赤ちゃんごとのリンクから開いてください。")
+        st.stop()
+    return tenant
+
+@st.cache_resource
+def tenant_access_tokens() -> dict[Tenant, str]:
+    """テナント → 最後に確認できた署名付きトークン（プロセス内で共有する）"""
+    return {}
+
+@st.cache_resource(show_spinner=False, max_entries=TENANT_CACHE_MAX_ENTRIES)
+def get_tenant_client(url: str, key: str, access_token: str):
+    """署名付きトークン（JWT）を Authorization に付けたクライアント（問い合わせにRLSが効く）"""
+    from supabase import ClientOptions, create_client
+    return create_client(url, key, options=ClientOptions(headers={"Authorization": f"Bearer {access_token}"},
+                                                         auto_refresh_token=False, persist_session=False))
+
+def client_for(tenant: Tenant):
+    """tenant の問い合わせに使うクライアント（トークンで開いた場合はそのJWTのもの、それ以外は共有のクライアント）"""
+    access_token = tenant_access_tokens().get(tenant)
+    if access_token is None or use_local_backend:
+        return supabase_client
+    return get_tenant_client(supabase_url, supabase_key, access_token)
 
 # ---------------------------------------------------------
 # タイムゾーン定義
@@ -333,6 +636,10 @@ def safe_to_jst(datetime_str: str) -> datetime:
     Returns:
         datetime: JSTタイムゾーン付きのdatetimeオブジェクト
     """
+    # スナップショット由来の値は既にJSTのdatetime（pd.Timestamp）なのでそのまま返す
+    if isinstance(datetime_str, datetime) and datetime_str.tzinfo is not None:
+        return datetime_str
+
     # Zが付いている場合は削除（Supabaseから取得した文字列が完全なJSTでない場合もあるため）
     if isinstance(datetime_str, str) and datetime_str.endswith('Z'):
         datetime_str = datetime_str[:-1]
@@ -352,35 +659,649 @@ def safe_to_jst(datetime_str: str) -> datetime:
         
     return JST.localize(dt)
 
+# ---------------------------------------------------------
+# キャッシュ層（Supabaseからの取得結果をTTL付きで再利用）
+# ---------------------------------------------------------
+# 以前は「デモのリアルタイム性」のためにキャッシュを無効化していたが、
+# サイドバーへの入力など、ウィジェット操作のたびに全件を再取得していた。
+# 取得関数ごとにTTLを設定し、キャッシュキーには table_name・テナント（家庭・赤ちゃん）・JSTの日付・鮮度トークンを含める。
+# 鮮度トークン（最新イベントのid/datetimeと、修正・削除の回数）は軽い確認クエリで数秒ごとに取り直すため、
+# 新しいイベントが記録されたり既存の記録が修正・削除されたりすると、数秒以内にキャッシュキーが変わり、自動的に再取得される。
+# 修正・削除の回数は baby_events のトリガーが数える（supabase/migrations/20261016121000_baby_event_changes.sql）。
+# 回数の表がない環境では従来どおり id/datetime だけのトークンになる（修正・削除はTTLで反映）。
+CACHE_TTL_SECONDS = {
+    "freshness_probe": 5,    # 最新イベントの確認（1行だけ取得する軽いクエリ）
+    "event_snapshot": 300,   # カード用スナップショット（鮮度トークンが変われば即座に別キー）
+    "daily_totals": 300,     # サーバー側の日次集計（RPC）
+    "daily_rollup": 300,     # 日次ロールアップ表（baby_daily_rollup）
+}
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["freshness_probe"], show_spinner=False)
+def _probe_event_freshness(table_name: str, tenant: Tenant, jst_date: str) -> str:
+    """
+    最新イベントのid（最大値）とdatetimeを1行だけ取得し、鮮度トークン文字列にする。
+    id列がないテーブルではdatetimeの最新値だけで判定する。
+    """
+    try:
+        response = tenant.apply(client_for(tenant).table(table_name).select("id, datetime")).order("id", desc=True).limit(1).execute()
+    except Exception:
+        response = tenant.apply(client_for(tenant).table(table_name).select("datetime")).order("datetime", desc=True).limit(1).execute()
+    if not response.data:
+        return "empty"
+    return _freshness_token(response.data[0])
+
+CHANGES_TABLE = "baby_event_changes"
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["freshness_probe"], show_spinner=False)
+def _fetch_change_count(tenant: Tenant, jst_date: str) -> int:
+    """baby_events の修正・削除の回数（テナントの scope の1行だけ読む）。失敗時は例外を送出し、キャッシュされない。"""
+    response = client_for(tenant).table(CHANGES_TABLE).select("changes").eq("scope", tenant.change_scope).limit(1).execute()
+    return int(response.data[0]["changes"]) if response.data else 0
+
+def _freshness_token(newest: dict, changes: int | None = None) -> str:
+    """最新イベントの行（と修正・削除の回数）から鮮度トークン文字列を作る"""
+    token = f"{newest.get('id', '')}|{newest.get('datetime', '')}"
+    return token if changes is None else f"{token}|{changes}"
+
+def freshness_changes(freshness: str | None) -> int | None:
+    """鮮度トークンに含まれる修正・削除の回数（回数の表がない環境のトークンならNone）"""
+    parts = (freshness or "").split("|")
+    return int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+
+def get_event_freshness(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> str | None:
+    """
+    鮮度トークン（"最新id|最新datetime|修正・削除の回数"）を返す。確認クエリが失敗した場合はNone（キャッシュはTTLだけで更新される）。
+    分類ごとの最新イベント（RPC baby_latest_events）が使える場合は、その結果に含まれる最新idと回数から作る
+    （経過時間カードと同じ1回の呼び出しで済む）。
+    """
+    latest = load_latest_events(table_name, tenant)
+    if latest is not None:
+        newest = latest.get('any')
+        return _freshness_token(newest, newest.get('changes')) if newest else "empty"
+    try:
+        token = _probe_event_freshness(table_name, tenant, datetime.now(JST).date().isoformat())
+    except Exception:
+        return None
+    if token == "empty" or table_name != "baby_events" or not rpc_available(CHANGES_TABLE):
+        return token
+    try:
+        return f"{token}|{_fetch_change_count(tenant, datetime.now(JST).date().isoformat())}"
+    except Exception as e:
+        mark_rpc_failed(CHANGES_TABLE, e)
+        return token
+
+# 鮮度トークンを「呼び出し側で確認済みではない」ことを表す既定値（確認に失敗したNoneと区別する）
+LOOKUP_FRESHNESS = object()
+
+def _resolve_freshness(table_name: str, tenant: Tenant, freshness) -> str | None:
+    """確認済みの鮮度トークンがあればそれを、なければ get_event_freshness で確認して返す"""
+    return get_event_freshness(table_name, tenant) if freshness is LOOKUP_FRESHNESS else freshness
+
+# ---------------------------------------------------------
+# RPC・ロールアップ表の失敗の扱い（セッションごと）
+# ---------------------------------------------------------
+# 関数・表が未作成（マイグレーション未適用）の場合だけ、このセッション中は呼ばずにフォールバックする。
+# タイムアウト・接続エラーなどの一時的な失敗では RPC_RETRY_SECONDS のあいだだけ呼ばず、そのあと再び試す。
+RPC_RETRY_SECONDS = 60
+# PostgRESTの「関数がない（PGRST202）」「表がない（PGRST205）」と、Postgresの undefined_function / undefined_table
+MISSING_OBJECT_CODES = ("PGRST202", "PGRST205", "42883", "42P01")
+
+def _is_missing_object(error: BaseException) -> bool:
+    code = str(getattr(error, 'code', None) or "")
+    text = str(error)
+    return code in MISSING_OBJECT_CODES or any(c in text for c in MISSING_OBJECT_CODES) or "does not exist" in text
+
+def rpc_available(name: str) -> bool:
+    """name（RPC・表）をこのセッションで呼んでよいか"""
+    if name in st.session_state.get('_rpc_unavailable', set()):
+        return False
+    retry_at = st.session_state.get('_rpc_retry_at', {}).get(name)
+    return retry_at is None or time.monotonic() >= retry_at
+
+def mark_rpc_failed(name: str, error: BaseException):
+    """name の失敗を記録する。未作成ならこのセッション中は使わず、それ以外は RPC_RETRY_SECONDS 後に再び試す"""
+    if _is_missing_object(error):
+        st.session_state.setdefault('_rpc_unavailable', set()).add(name)
+        logger.warning("%s is not available, falling back for this session: %s", name, error)
+    else:
+        st.session_state.setdefault('_rpc_retry_at', {})[name] = time.monotonic() + RPC_RETRY_SECONDS
+        logger.warning("%s failed, retrying in %ds: %s", name, RPC_RETRY_SECONDS, error)
+
+# ---------------------------------------------------------
+# 分類ごとの最新イベント（Postgres RPC: baby_latest_events）
+# ---------------------------------------------------------
+# おむつ替え・授乳の経過時間と「今何してる」は、分類（おむつ・授乳・睡眠）ごとの最新イベント1件だけで決まる。
+# 3カード分と最新idを1回のRPCで受け取り（索引の先頭を読むだけ）、鮮度トークンの確認も兼ねる。
+# RPCは baby_events だけを読む。RPCが未作成・エラーの場合はNoneを返し、従来どおりスナップショットから求める。
+LATEST_EVENTS_RPC = "baby_latest_events"
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["freshness_probe"], show_spinner=False)
+def _fetch_latest_events(table_name: str, tenant: Tenant, jst_date: str) -> dict[str, dict]:
+    """load_latest_eventsの実処理（キャッシュ対象）。失敗時は例外を送出し、キャッシュされない。"""
+    params = {f'p_{column}': value for column, value in tenant.filters().items()}
+    response = client_for(tenant).rpc(LATEST_EVENTS_RPC, params).execute()
+    return {row['category']: row for row in response.data or []}
+
+def load_latest_events(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> dict[str, dict] | None:
+    """
+    分類ごとの最新イベントを取得する。
+
+    Returns:
+        dict[str, dict] | None: {'diaper' / 'feeding' / 'sleep': 最新イベントの行, 'any': id最大の行}。
+                                記録のない分類は含まない。RPCが使えない場合はNone。
+    """
+    if table_name != "baby_events" or not rpc_available(LATEST_EVENTS_RPC):
+        return None
+    try:
+        return _fetch_latest_events(table_name, tenant, datetime.now(JST).date().isoformat())
+    except Exception as e:
+        mark_rpc_failed(LATEST_EVENTS_RPC, e)
+        return None
+
+def get_latest_events(table_name="baby_events", tenant: Tenant = SINGLE_TENANT,
+                      snapshot: pd.DataFrame | None = None) -> dict[str, dict]:
+    """
+    経過時間カード用の分類ごとの最新イベント。RPCが使えればその結果、使えなければスナップショットから求める。
+    snapshotも省略した場合はSupabaseから取得する。
+    """
+    latest = load_latest_events(table_name, tenant)
+    if latest is not None:
+        return latest
+    if snapshot is None:
+        snapshot = load_event_snapshot(table_name, tenant=tenant)
+    return latest_events_from_snapshot(table_name, tenant, snapshot)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["event_snapshot"], show_spinner=False)
+def _fetch_latest_event(table_name: str, tenant: Tenant, category: str, freshness: str | None) -> dict | None:
+    """分類 category の最新イベント1件（期間を区切らずに読む）。記録がなければNone。失敗時は例外を送出し、キャッシュされない。"""
+    query = client_for(tenant).table(table_name).select(", ".join(EVENT_COLUMNS)).in_('type_slug', CATEGORY_SLUGS[category])
+    response = tenant.apply(query).order("datetime", desc=True).limit(1).execute()
+    return {"category": category, **response.data[0]} if response.data else None
+
+def latest_events_from_snapshot(table_name: str, tenant: Tenant, snapshot: pd.DataFrame,
+                                freshness: str | None = None) -> dict[str, dict]:
+    """
+    スナップショット（直近15日分）から分類ごとの最新イベントを求める。
+    期間内に記録のない分類は、それより前の記録がないかを1件だけ問い合わせて補う
+    （最後のおむつ替えが16日前でも、経過時間が0分にならないようにする）。
+    """
+    latest = latest_events_from_frame(snapshot)
+    for category in CATEGORY_SLUGS:
+        if category in latest:
+            continue
+        try:
+            event = _fetch_latest_event(table_name, tenant, category, freshness)
+        except Exception:
+            logger.warning("Failed to fetch the latest %s event", category, exc_info=True)
+            continue
+        if event is not None:
+            latest[category] = event
+    return latest
+
+def _minutes_since_event(event: dict | None) -> int:
+    """最新イベント（get_latest_eventsの1分類分）から現在時刻までの経過時間（分）を返す。記録なしは0。"""
+    if not event:
+        return 0
+    # JST同士で経過時間を計算
+    delta = datetime.now(JST) - safe_to_jst(event['datetime'])
+    return int(delta.total_seconds() / 60)
+
+# ---------------------------------------------------------
+# イベントスナップショット（1回の問い合わせで全カード分を取得）
+# ---------------------------------------------------------
+# 各カードのデータ取得関数はこのスナップショットから値を導出する。
+# main()の先頭で1回だけ取得し、全カード・KPI_JSONで使い回すことで
+# 1回の画面描画あたりのSupabaseへの往復を1回にする。
+SNAPSHOT_DAYS = 15  # 睡眠集計（15日分）をまかなえる期間
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["event_snapshot"], show_spinner=False)
+def _fetch_event_snapshot(table_name: str, tenant: Tenant, days: int, jst_date: str, freshness: str | None) -> pd.DataFrame:
+    """
+    load_event_snapshotの実処理（キャッシュ対象）。
+    jst_date・freshnessはキャッシュキーとしてだけ使う（日付が変わる/新しいイベントが入ると別キーになる）。
+    """
+    since = datetime.now() - timedelta(days=days)
+    query = tenant.apply(client_for(tenant).table(table_name).select(", ".join(EVENT_COLUMNS)))
+    response = query.gte('datetime', since.isoformat()).order("datetime", desc=False).execute()
+    return events_to_frame(response.data or [])
+
+def load_event_snapshot(table_name="baby_events", days: int = SNAPSHOT_DAYS, tenant: Tenant = SINGLE_TENANT) -> pd.DataFrame:
+    """
+    直近15日分（days）のbaby_events（全type_slug）を1回のクエリで取得する。
+    結果はキャッシュし、最新イベントが変わるまで（最長はTTLまで）再利用する。
+
+    Returns:
+        pd.DataFrame: datetime(JST), type_slug, type_jp, amount_ml 列を持つ古い順のDataFrame。
+                      取得失敗時は空のDataFrame。
+    """
+    try:
+        jst_date = datetime.now(JST).date().isoformat()
+        freshness = get_event_freshness(table_name, tenant)
+        snapshot = _fetch_event_snapshot(table_name, tenant, days, jst_date, freshness)
+    except Exception as e:
+        st.error(f"イベントデータの読み込み中にエラーが発生しました: {e}")
+        return events_to_frame([])
+    warn_unparsed_datetimes(snapshot.attrs.get(UNPARSED_ATTR, 0))
+    return snapshot
+
+def warn_unparsed_datetimes(count: int):
+    """時刻を解析できず現在時刻で代替したログがあれば警告を表示する（解析は event_store.events_to_frame）"""
+    if count:
+        st.warning(f"時刻解析エラー: {count}件のログを解析できませんでした。現在時刻を代替として使用します。")
+
+def _snapshot_rows(snapshot: pd.DataFrame, type_slugs: list[str], since: datetime | None = None) -> pd.DataFrame:
+    """スナップショットから指定したtype_slugの行（sinceがあればその時刻以降）だけを古い順で取り出す"""
+    if snapshot.empty:
+        return snapshot
+    return select_events(snapshot, start=since, type_slugs=type_slugs)
+
+def _summarize_last_14_days(daily: pd.DataFrame, value_col: str, fill_value=0.0):
+    """
+    日ごとの累計値（date, value_col）から、グラフ表示用の直近14日分のDataFrameと前週平均を作る。
+    dailyにはデータのある日だけが含まれている前提（前週平均はデータのある日だけで平均する）。
+
+    Returns:
+        tuple[pd.DataFrame, float]: （date を「月/日」文字列にした14行のDataFrame, 前週平均）
+    """
+    # グラフ表示期間（直近14日間）を定義
+    today = datetime.now().date()
+    dates_14 = [today - timedelta(days=i) for i in range(13, -1, -1)]
+
+    # グラフ表示用DataFrameに結合し、データがない日は0とする
+    df_display = pd.DataFrame({'date': dates_14})
+    df_display = pd.merge(df_display, daily, on='date', how='left').fillna(fill_value)
+
+    # 前週平均値の計算
+    start_of_current_period = today - timedelta(days=6) # 直近7日間の開始日
+    start_of_last_period = start_of_current_period - timedelta(days=7) # 前週7日間の開始日
+
+    # 前7日間 (前週扱い) のデータのみを抽出
+    df_last_period = daily[(daily['date'] < start_of_current_period) & (daily['date'] >= start_of_last_period)]
+
+    # 前週の平均値（日ごとの累計値の平均）
+    last_week_average = df_last_period[value_col].mean() if not df_last_period.empty else fill_value
+
+    # 日付を「月/日」形式の文字列に変換 (PlotlyのX軸表示を確実にするため)
+    df_display['date'] = df_display['date'].apply(lambda x: x.strftime('%m/%d'))
+
+    return df_display, last_week_average
+
+# ---------------------------------------------------------
+# サーバー側の日次集計（Postgres RPC: baby_daily_totals）
+# ---------------------------------------------------------
+# BABY_SERVER_AGGREGATION=1 のとき、14日分の棒グラフ用の日次合計を
+# supabase/migrations の baby_daily_totals 関数で集計して受け取る（最大14行。RPCは baby_events だけを読む）。
+# RPCが未作成・エラーの場合はNoneを返し、従来どおりスナップショットをpandasで集計する。
+SERVER_AGGREGATION = os.getenv("BABY_SERVER_AGGREGATION", "0") == "1"
+SNAPSHOT_DAYS_WITH_SERVER_AGGREGATION = 2  # 日次集計をサーバーに任せる場合、カード用の直近ログだけ取得する
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["daily_totals"], show_spinner=False)
+def _fetch_daily_totals(table_name: str, tenant: Tenant, today: str, days: int, jst_date: str, freshness: str | None) -> pd.DataFrame:
+    """fetch_daily_totalsの実処理（キャッシュ対象）。失敗時は例外を送出し、キャッシュされない。"""
+    params = {
+        'p_today': today,
+        'p_days': days,
+    }
+    # テナント指定がある場合だけ渡す（テナント列を追加する前のRPCとも互換にするため）
+    params.update({f'p_{column}': value for column, value in tenant.filters().items()})
+    response = client_for(tenant).rpc('baby_daily_totals', params).execute()
+    daily = pd.DataFrame(response.data or [], columns=['day', 'milk_ml', 'sleep_hours'])
+    daily['date'] = pd.to_datetime(daily['day']).dt.date
+    daily['milk_ml'] = pd.to_numeric(daily['milk_ml'], errors='coerce')
+    daily['sleep_hours'] = pd.to_numeric(daily['sleep_hours'], errors='coerce')
+    return daily[['date', 'milk_ml', 'sleep_hours']]
+
+def fetch_daily_totals(table_name="baby_events", days: int = 14, tenant: Tenant = SINGLE_TENANT,
+                       freshness: str | None = LOOKUP_FRESHNESS) -> pd.DataFrame | None:
+    """
+    日ごとのミルク量合計[ml]と睡眠時間合計[h]をRPCで取得する。
+    freshness（鮮度トークン）を省略した場合は get_event_freshness で確認する。
+
+    Returns:
+        pd.DataFrame | None: date, milk_ml, sleep_hours 列（データのない指標はNaN）。
+                             RPCが使えない場合はNone（呼び出し側はpandas集計にフォールバック）。
+    """
+    # 失敗したRPCはしばらく（未作成ならこのセッション中）呼ばない（毎回のrerunで失敗を待たないため）
+    if table_name != "baby_events" or not rpc_available('baby_daily_totals'):
+        return None
+    try:
+        return _fetch_daily_totals(table_name, tenant, datetime.now().date().isoformat(), days,
+                                   datetime.now(JST).date().isoformat(), _resolve_freshness(table_name, tenant, freshness))
+    except Exception as e:
+        mark_rpc_failed('baby_daily_totals', e)
+        return None
+
+# ---------------------------------------------------------
+# 日次ロールアップ表（baby_daily_rollup）
+# ---------------------------------------------------------
+# BABY_DAILY_ROLLUP=1 のとき、14日分の棒グラフ・KPI用の日次合計を、書き込みのたびに
+# トリガーで更新されるロールアップ表から読む（主キーの範囲読みで最大14行）。
+# 1日に記録するイベント数が増えても、画面表示のコストは変わらない。
+# 表が未作成・エラーの場合はNoneを返し、RPC集計またはスナップショットの集計にフォールバックする。
+DAILY_ROLLUP = os.getenv("BABY_DAILY_ROLLUP", "0") == "1"
+ROLLUP_TABLE = "baby_daily_rollup"
+ROLLUP_COLUMNS = ['date', 'milk_ml', 'sleep_hours', 'breast_count', 'pee_count', 'poop_count']
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS["daily_rollup"], show_spinner=False)
+def _fetch_daily_rollup(tenant: Tenant, today: str, days: int, jst_date: str, freshness: str | None) -> pd.DataFrame:
+    """fetch_daily_rollupの実処理（キャッシュ対象）。失敗時は例外を送出し、キャッシュされない。"""
+    first_day = (datetime.fromisoformat(today) - timedelta(days=days - 1)).date().isoformat()
+    response = (
+        client_for(tenant).table(ROLLUP_TABLE)
+        .select("day, milk_ml, sleep_hours, breast_count, pee_count, poop_count")
+        .eq('baby_id', tenant.rollup_key)
+        .gte('day', first_day).lte('day', today)
+        .order('day', desc=False)
+        .execute()
+    )
+    daily = pd.DataFrame(response.data or [], columns=['day'] + ROLLUP_COLUMNS[1:])
+    daily['date'] = pd.to_datetime(daily['day']).dt.date
+    for col in ROLLUP_COLUMNS[1:]:
+        daily[col] = pd.to_numeric(daily[col], errors='coerce')
+    return daily[ROLLUP_COLUMNS]
+
+def fetch_daily_rollup(table_name="baby_events", days: int = 14, tenant: Tenant = SINGLE_TENANT,
+                       freshness: str | None = LOOKUP_FRESHNESS) -> pd.DataFrame | None:
+    """
+    日ごとのミルク量合計[ml]・睡眠時間合計[h]・授乳（母乳）回数・おしっこ/うんち回数をロールアップ表から取得する。
+    freshness（鮮度トークン）を省略した場合は get_event_freshness で確認する。
+
+    Returns:
+        pd.DataFrame | None: date, milk_ml, sleep_hours, breast_count, pee_count, poop_count 列。
+                             ロールアップ表が使えない場合はNone。
+    """
+    # ロールアップ表は baby_events のトリガーで赤ちゃんごとに作られる（家庭だけの指定では使えない）
+    if table_name != "baby_events" or (tenant.household_id is not None and tenant.baby_id is None):
+        return None
+    if not rpc_available(ROLLUP_TABLE):
+        return None
+    try:
+        return _fetch_daily_rollup(tenant, datetime.now().date().isoformat(), days,
+                                   datetime.now(JST).date().isoformat(), _resolve_freshness(table_name, tenant, freshness))
+    except Exception as e:
+        mark_rpc_failed(ROLLUP_TABLE, e)
+        return None
+
+# ---------------------------------------------------------
+# 長期の推移（30日・90日・1年）
+# ---------------------------------------------------------
+# 期間が長いほど粗い単位（日・週・月）にまとめ、グラフの点を数十個に抑える。
+# 日次合計はロールアップ表（最大365行）か、なければRPC baby_daily_totals（最大365行）から受け取り、
+# 生のイベント（1年で数万行）は取得しない。どちらも使えない場合はNone。
+HISTORY_RANGES = {30: "day", 90: "week", 365: "month"}  # 表示日数: 集計単位
+HISTORY_BUCKET_LABELS = {"day": "日", "week": "週", "month": "月"}
+
+def fetch_history_daily_totals(table_name="baby_events", days: int = 90, tenant: Tenant = SINGLE_TENANT) -> pd.DataFrame | None:
+    """
+    長期表示用の日次合計（date, milk_ml, sleep_hours を含む、記録のある日だけ）を取得する。
+    BABY_SERVER_AGGREGATION の設定に関わらずRPCとロールアップ表を試す（BABY_DAILY_ROLLUP=1 ならロールアップ表が先。
+    それ以外では、バックフィル前で空かもしれないロールアップ表より、生イベントを集計するRPCを先に使う）。
+    """
+    sources = [fetch_daily_rollup, fetch_daily_totals] if DAILY_ROLLUP else [fetch_daily_totals, fetch_daily_rollup]
+    for fetch in sources:
+        daily = fetch(table_name, days=days, tenant=tenant)
+        if daily is not None:
+            return daily
+    return None
+
+def bucket_daily_totals(daily: pd.DataFrame, bucket: str) -> pd.DataFrame:
+    """
+    日次合計を日・週（月曜始まり）・月ごとにまとめる。
+
+    Args:
+        daily: date, milk_ml, sleep_hours 列を持つ日次合計（記録のある日だけ）
+        bucket: "day" / "week" / "month"
+    Returns:
+        pd.DataFrame: label（表示用）, start（期間の初日）, milk_ml, sleep_hours（1日あたりの平均）, days（記録のあった日数）列。
+                      平均は記録のあった日だけで計算する（記録を始める前の日や途中の期間で平均が下がらないように）。
+    """
+    columns = ['label', 'start', 'milk_ml', 'sleep_hours', 'days']
+    if daily is None or daily.empty:
+        return pd.DataFrame(columns=columns)
+    dates = pd.to_datetime(daily['date'])
+    if bucket == "week":
+        start = dates.dt.to_period('W-SUN').dt.start_time
+    elif bucket == "month":
+        start = dates.dt.to_period('M').dt.start_time
+    else:
+        start = dates.dt.normalize()
+    grouped = daily[['milk_ml', 'sleep_hours']].groupby(start.rename('start'), sort=True)
+    result = grouped.mean().join(grouped.size().rename('days')).reset_index()
+    label_format = {"day": '%m/%d', "week": '%m/%d〜', "month": '%Y/%m'}[bucket]
+    result['label'] = result['start'].dt.strftime(label_format)
+    result['start'] = result['start'].dt.date
+    return result[columns]
+
+def _stop_realtime_feed(feed):
+    if feed is not None:
+        feed.stop(timeout=0)
+
+# イベントストアの内容をディスク（Arrow IPC）にも保存し、再起動直後の表示とSupabaseに接続できないときの表示に使う
+EVENT_CACHE_ENABLED = os.getenv("BABY_EVENT_CACHE", "1") == "1"
+EVENT_CACHE_DIR = os.getenv("BABY_EVENT_CACHE_DIR", "event_cache")
+
+@st.cache_resource(show_spinner=False, max_entries=TENANT_CACHE_MAX_ENTRIES)
+def get_event_store(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> EventStore:
+    """
+    プロセス内で共有するイベントストア（テーブル・テナントごとに1つ）。
+    rerunやセッションをまたいで保持し、Supabaseからは差分だけを取得する。
+    BABY_EVENT_CACHE=1（既定）ならディスクのキャッシュから復元し、以降の差分もディスクに追記する。
+    """
+    cache = None
+    if EVENT_CACHE_ENABLED:
+        try:
+            from event_cache import EventCache
+            cache = EventCache(EVENT_CACHE_DIR, table_name, tenant)
+        except Exception as e:
+            st.warning(f"ローカルのイベントキャッシュを使えません（メモリ上のみで動作します）: {e}")
+    return EventStore(window_days=SNAPSHOT_DAYS, tenant=tenant, cache=cache)
+
+@st.cache_resource(show_spinner=False, max_entries=TENANT_CACHE_MAX_ENTRIES, on_release=_stop_realtime_feed)
+def get_realtime_feed(table_name="baby_events", tenant: Tenant = SINGLE_TENANT):
+    """
+    baby_events の変更をSupabase Realtimeで購読し、イベントストアに反映する購読スレッドを
+    テナントごとに1つだけ起動する。ローカル代替（SQLite）の場合は購読できないためNone。
+    """
+    if use_local_backend:
+        return None
+    from realtime_feed import RealtimeFeed, supabase_subscriber
+    subscriber = supabase_subscriber(supabase_url, supabase_key, table_name, tenant=tenant,
+                                     access_token=lambda: tenant_access_tokens().get(tenant))
+    return RealtimeFeed(get_event_store(table_name, tenant), subscriber).start()
+
+# ---------------------------------------------------------
+# 1画面分のデータ取得（問い合わせの並行実行）
+# ---------------------------------------------------------
+# カードのデータは 分類ごとの最新イベント（鮮度トークンを兼ねるRPC）・日次合計（ロールアップ表/RPC）・
+# イベントストアの差分取得 の3つの問い合わせから作る。BABY_CONCURRENT_FETCH=1（既定）のとき、
+# これらを描画ごとのスレッドプールで同時に発行し、画面の待ち時間を各往復の合計ではなく最も遅い経路に近づける
+# （日次合計と差分取得はキャッシュの判定に鮮度トークンを使うため、最新イベントの結果を受け取ってから発行する）。
+# 問い合わせごとに待ち時間の上限（BABY_QUERY_TIMEOUT_SECONDS）を設け、失敗・時間切れの問い合わせは
+# DashboardData.errors に記録して、その問い合わせにしか頼れないカードだけをエラー表示にする。
+# 時間切れになった問い合わせはスレッド上で最後まで実行され、結果は次の描画でキャッシュ・ストアから使われる。
+CONCURRENT_FETCH = os.getenv("BABY_CONCURRENT_FETCH", "1") == "1"
+QUERY_TIMEOUT_SECONDS = float(os.getenv("BABY_QUERY_TIMEOUT_SECONDS", "8"))
+
+class DashboardData(NamedTuple):
+    snapshot: pd.DataFrame              # 直近15日分（またはその一部）のイベント。古い順
+    daily_totals: pd.DataFrame | None   # 日次合計（ロールアップ表・RPC・イベントストアのいずれか）
+    latest: dict[str, dict]             # 分類ごとの最新イベント（カード1・4・6用）
+    version: str                        # 描画するデータの版（current_data_version と比べる）
+    errors: dict[str, str]              # 表示できなかったカード（'elapsed' / 'charts' / 'log'） → エラー内容
+
+def _fetch_versions(table_name: str, tenant: Tenant) -> tuple[str | None, dict[str, dict] | None]:
+    """鮮度トークンと分類ごとの最新イベント（RPCが使えなければNone）。最新イベントのRPCは1回だけ呼ぶ"""
+    freshness = get_event_freshness(table_name, tenant)
+    return freshness, load_latest_events(table_name, tenant)
+
+def _fetch_card_daily_totals(table_name: str, tenant: Tenant, freshness: str | None) -> pd.DataFrame | None:
+    """棒グラフ・KPI用の日次合計（ロールアップ表→RPCの順）。どちらも使わない/使えない場合はNone"""
+    daily_totals = fetch_daily_rollup(table_name, tenant=tenant, freshness=freshness) if DAILY_ROLLUP else None
+    if daily_totals is None and SERVER_AGGREGATION:
+        daily_totals = fetch_daily_totals(table_name, tenant=tenant, freshness=freshness)
+    return daily_totals
+
+def _fetch_card_events(table_name: str, tenant: Tenant, feed, short_snapshot: bool, freshness: str | None) -> pd.DataFrame:
+    """
+    カード用のイベント。失敗時は例外を送出する（画面への表示は呼び出し側で行う）。
+    short_snapshot のときは直近分だけを取得し、それ以外はイベントストアを差分更新してその内容を返す。
+    """
+    if short_snapshot:
+        snapshot = _fetch_event_snapshot(table_name, tenant, SNAPSHOT_DAYS_WITH_SERVER_AGGREGATION,
+                                         datetime.now(JST).date().isoformat(), freshness)
+        warn_unparsed_datetimes(snapshot.attrs.get(UNPARSED_ATTR, 0))
+        return snapshot
+    store = get_event_store(table_name, tenant)
+    if feed is not None and feed.connected and not feed.catch_up_pending:
+        # リアルタイム購読中はストアが常に最新なので、DBへは問い合わせず期間外の行を落とすだけ
+        store.evict_expired()
+    else:
+        # イベントストアに前回以降の差分だけを取り込み、影響を受けた日の合計だけ再計算する
+        # （購読開始直後は、購読前に書き込まれた分の取りこぼしをここで取り込む）
+        store.refresh(client_for(tenant), table_name, freshness=freshness, changes=freshness_changes(freshness))
+        if feed is not None and feed.connected:
+            feed.catch_up_pending = False
+    warn_unparsed_datetimes(store.unparsed)
+    return store.frame
+
+def _run_with_context(ctx, fn, *args):
+    # ワーカースレッドからも st.cache_data / st.session_state を使えるよう、描画中のスクリプトの文脈を引き継ぐ
+    add_script_run_ctx(threading.current_thread(), ctx)
+    return fn(*args)
+
+def _error_text(error: BaseException) -> str:
+    if isinstance(error, TimeoutError):
+        return f"{QUERY_TIMEOUT_SECONDS:g}秒以内に応答がありませんでした"
+    return str(error) or type(error).__name__
+
+def fetch_dashboard_data(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> DashboardData:
+    """
+    ダッシュボード1画面分のデータを取得する。例外は送出せず、失敗したカードを errors に記録する。
+    通常はイベントストアを差分更新し、その内容（直近15日分のイベントと日ごとの合計）を返す。
+    リアルタイム更新（BABY_REALTIME=1）で購読中は、ストアが購読で更新されるためDBへ問い合わせない。
+    日次合計をロールアップ表（BABY_DAILY_ROLLUP=1）またはRPC（BABY_SERVER_AGGREGATION=1）から受け取る場合で、
+    ローカルのイベントキャッシュも購読もないときは、スナップショットを直近分に絞る。
+    Supabaseに接続できない場合も、イベントストア（ディスクに保存済みの内容を含む）にある分を返す。
+    """
+    feed = get_realtime_feed(table_name, tenant) if REALTIME_UPDATES else None
+    store = get_event_store(table_name, tenant)
+    use_daily_totals = DAILY_ROLLUP or SERVER_AGGREGATION
+    short_snapshot = use_daily_totals and feed is None and not EVENT_CACHE_ENABLED
+    failures: dict[str, BaseException] = {}
+    versions = daily_totals = snapshot = None
+
+    if CONCURRENT_FETCH:
+        ctx = get_script_run_ctx()
+        executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="baby-fetch")
+        started = time.monotonic()
+        versions_future = executor.submit(_run_with_context, ctx, _fetch_versions, table_name, tenant)
+
+        def after_versions(fn, *args):
+            # 鮮度トークンを待ってから発行する。最新イベントが時間切れ・失敗ならトークンなし（None）で進める
+            try:
+                freshness = versions_future.result(timeout=QUERY_TIMEOUT_SECONDS)[0]
+            except Exception:
+                freshness = None
+            return fn(*args, freshness)
+
+        futures = {'latest': versions_future}
+        if use_daily_totals:
+            futures['daily_totals'] = executor.submit(_run_with_context, ctx, after_versions, _fetch_card_daily_totals, table_name, tenant)
+        futures['events'] = executor.submit(_run_with_context, ctx, after_versions, _fetch_card_events, table_name, tenant, feed, short_snapshot)
+        # 時間切れのスレッドの終了は待たない
+        executor.shutdown(wait=False)
+
+        results = {}
+        for source, future in futures.items():
+            # 鮮度トークンを待つ問い合わせは、その待ち時間の分だけ上限を延ばす（問い合わせごとの上限は同じ）
+            limit = QUERY_TIMEOUT_SECONDS * (1 if source == 'latest' else 2)
+            try:
+                results[source] = future.result(timeout=max(0.0, started + limit - time.monotonic()))
+            except Exception as e:
+                failures[source] = e
+        versions = results.get('latest')
+        daily_totals = results.get('daily_totals')
+        snapshot = results.get('events')
+    else:
+        # 順番に取得する（BABY_CONCURRENT_FETCH=0）
+        try:
+            versions = _fetch_versions(table_name, tenant)
+        except Exception as e:
+            failures['latest'] = e
+        freshness = versions[0] if versions is not None else None
+        if use_daily_totals:
+            try:
+                daily_totals = _fetch_card_daily_totals(table_name, tenant, freshness)
+            except Exception as e:
+                failures['daily_totals'] = e
+        try:
+            snapshot = _fetch_card_events(table_name, tenant, feed, short_snapshot, freshness)
+        except Exception as e:
+            failures['events'] = e
+
+    # 直近分だけを取得する設定でも、日次合計がなければイベントストアから集計する
+    if snapshot is not None and short_snapshot and daily_totals is None:
+        try:
+            snapshot = _fetch_card_events(table_name, tenant, feed, False, versions[0] if versions else None)
+        except Exception as e:
+            failures['events'] = e
+            snapshot = None
+
+    errors = {}
+    if snapshot is None:
+        # イベントを取得できなかった場合は、イベントストアにある分（前回の描画・ディスクのキャッシュ）で表示する
+        snapshot = store.frame
+        if store.synced_at is not None:
+            message = f"Supabaseから最新のイベントを取得できないため、保存済みのデータ（{store.synced_at} 時点）を表示しています: {_error_text(failures['events'])}"
+        else:
+            message = f"イベントデータの読み込み中にエラーが発生しました: {_error_text(failures['events'])}"
+        errors['log'] = message
+        if daily_totals is None:
+            errors['charts'] = message
+    if daily_totals is None:
+        daily_totals = store.daily_totals()
+
+    latest = versions[1] if versions is not None else None
+    if latest is None:
+        # 最新イベントのRPCが使えない・間に合わない場合はスナップショットから求める
+        # （イベントを取得できなかった場合は、期間より前の記録も問い合わせずに保存済みのデータだけで求める）
+        if 'log' in errors:
+            latest = latest_events_from_frame(snapshot)
+            errors['elapsed'] = errors['log']
+        else:
+            latest = latest_events_from_snapshot(table_name, tenant, snapshot, versions[0] if versions else None)
+    freshness = versions[0] if versions is not None else None
+    return DashboardData(snapshot, daily_totals, latest, data_version(table_name, tenant, freshness), errors)
+
+def load_dashboard_data(table_name="baby_events", tenant: Tenant = SINGLE_TENANT):
+    """
+    ダッシュボード1画面分のデータ（スナップショット, 日次合計）を取得する（fetch_dashboard_data の結果のうち2つ）。
+    取得できなかったデータがあれば警告を1つ表示する。
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame | None]: （スナップショット, 日次合計: ロールアップ表・RPC・イベントストアのいずれか）
+    """
+    data = fetch_dashboard_data(table_name, tenant)
+    if data.errors:
+        st.warning(next(iter(data.errors.values())))
+    return data.snapshot, data.daily_totals
+
 # ---------------------------------------------------------
 # supabaseからおむつ替え経過時間計算＜カード1＞
 # ---------------------------------------------------------
-#@st.cache_data(ttl=60) # 1分間キャッシュ デモのリアルタイム性を考慮して非有効化
-def get_diaper_elapsed_time(table_name="baby_events"):
+# ※キャッシュは取得層（_fetch_latest_events / _fetch_event_snapshot）で行う
+def get_diaper_elapsed_time(table_name="baby_events", tenant: Tenant = SINGLE_TENANT, snapshot: pd.DataFrame | None = None,
+                            latest: dict[str, dict] | None = None):
     """
-    Supabaseから最新の「おしっこ」または「うんち」のイベント時刻を取得し、
+    最新の「おしっこ」または「うんち」のイベント時刻を取得し、
     現在時刻からの経過時間（分）を計算する。
+    latest（get_latest_eventsの結果）を省略した場合は分類ごとの最新イベントを取得する。
     """
     try:
-        # type_slugが 'diaper_pee' (おしっこ) または 'diaper_poop' (うんち) の最新ログを1件取得
-        response = supabase_client.table(table_name).select("datetime, type_slug").in_('type_slug', ['diaper_pee', 'diaper_poop']).order("datetime", desc=True).limit(1).execute()
-        
-        if response.data:
-            latest_diaper_log = response.data[0]
-            
-            # データベースの時刻はJSTとして扱う
-            log_time_jst = safe_to_jst(latest_diaper_log['datetime'])
-                        
-            # 現在時刻をJSTで取得
-            current_time_jst = datetime.now(JST)
-            
-            # JST同士で経過時間を計算
-            delta = current_time_jst - log_time_jst
-            minutes_passed = int(delta.total_seconds() / 60)
-            
-            return minutes_passed
-        else:
-            return 0
+        if latest is None:
+            latest = get_latest_events(table_name, tenant, snapshot)
+        # type_slugが 'diaper_pee' (おしっこ) または 'diaper_poop' (うんち) の最新ログから計算
+        return _minutes_since_event(latest.get('diaper'))
     except Exception as e:
         st.error(f"おむつデータの読み込み中にエラーが発生しました: {e}")
         return 0
@@ -388,100 +1309,41 @@ def get_diaper_elapsed_time(table_name="baby_events"):
 # ---------------------------------------------------------
 # supabaseから睡眠時間の日ごとの累計値と前週平均の計算＜カード2＞
 # ---------------------------------------------------------
-#@st.cache_data(ttl=60) # 1分間キャッシュ　デモのリアルタイム性を考慮して非有効化
-def get_sleep_summary_data(table_name="baby_events"):
+# ※キャッシュは取得層（_fetch_event_snapshot / _fetch_daily_totals）で行う
+def get_sleep_summary_data(table_name="baby_events", tenant: Tenant = SINGLE_TENANT, snapshot: pd.DataFrame | None = None,
+                           daily_totals: pd.DataFrame | None = None):
     """
-    Supabaseから直近2週間分の睡眠イベントを取得し、
+    スナップショットから直近2週間分の睡眠イベントを取り出し、
     日ごとの睡眠時間累計（14日間）と前週の平均値を計算して返す。
+    snapshotを省略した場合はSupabaseから取得する。
+    daily_totals（fetch_daily_rollup / fetch_daily_totalsの結果）を渡した場合はその集計値を使う。
     """
     try:
-        fifteen_days_ago = datetime.now() - timedelta(days=15)
-        
-        response = supabase_client.table(table_name).select("datetime, type_slug").in_('type_slug', ['sleep_start', 'sleep_end']).gte('datetime', fifteen_days_ago.isoformat()).order("datetime", desc=False).execute()
-        
-        if not response.data:
+        # サーバー側で日次集計済みなら、その結果（最大14行）だけで表示データを作る
+        if daily_totals is not None:
+            sleep_summary = daily_totals[['date', 'sleep_hours']].dropna()
+            sleep_summary.columns = ['date', 'count']
+            return _summarize_last_14_days(sleep_summary, 'count', fill_value=0.0)
+
+        if snapshot is None:
+            snapshot = load_event_snapshot(table_name, tenant=tenant)
+
+        # スナップショットは古い順に並んでいるため、そのまま睡眠ログだけ取り出す
+        df = _snapshot_rows(snapshot, ['sleep_start', 'sleep_end']).reset_index(drop=True)
+
+        if df.empty:
             dates_14 = [datetime.now().date() - timedelta(days=i) for i in range(13, -1, -1)]
             df_display = pd.DataFrame({'date': dates_14, 'count': [0.0] * 14})
             return df_display, 0.0
 
-        df = pd.DataFrame(response.data)
-        
-        # データベースの時刻はJSTとして扱う
-        df['datetime'] = df['datetime'].apply(safe_to_jst)
-        df['date'] = df['datetime'].dt.date
-        
-        # 睡眠時間の計算処理は変更なし
-        sleep_durations = []
-        i = 0
-        while i < len(df) - 1:
-            start_row = df.iloc[i]
-            end_row = df.iloc[i+1]
-            
-            if start_row['type_slug'] == 'sleep_start' and end_row['type_slug'] == 'sleep_end':
-                duration_hours = (end_row['datetime'] - start_row['datetime']).total_seconds() / 3600
-                sleep_durations.append({
-                    'date': end_row['datetime'].date(), 
-                    'duration_hours': duration_hours
-                })
-                i += 2
-            else:
-                i += 1 
-        
-        # 2. 睡眠時間の計算 (sleep_start から sleep_end までのペアを見つける)
-        sleep_durations = []
-        i = 0
-        while i < len(df) - 1:
-            start_row = df.iloc[i]
-            end_row = df.iloc[i+1]
-            
-            # sleep_start から始まり、直後に sleep_end が続く場合のみ計算
-            if start_row['type_slug'] == 'sleep_start' and end_row['type_slug'] == 'sleep_end':
-                # 睡眠時間（時間単位）を計算
-                duration_hours = (end_row['datetime'] - start_row['datetime']).total_seconds() / 3600
-                
-                # 睡眠終了時の日付をキーとして保存
-                sleep_durations.append({
-                    'date': end_row['datetime'].date(), 
-                    'duration_hours': duration_hours
-                })
-                i += 2 # 次のペアへ
-            else:
-                # 'sleep_start' の次が 'sleep_start' (ログ抜け) または 'sleep_end' の次が 'sleep_start' ではない場合
-                # start_row が 'sleep_start' ではない場合、次の行に進む
-                # start_row が 'sleep_start' で end_row が 'sleep_start' の場合、start_rowをスキップして次の行に進む
-                i += 1 
-
-        df_durations = pd.DataFrame(sleep_durations)
-        
-        # 3. 日ごとの累計睡眠時間（時間）を計算
-        if df_durations.empty:
-            sleep_summary = pd.DataFrame()
-        else:
-            sleep_summary = df_durations.groupby('date')['duration_hours'].sum().reset_index()
-            sleep_summary.columns = ['date', 'count']
+        # 2. 睡眠時間の計算 (sleep_start から sleep_end までのペアをベクトル演算で見つける)
+        sessions = pair_sleep_sessions(df)
 
-        # 4. グラフ表示期間（直近14日間）を定義
-        today = datetime.now().date()
-        dates_14 = [today - timedelta(days=i) for i in range(13, -1, -1)]
-        
-        # 5. グラフ表示用DataFrameに結合し、データがない日は0とする
-        df_display = pd.DataFrame({'date': dates_14})
-        df_display = pd.merge(df_display, sleep_summary, on='date', how='left').fillna(0.0)
-        
-        # 6. 前週平均値の計算
-        start_of_current_period = today - timedelta(days=6) # 直近7日間の開始日
-        start_of_last_period = start_of_current_period - timedelta(days=7) # 前週7日間の開始日
-        
-        # 前7日間 (前週扱い) のデータのみを抽出
-        df_last_period_summary = sleep_summary[(sleep_summary['date'] < start_of_current_period) & (sleep_summary['date'] >= start_of_last_period)]
-        
-        # 前週の平均値（日ごとの累計睡眠時間の平均）
-        last_week_average = df_last_period_summary['count'].mean() if not df_last_period_summary.empty else 0.0
-        
-        # 7. 日付を「月/日」形式の文字列に変換 (PlotlyのX軸表示を確実にするため)
-        df_display['date'] = df_display['date'].apply(lambda x: x.strftime('%m/%d'))
-        
-        return df_display, last_week_average
+        # 3. 日ごとの累計睡眠時間（時間）を計算（日付をまたぐ睡眠は0時で分割して両日に計上）
+        sleep_summary = split_sleep_sessions_by_day(sessions)
+
+        # 4. グラフ表示用の14日分と前週平均値を計算
+        return _summarize_last_14_days(sleep_summary, 'count', fill_value=0.0)
         
     except Exception as e:
         st.error(f"睡眠データの集計中にエラーが発生しました: {e}")
@@ -492,19 +1354,18 @@ def get_sleep_summary_data(table_name="baby_events"):
 #---------------------------------------------------------
 #supabaseから最新ログを取得＜カード3＞
 #---------------------------------------------------------
-#@st.cache_data(ttl=60) # 1分間キャッシュ デモのリアルタイム性を考慮して非有効化
-def get_supabase_data(table_name="baby_events"):
-    """Supabaseからデータを取得し、JSTとして表示する"""
+# ※キャッシュは取得層（_fetch_event_snapshot）で行う
+def get_supabase_data(table_name="baby_events", tenant: Tenant = SINGLE_TENANT, snapshot: pd.DataFrame | None = None):
+    """スナップショットから最新ログ3件を取り出し、JSTとして表示する（snapshot省略時はSupabaseから取得）"""
     try:
-        response = supabase_client.table(table_name).select("datetime, type_jp").order("datetime", desc=True).limit(3).execute()
-        
-        df = pd.DataFrame(response.data)
-        
+        if snapshot is None:
+            snapshot = load_event_snapshot(table_name, tenant=tenant)
+
+        # 新しい順に3件
+        df = snapshot[['datetime', 'type_jp']].iloc[::-1].head(3).reset_index(drop=True)
+
         if not df.empty and 'datetime' in df.columns:
-            # データベースの時刻はJSTとして扱う
-            df['datetime'] = df['datetime'].apply(safe_to_jst)
-            
-            # 表示用の形式にフォーマット
+            # 表示用の形式にフォーマット（datetime列はスナップショット取得時にJST変換済み）
             df['datetime'] = df['datetime'].dt.strftime('%Y-%m-%d %H:%M')
             
         return df.to_dict('records')
@@ -517,31 +1378,18 @@ def get_supabase_data(table_name="baby_events"):
 # ---------------------------------------------------------
 # supabaseから授乳経過時間計算＜カード4＞
 # ---------------------------------------------------------
-#@st.cache_data(ttl=60) # 1分間キャッシュ デモのリアルタイム性を考慮して非有効化
-def get_feeding_elapsed_time(table_name="baby_events"):
+# ※キャッシュは取得層（_fetch_latest_events / _fetch_event_snapshot）で行う
+def get_feeding_elapsed_time(table_name="baby_events", tenant: Tenant = SINGLE_TENANT, snapshot: pd.DataFrame | None = None,
+                             latest: dict[str, dict] | None = None):
     """
-    Supabaseから最新の「授乳」イベント時刻を取得し、
+    最新の「授乳」（ミルク・母乳）イベント時刻を取得し、
     現在時刻からの経過時間（分）を計算する。
+    latest（get_latest_eventsの結果）を省略した場合は分類ごとの最新イベントを取得する。
     """
     try:
-        response = supabase_client.table(table_name).select("datetime, type_slug").in_('type_slug', ['formula', 'breast']).order("datetime", desc=True).limit(1).execute()
-        
-        if response.data:
-            latest_feeding_log = response.data[0]
-            
-            # データベースの時刻はJSTとして扱う
-            log_time_jst = safe_to_jst(latest_feeding_log['datetime'])
-            
-            # 現在時刻をJSTで取得
-            current_time_jst = datetime.now(JST)
-            
-            # 経過時間を計算
-            delta = current_time_jst - log_time_jst
-            minutes_passed = int(delta.total_seconds() / 60)
-            
-            return minutes_passed
-        else:
-            return 0
+        if latest is None:
+            latest = get_latest_events(table_name, tenant, snapshot)
+        return _minutes_since_event(latest.get('feeding'))
     except Exception as e:
         st.error(f"授乳データの読み込み中にエラーが発生しました: {e}")
         return 0
@@ -549,61 +1397,44 @@ def get_feeding_elapsed_time(table_name="baby_events"):
 # ---------------------------------------------------------
 # supabaseからミルク量の日ごとの累計値と前週平均の計算＜カード5＞
 # ---------------------------------------------------------
-#@st.cache_data(ttl=60) # 1分間キャッシュ デモのリアルタイム性を考慮して非有効化
-def get_feeding_summary_data(table_name="baby_events"):
+# ※キャッシュは取得層（_fetch_event_snapshot / _fetch_daily_totals）で行う
+def get_feeding_summary_data(table_name="baby_events", tenant: Tenant = SINGLE_TENANT, snapshot: pd.DataFrame | None = None,
+                             daily_totals: pd.DataFrame | None = None):
     """
-    Supabaseから直近2週間分のミルク量データを取得し、
+    スナップショットから直近2週間分のミルク量データを取り出し、
     日ごとの累計値（14日間）と前週の平均値を計算して返す。
+    snapshotを省略した場合はSupabaseから取得する。
+    daily_totals（fetch_daily_rollup / fetch_daily_totalsの結果）を渡した場合はその集計値を使う。
     """
     try:
-        fourteen_days_ago = datetime.now() - timedelta(days=14)
-        
-        response = supabase_client.table(table_name).select("datetime, amount_ml, type_slug").eq('type_slug', 'formula').gte('datetime', fourteen_days_ago.isoformat()).order("datetime", desc=True).execute()
-        
-        if not response.data:
+        # サーバー側で日次集計済みなら、その結果（最大14行）だけで表示データを作る
+        if daily_totals is not None:
+            all_period_summary = daily_totals[['date', 'milk_ml']].dropna()
+            all_period_summary.columns = ['date', 'amount']
+            return _summarize_last_14_days(all_period_summary, 'amount', fill_value=0)
+
+        if snapshot is None:
+            snapshot = load_event_snapshot(table_name, tenant=tenant)
+
+        # スナップショットは15日分なので、従来どおり直近14日分に絞る（DBの時刻文字列はJSTとして比較）
+        fourteen_days_ago = JST.localize(datetime.now() - timedelta(days=14))
+        df = _snapshot_rows(snapshot, ['formula'], since=fourteen_days_ago).copy()
+
+        if df.empty:
             dates_14 = [datetime.now().date() - timedelta(days=i) for i in range(13, -1, -1)]
             df_display = pd.DataFrame({'date': dates_14, 'amount': [0] * 14})
             return df_display, 0
 
-        df = pd.DataFrame(response.data)
-        
-        # データベースの時刻はJSTとして扱う
-        df['datetime'] = df['datetime'].apply(safe_to_jst)
         df['date'] = df['datetime'].dt.date
-        df['amount_ml'] = pd.to_numeric(df['amount_ml'], errors='coerce').fillna(0)
-        
-        # 期間の定義
-        today = datetime.now().date()
-        
-        # 1. 表示する日付（直近14日間）のリストを作成
-        dates_14 = [today - timedelta(days=i) for i in range(13, -1, -1)]
+        df['amount_ml'] = df['amount_ml'].astype(float).fillna(0)  # float32で保持している量をfloat64で合計する
+
         
-        # 2. 直近14日間の日ごとの累計値を計算
+        # 直近14日間の日ごとの累計値を計算
         all_period_summary = df.groupby('date')['amount_ml'].sum().reset_index()
         all_period_summary.columns = ['date', 'amount']
-        
-        # 3. 直近14日間を表示用のDataFrameに結合し、データがない日は0とする
-        df_display = pd.DataFrame({'date': dates_14})
-        df_display = pd.merge(df_display, all_period_summary, on='date', how='left').fillna(0)
-        
-        # 4. 前週の平均値（前7日間）を計算
-        start_of_current_period = today - timedelta(days=6) # 直近7日間の開始日
-        start_of_last_period = start_of_current_period - timedelta(days=7) # 前週7日間の開始日
-        
-        # 前7日間 (前週扱い) のデータのみを抽出
-        df_last_period = df[(df['date'] < start_of_current_period) & (df['date'] >= start_of_last_period)]
-        
-        # 前7日間 (前週扱い) の日ごとの累計を計算
-        last_period_summary = df_last_period.groupby('date')['amount_ml'].sum()
-        
-        # 前週の平均値（日ごとの累計値の平均）
-        last_week_average = last_period_summary.mean() if not last_period_summary.empty else 0
-        
-        # create_bar_chartの形式に合わせて列名を修正
-        df_display.columns = ['date', 'amount']
-        df_display['date'] = df_display['date'].apply(lambda x: x.strftime('%m/%d'))
-        
-        return df_display, last_week_average
+
+        # 表示用の14日分と前週の平均値（前7日間）を計算
+        return _summarize_last_14_days(all_period_summary, 'amount', fill_value=0)
         
     except Exception as e:
         st.error(f"ミルク量データの集計中にエラーが発生しました: {e}")
@@ -614,19 +1445,24 @@ def get_feeding_summary_data(table_name="baby_events"):
 # ---------------------------------------------------------
 # supabaseから最新の睡眠ステータスログを取得・計算＜カード6用＞
 # ---------------------------------------------------------
-#@st.cache_data(ttl=60) # 1分間キャッシュ デモのリアルタイム性を考慮して非有効化
-def get_sleep_status_log(table_name="baby_events"):
+# ※キャッシュは取得層（_fetch_latest_events / _fetch_event_snapshot）で行う
+def get_sleep_status_log(table_name="baby_events", tenant: Tenant = SINGLE_TENANT, snapshot: pd.DataFrame | None = None,
+                         latest: dict[str, dict] | None = None):
     """
-    Supabaseから最新の「sleep_start」または「sleep_end」ログを1件取得する。
+    最新の「sleep_start」または「sleep_end」ログを1件取得する。
     status/time計算のため、datetime, type_jp, type_slugを含める。
+    latest（get_latest_eventsの結果）を省略した場合は分類ごとの最新イベントを取得する。
     """
     try:
-        # type_slugが 'sleep_start' または 'sleep_end' の最新ログを1件取得
-        response = supabase_client.table(table_name).select("datetime, type_jp, type_slug").in_('type_slug', ['sleep_start', 'sleep_end']).order("datetime", desc=True).limit(1).execute()
-        
-        if response.data:
-            # get_status_and_time に渡すため、辞書のリスト形式で返す
-            return response.data 
+        if latest is None:
+            latest = get_latest_events(table_name, tenant, snapshot)
+
+        # type_slugが 'sleep_start' または 'sleep_end' の最新ログ
+        sleep_event = latest.get('sleep')
+
+        if sleep_event:
+            # get_status_and_time に渡すため、辞書のリスト形式で返す（datetimeはJST変換済みまたはDBの文字列）
+            return [{key: sleep_event.get(key) for key in ('datetime', 'type_jp', 'type_slug')}]
         else:
             # データがない場合は空のリストを返す
             return []
@@ -688,232 +1524,109 @@ def get_status_and_time(log_data):
 # ---------------------------------------------------------
 # get_sleep_summary_data / get_feeding_summary_data / get_diaper_elapsed_time / get_feeding_elapsed_time
 # get_chat_response は既存実装を利用
+# 平均・標準偏差・傾きと日常語ラベルは kpi_engine.py の KpiEngine で計算する。
+# エンジンはテナントごとにプロセス内で保持し、日が締まるたびにその日の値だけを足す（毎回7日分を計算し直さない）。
+KPI_WINDOW_DAYS = 7
+KPI_METRICS = ("sleep_hours", "milk_ml")
 
-def _series_stats(values: list[float]) -> dict:
-    """
-    目的:
-        数値系列(list[float])から「平均」「標準偏差」「１日あたりの直線的傾き」を計算する。
-    引数:
-        values:日単位の値(例:睡眠時間[h/日])、ミルク量[ml/日]
-    戻り値(dict):
-        {
-            "mean": 平均値(float),
-            "std": 標準偏差（float, 不偏ではなく母標準偏差 ddof=0）,
-            "trend_slope_per_day": 直線回帰で推定した1日あたりの傾き（float）
-        }
-    実装メモ:
-        - 配列化（np.array）して計算を安定化。
-        - データが空ならすべて0で返す（ダッシュボード側の表示を安全にするため）。
-        - 傾きはX=0..n-1を説明変数にpolyfit(1次)で取得（要素2以上の時のみ）。
-    """
-    #以下は上記戻り値（dict）の補足説明
-    #ddof=0 とは今あるデータ集合そのもののばらつき”**をそのまま測る、という意味。今週の実測データの事実を示すならddof=0がいいとのこと。ddof=1にすると分母がn-1になる。
-    #trend_slope_per_day 1日あたりに平均してどれくらい増減しているかを示す数値（単位は/日）
-
-    arr = np.array(values, dtype=float)#floatで少数を表せる数値型にすることで、平均・標準偏差・回帰の傾きなどの小数点計算を正確にする。
-    if arr.size == 0:#配列が空（要素数が０）かどうかチェック。データが１つもないと計算できないため使用。
-        return {"mean": 0.0, "std": 0.0, "trend_slope_per_day": 0.0}#空データの場合の安全な初期値を返す。0.0にすることでダッシュボードや後続処理でのエラーを防ぐ。
-    #以下のコードでやりたいこと
-    #日ごとのデータ（arr）があるとき、「最近1日あたりどのくらい増えている？減っている？」＝傾きをざっくり出したい
-    #そのために日数の番号（0日目、1日目、2日目…）を説明変数として使って直線を当てはめる（一次回帰）→直線の傾きを取り出す。
-    x = np.arange(arr.size, dtype=float)#データの本数分 x = 0,1,2という連番を作って「日数の流れを横軸にしている」 
-    #np.polyfit(x, arr, 1) は「x と arr の点群に、一次式（直線）を一番いい感じにフィットさせる」関数
-    #戻り値は [傾き, 切片] の2つ。[0] で傾き（slope）だけ取り出している。
-    #if文：ただし、データが1点しかないと直線の傾きは決められないので、その場合は 0.0 としている。
-    slope = float(np.polyfit(x, arr, 1)[0]) if arr.size >= 2 else 0.0
-    return {
-        "mean": float(arr.mean()), #平均=全体の基準
-        "std": float(arr.std(ddof=0)), #標準偏差＝日々のムラ
-        "trend_slope_per_day": slope, #傾き＝最近の流れ（増えている？減っている？横這い？）
-        #上記3点セットがそろっていると状況の要約がやりやすい。
-    }
-
-def _qualitative_labels(mean: float, std: float, slope: float, unit: str,
-                        abs_threshold: float | None = None) -> dict:
-    """
-    目的:
-        数字の統計量（平均/標準偏差/傾き）を「日常語の短い表現」に変換する。
-    
-    引数:
-        mean:   平均
-        std:    標準偏差
-        slope:  1日あたりの傾き（_series_statsのtrend_slope_per_day）
-        unit:   単位の短い表記（例:"時間/日"、"ml/日"）
-        abs_threshold: 絶対値で傾きを有意とみなす下限（例:睡眠0.2h/日、ミルク20ml/日）
-                       （「傾きがこれ以上なら"増えている/減っている"と言い切ろう」という最低ラインのこと）
-                       Noneの場合は、絶対閾値を使わず、相対判定（±5%/日）だけで判定
-                       （絶対量ではなく「平均と比べて1日あたり±5% 以上なら増減とみなす」という相対的な目安だけで判定）
-    判定ロジック（概略）:
-    - 変動の大きさ(平均と比べて、どれくらい日々の差があるか): 変動係数 CV=std/|mean|を用い、閾値10%/25%で3段階に言語化: 『10%未満：ほぼ毎日おなじ / 10~25%：日によって少しちがう / 25%以上:日によってかなりちがう』
-      目安幅として±10%/±25% を実数化にして同梱
-      例）平均６時間なら
-      ・±10%~±0.6時間（この範囲内のブレなら小さめ）
-      ・±25%~±1.5時間（ここを超えるブレは大きめ）
-
-    - 傾き: slope（1日あたりの増減）が
-        ・プラスで十分大きい→「少し増えつつある」
-        ・マイナスで十分大きい→「少し減りつつある」
-        ・どちらでもない→「だいたい同じ」
-    　※「十分大きい」の判断は2つのどちらかを満たしたとき：
-        1.abs_threshold(絶対ライン)以上
-        　例：睡眠で+0.25h/日は0.2h/日を超えるので「増えてる」と言いやすい
-        2.平均と比べて±5%/日以上（相対ライン）
-        　例：平均6hで+0.4h/日は0.4/6~6.7%/日→増えてる判定
-    
-    戻り値（dict）:
-        {
-        "variability": 変動の大きさ,
-        "variability_phrase": 変動の説明（1行）,
-        "trend": 傾向
-        "trend_phrase": 傾向の説明（1行）
-        "guideline_band_10pct": 目安幅（±10%の実数(平均×0.10)）,
-        "guideline_band_25pct": 目安幅（±25%の実数(平均×0.25)）
-        }
-    
-    実装メモ:
-    - meanが0近傍で割り算が不安定にならないようepsを加算。
-        「変動の大きさ」を出すときにCV=標準偏差÷平均という計算をしている。
-        平均値が0に近いと分母が小さすぎて結果が「異常に大きな数字」になってしまう。
-        さらに平均が完全に0.0ならゼロ割エラーが発生する。
-        そこでeps（ごく小さい数。例:1e-8）を足すことで分母が完全に0になることや計算が極端に跳ね上がるのを防ぐ。
-    - "日常語"のみで返す要件のため、専門用語は返却値に含めない。
-    
-    具体例（数値でイメージ）
-    直近7日の睡眠：だいたい 6.0時間/日
-    日々のバラつき：0.6時間（平均の10%）
-    傾き：+0.25時間/日（ここ数日で少しずつ増えている）
-    単位：「時間/日」
-    絶対の目安（abs_threshold）：0.2時間/日
-
-    この場合の出力イメージ：
-    変動：10% → 「ほぼ毎日おなじ」
-    説明：「日ごとの差は小さめ（目安：±0.6時間/日以内）。」
-    傾向：+0.25h/日 は 0.2h/日 を超える → 「少し増えつつある」
-    説明：「ここ数日は時間/日がゆるやかに増えています。」
-    目安幅：
-    10% → ±0.6時間
-    25% → ±1.5時間
-    """
-    eps = 1e-9 #ゼロ割を回避
-    cv = std / (abs(mean) + eps) #平均に対してどれくらいブレているか
-    band10 = abs(mean) * 0.10 #平均の10%を実際の単位(時間/日、ml/日)の数値に直す。abs(mean)を使うのは幅が必ず正の値になるようにするため。
-    band25 = abs(mean) * 0.25
-
-    #統計用語を使わず、一目でニュアンスが伝わる日本語に落とし込むための閾値設計。
-    #具体例:平均6.0時間/日、標準偏差:0.9時間
-    #cv = 0.9/6.0 = 0.15(15%)→日によって少し違う
-    #UI/説明向け：単位を含む自然な一文(variability_phrase)をそのまま画面やプロンプトに出せる。
-
-    if cv < 0.10: #cv(=ブレの割合)に応じて3つのラベルのどれかを選ぶ
-        variability = "ほぼ毎日おなじ"
-        variability_phrase = f"日ごとの差は小さめ（目安: ±{band10:.1f}{unit}以内）。" #.1fは小数点1桁で丸めて見やすくする工夫
-    elif cv < 0.25:
-        variability = "日によって少しちがう"
-        variability_phrase = f"日ごとの差は中くらい（目安: ±{band10:.1f}〜±{band25:.1f}{unit}）。"
-    else:
-        variability = "日によってかなりちがう"
-        variability_phrase = f"日ごとの差は大きめ（目安: ±{band25:.1f}{unit}以上）。"
-
-    #二段構えの有意性チェック（絶対・相対）で言い過ぎを防止
-    #相対しきい値（5%/日）や絶対しきい値（0.2h/日、20ml/日）は対象に合わせて調整可能。
-    #平均が0のときは%判定を切り離し、絶対量で判断
-
-    #1日あたりの変化量slopeが平均meanに対してどれくらいの割合かを出している。
-    #同じ「+0.3/日」でも平均6なら+5%/日、平均12なら+2.5%/日。平均に対する割合でみると大小の比較がフェアになる。
-    rel = abs(slope) / (abs(mean) + eps) if mean else 0.0
-    #相対基準だけだと平均が極端に小さい/大きいと判定がブレる、絶対基準だけだと指標のスケール以前になり比較がしにくい。
-    #両方用意して、どちらかを満たせば有意とすることで現実的で過剰反応しない判定にしている。
-    use_abs = abs_threshold is not None and abs(slope) >= abs_threshold #絶対的な基準を超えたか（睡眠時間0.2時間/日、ミルクなら20ml/日）
-    use_rel = rel >= 0.05  # 相対的な基準(5%/日)を超えたか
-
-    if (slope > 0) and (use_abs or use_rel):
-        trend = "少し増えつつある"
-        trend_phrase = f"ここ数日は{unit}がゆるやかに増えています。"
-    elif (slope < 0) and (use_abs or use_rel):
-        trend = "少し減りつつある"
-        trend_phrase = f"ここ数日は{unit}がゆるやかに減っています。"
-    else:
-        trend = "だいたい同じ"
-        trend_phrase = f"ここ数日は{unit}は大きく変わっていません。"
+@st.cache_resource(show_spinner=False, max_entries=TENANT_CACHE_MAX_ENTRIES)
+def get_kpi_engine(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> KpiEngine:
+    """プロセス内で共有するKPIエンジン（テーブル・テナントごとに1つ）"""
+    return KpiEngine(metrics=KPI_METRICS, windows=(KPI_WINDOW_DAYS,))
 
-    return {
-        "variability": variability,
-        "variability_phrase": variability_phrase,
-        "trend": trend,
-        "trend_phrase": trend_phrase,
-        "guideline_band_10pct": band10,
-        "guideline_band_25pct": band25,
-    }
 # ---------------------------------------------------------
 # GPTプロンプト組み立て（KPI_JSON同梱）と質問別インストラクション・共通呼び出し
 # ---------------------------------------------------------
-def build_kpi_payload_for_gpt() -> dict:
+def _chart_values(chart_data: pd.DataFrame, n_days: int) -> list[float]:
+    """グラフ用データ（date, 値の2列・古い順）の値を、末尾（今日）にそろえて n_days 個のfloatで返す（足りない分は0）"""
+    values = chart_data.iloc[:, 1].fillna(0).astype(float).tolist() if len(chart_data.columns) > 1 else []
+    return [0.0] * (n_days - len(values)) + values
+
+def _interval_daily_records(intervals: pd.DataFrame) -> list[dict]:
+    """日ごとの間隔（中央値・90%・最長・回数。分）をKPI_JSON用の辞書のリストにする"""
+    daily = daily_interval_stats(intervals)
+    return [
+        {"date": day.strftime('%m/%d'), "median": round(float(median), 1), "p90": round(float(p90), 1),
+         "longest": round(float(longest), 1), "count": int(count)}
+        for day, count, median, p90, longest in daily[['date', 'count', 'median', 'p90', 'longest']].itertuples(index=False)
+    ]
+
+def build_kpi_payload_for_gpt(snapshot: pd.DataFrame | None = None,
+                              daily_totals: pd.DataFrame | None = None,
+                              tenant: Tenant = SINGLE_TENANT,
+                              latest: dict[str, dict] | None = None) -> dict:
     """
     目的:
         ダッシュボードと同じ集計条件でKPI(直近7日+前週平均など)を取得し、
         "派生統計"と"日常語ラベル"を付けたJSONを作る。
         GPTに渡す一次ソース(KPI_JSON)として使用。
+    引数:
+        snapshot: load_event_snapshotの結果。省略時はここで1回だけ取得し、各集計関数で共有する。
+        daily_totals: fetch_daily_rollup / fetch_daily_totalsの結果（集計済みの日次合計を使う場合）。
+        tenant: 対象の家庭・赤ちゃん（snapshot省略時の取得をこのテナントに絞る）。
+        latest: get_latest_eventsの結果（分類ごとの最新イベント）。省略時はここで取得する。
     
     処理の流れ:
         1)既存の集計関数から睡眠/授乳の日次データと前週平均を取得
         2)直近7日分だけを抽出(tail(7))
         3)値列（2列目）を安全に特定→欠損は0で穴埋め
-        4)_series_statsで平均・標準偏差・傾きを計算
-        5)_qualitative_labelsで"日常語ラベル"を付与
+        4)KPIエンジン（kpi_engine.KpiEngine）で平均・標準偏差・傾きを計算（締まった日の分は前回までの和を再利用）
+        5)同じくKPIエンジンで"日常語ラベル"を付与
         　（睡眠の傾きは0.2h/日、ミルクは20ml/日を絶対閾値の目安として利用）
         6)おむつ/授乳の「前回からの経過分（分）」も付け、バケット化（0-90/90-180/180+）
+        　あわせて直近7日の授乳・おむつ替えの間隔（日ごとの中央値・90%、昼夜別、最長。event_intervals.py）を付ける
         7)GPTに渡しやすいフラットな辞書構造（JSON）で返す
     """
     # 既存の集計関数から睡眠と授乳のグラフ用データと前週平均を取得。
     #table_name="baby_events" は、データの置き場所（テーブル名）を明示。
     #ダッシュボードと同じ条件で集計し、数字の整合性を保つ。
-    sleep_chart_data, last_week_avg_sleep = get_sleep_summary_data(table_name="baby_events")
-    feeding_chart_data, last_week_avg_amount = get_feeding_summary_data(table_name="baby_events")
-    #おむつ・授乳の最終イベントからの経過分を取得。関数が (ラベル, 分) で返す場合に備え、分だけにそろえる。
-    #呼び出し元の差異（戻り値がタプル/単値）を吸収し、あとで扱いやすい整数 minutesへ統一。
-    diaper_elapsed = get_diaper_elapsed_time(table_name="baby_events")
-    feeding_elapsed = get_feeding_elapsed_time(table_name="baby_events")
-    if isinstance(diaper_elapsed, tuple): _, diaper_elapsed = diaper_elapsed
-    if isinstance(feeding_elapsed, tuple): _, feeding_elapsed = feeding_elapsed
-
-    sleep_df = pd.DataFrame(sleep_chart_data).tail(7)
-    feed_df  = pd.DataFrame(feeding_chart_data).tail(7)
+    #スナップショットを1回だけ取得して4つの集計で共有する（Supabaseへの往復は1回）。
+    if snapshot is None:
+        snapshot, daily_totals = load_dashboard_data(table_name="baby_events", tenant=tenant)
+    sleep_chart_data, last_week_avg_sleep = get_sleep_summary_data(table_name="baby_events", tenant=tenant, snapshot=snapshot, daily_totals=daily_totals)
+    feeding_chart_data, last_week_avg_amount = get_feeding_summary_data(table_name="baby_events", tenant=tenant, snapshot=snapshot, daily_totals=daily_totals)
+    if latest is None:
+        latest = get_latest_events(table_name="baby_events", tenant=tenant, snapshot=snapshot)
+
+    sleep_df = pd.DataFrame(sleep_chart_data).tail(KPI_WINDOW_DAYS)
+    feed_df  = pd.DataFrame(feeding_chart_data).tail(KPI_WINDOW_DAYS)
     sleep_val = sleep_df.columns[1] if len(sleep_df.columns) > 1 else None
     feed_val  = feed_df.columns[1]  if len(feed_df.columns)  > 1 else None
 
-    sleep_vals = sleep_df[sleep_val].fillna(0).astype(float).tolist() if sleep_val else []
-    milk_vals  = feed_df[feed_val].fillna(0).astype(float).tolist() if feed_val else []
-
-    sleep_stats = _series_stats(sleep_vals)
-    milk_stats  = _series_stats(milk_vals)
-
-    # “日常語”ラベル（睡眠は0.2h/日、ミルクは20ml/日を絶対閾値の目安）
-    sleep_labels = _qualitative_labels(
-        mean=sleep_stats["mean"], std=sleep_stats["std"], slope=sleep_stats["trend_slope_per_day"],
-        unit="時間/日", abs_threshold=0.2
-    )
-    milk_labels = _qualitative_labels(
-        mean=milk_stats["mean"], std=milk_stats["std"], slope=milk_stats["trend_slope_per_day"],
-        unit="ml/日", abs_threshold=20.0
-    )
-
-    def bucket_minutes(m: int) -> str:
-        if m is None: return "unknown"
-        return "0-90" if m < 90 else "90-180" if m < 180 else "180+"
+    # グラフ用データ（今日までの日ごと。記録のない日は0）をKPIエンジンに渡し、締まった日（昨日まで）の新しい分だけ足す
+    sleep_all = pd.DataFrame(sleep_chart_data)
+    feed_all = pd.DataFrame(feeding_chart_data)
+    today = datetime.now().date()
+    n_days = max(len(sleep_all), len(feed_all))
+    daily = pd.DataFrame({'date': [today - timedelta(days=i) for i in range(n_days - 1, -1, -1)]})
+    daily['sleep_hours'] = _chart_values(sleep_all, n_days)
+    daily['milk_ml'] = _chart_values(feed_all, n_days)
+    # 直近7日（今日を含む）の平均・標準偏差・傾きと“日常語”ラベル（睡眠は0.2h/日、ミルクは20ml/日を絶対閾値の目安）
+    # エンジンは同じ家庭のセッションで共有するため、追加と統計量の計算を1回のロックの中で行う
+    sleep_today = float(daily['sleep_hours'].iloc[-1]) if n_days else 0.0
+    milk_today = float(daily['milk_ml'].iloc[-1]) if n_days else 0.0
+    engine = get_kpi_engine(table_name="baby_events", tenant=tenant)
+    kpis = engine.sync_and_stats(daily, today, KPI_WINDOW_DAYS, {"sleep_hours": sleep_today, "milk_ml": milk_today},
+                                 since=daily['date'].iloc[0] if n_days else today)
+    sleep_stats, sleep_labels = kpis["sleep_hours"]["stats"], kpis["sleep_hours"]["labels"]
+    milk_stats, milk_labels = kpis["milk_ml"]["stats"], kpis["milk_ml"]["labels"]
+
+    # 授乳・おむつ替えの間隔（直近7日に終わった間隔。日ごとの中央値・90%、昼夜別、最長）
+    interval_start = JST.localize(datetime.combine(today - timedelta(days=KPI_WINDOW_DAYS - 1), datetime.min.time()))
+    intervals = {
+        category: intervals_since(compute_intervals(snapshot, category), interval_start)
+        for category in INTERVAL_CATEGORIES
+    }
 
     return {
         "units": {
             "sleep_hours_per_day": "hours",
             "milk_amount_per_day": "ml",
-            "elapsed_since_diaper": "minutes",
-            "elapsed_since_feeding": "minutes",
-        },
-        "elapsed": {
-            "diaper_minutes": int(diaper_elapsed or 0),
-            "feeding_minutes": int(feeding_elapsed or 0),
-            "diaper_bucket": bucket_minutes(int(diaper_elapsed or 0)),
-            "feeding_bucket": bucket_minutes(int(feeding_elapsed or 0)),
+            "elapsed_since_diaper": f"minutes (rounded down to {ELAPSED_STEP_MINUTES})",
+            "elapsed_since_feeding": f"minutes (rounded down to {ELAPSED_STEP_MINUTES})",
+            "intervals": "minutes",
         },
+        "elapsed": build_elapsed_payload(latest, tenant=tenant),
         "sleep_last7": [
             {"date": str(r["date"]), "hours": float(r[sleep_val] or 0)}
             for _, r in sleep_df.iterrows()
@@ -928,9 +1641,47 @@ def build_kpi_payload_for_gpt() -> dict:
         "milk_prev_week_avg_ml": float(round(float(last_week_avg_amount or 0), 2)),
         "milk_last7_stats": milk_stats,
         "milk_last7_labels": milk_labels,     # ← 日常語ラベル（色情報なし）
+        "feeding_interval_last7": summarize_intervals(intervals["feeding"]),
+        "feeding_interval_daily_last7": _interval_daily_records(intervals["feeding"]),
+        "diaper_interval_last7": summarize_intervals(intervals["diaper"]),
+        "diaper_interval_daily_last7": _interval_daily_records(intervals["diaper"]),
         "notes": "Derived stats and plain-language labels are computed on last7 only.",
     }
 
+# KPI_JSONの経過分の刻み（分）。送る値を切り下げておき、同じ刻みの間は回答キャッシュが効くようにする
+ELAPSED_STEP_MINUTES = 30
+
+def build_elapsed_payload(latest: dict[str, dict], tenant: Tenant = SINGLE_TENANT) -> dict:
+    """
+    KPI_JSONの "elapsed"（おむつ/授乳の前回からの経過分を ELAPSED_STEP_MINUTES 刻みに切り下げたものとバケット）。
+    時刻とともに変わるため、送る直前にも作り直す
+    """
+    #おむつ・授乳の最終イベントからの経過分を取得。関数が (ラベル, 分) で返す場合に備え、分だけにそろえる。
+    #呼び出し元の差異（戻り値がタプル/単値）を吸収し、あとで扱いやすい整数 minutesへ統一。
+    diaper_elapsed = get_diaper_elapsed_time(table_name="baby_events", tenant=tenant, latest=latest)
+    feeding_elapsed = get_feeding_elapsed_time(table_name="baby_events", tenant=tenant, latest=latest)
+    if isinstance(diaper_elapsed, tuple): _, diaper_elapsed = diaper_elapsed
+    if isinstance(feeding_elapsed, tuple): _, feeding_elapsed = feeding_elapsed
+
+    def bucket_minutes(m: int) -> str:
+        if m is None: return "unknown"
+        return "0-90" if m < 90 else "90-180" if m < 180 else "180+"
+
+    return {
+        "diaper_minutes": int(diaper_elapsed or 0) // ELAPSED_STEP_MINUTES * ELAPSED_STEP_MINUTES,
+        "feeding_minutes": int(feeding_elapsed or 0) // ELAPSED_STEP_MINUTES * ELAPSED_STEP_MINUTES,
+        "diaper_bucket": bucket_minutes(int(diaper_elapsed or 0)),
+        "feeding_bucket": bucket_minutes(int(feeding_elapsed or 0)),
+    }
+
+# サイドバーの「ダッシュボード分析」ボタンの質問（digest_worker.py が夜間にまとめて回答を作る）
+ANALYSIS_QUESTIONS = (
+    "睡眠パターンを分析して",
+    "授乳間隔を分析して",
+    "おむつ替えタイミングを分析して",
+    "ミルク量を分析して",
+)
+
 def build_analysis_instruction(question: str) -> str:
     # ※ 統計用語や追加ログ要求を出さない運用
     common = (
@@ -947,8 +1698,9 @@ def build_analysis_instruction(question: str) -> str:
         )
     if "授乳間隔" in question:
         return (
-            "厳密な間隔は算出せず、『授乳からの経過分』とミルク量の推移/ムラ/最近の流れから、"
-            "保守的に過剰/不足の兆候を評価してください。"
+            "KPI_JSONの授乳間隔（feeding_interval_last7: 中央値・90%・昼/夜の中央値・最長の間隔、"
+            "feeding_interval_daily_last7: 日ごとの推移）と『授乳からの経過分』、ミルク量の推移/ムラ/最近の流れから、"
+            "保守的に過剰/不足の兆候を評価してください。間隔は『約2時間半』のように時間で言い換えてください。"
             + common
         )
     if "ミルク量" in question:
@@ -959,222 +1711,473 @@ def build_analysis_instruction(question: str) -> str:
         )
     if "おむつ替え" in question:
         return (
-            "『おむつからの経過分』を主指標に替えタイミングの妥当性を評価し、"
+            "『おむつからの経過分』とおむつ替えの間隔（diaper_interval_last7: 中央値・90%・昼/夜・最長）を主指標に"
+            "替えタイミングの妥当性を評価し、"
             "外出前チェックや最大間隔の目安など低負荷の運用を示してください。"
             + common
         )
     return "KPI_JSONに基づく分析と、低負荷なNext Actionのみを提示してください。" + common
 
-def ask_gpt_with_optional_kpi(user_question: str, include_kpi: bool = True) -> str:
+# KPI_JSONは質問に関係する項目だけを、列形式・空白なしで送る（kpi_prompt.py）。BABY_KPI_COMPACT=0 で全項目をそのまま送る
+KPI_JSON_COMPACT = os.getenv("BABY_KPI_COMPACT", "1") == "1"
+
+def encode_kpi_payload(payload: dict, question: str | None = None) -> str:
+    """KPIペイロードをGPTに渡すKPI_JSON（文字列）にする。回答キャッシュのキーにもこの文字列のハッシュを使う"""
+    if KPI_JSON_COMPACT:
+        return encode_kpi_json(payload, question)
+    return json.dumps(payload, ensure_ascii=False)
+
+# ---------------------------------------------------------
+# KPI_JSONの事前計算（データの版ごと・バックグラウンド）
+# ---------------------------------------------------------
+# 「ダッシュボード分析」ボタンが押されてから集計を始めると、OpenAIへの送信がその分だけ遅れる。
+# 画面の描画でデータの版が決まったら、その版のKPIペイロードをバックグラウンドで作ってテナントごとに保持し、
+# ボタンの処理では出来上がった辞書の経過分（時刻とともに変わる）だけを作り直してJSONにする。
+# 取得に失敗したデータがある描画では事前計算せず、ボタンが押されたときにその場で作る。
+KPI_PREWARM = os.getenv("BABY_KPI_PREWARM", "1") == "1"
+KPI_PREWARM_WAIT_SECONDS = 5  # 作成中の事前計算を待つ上限（超えたらその場で作る）
+
+@st.cache_resource(show_spinner=False, max_entries=TENANT_CACHE_MAX_ENTRIES)
+def get_kpi_payload_cache(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> VersionedCache:
+    """プロセス内で共有するKPIペイロードのキャッシュ（テーブル・テナントごとに1つ、最新の版だけ保持）"""
+    return VersionedCache(name=f"kpi-{tenant.label()}")
+
+def prewarm_kpi_payload(data: DashboardData, tenant: Tenant = SINGLE_TENANT) -> bool:
     """
-    SYSTEM_PROMPT / FORMAT_HINT は既存 get_chat_response のデフォルトで踏襲。
-    include_kpi=True なら KPI_JSON を同梱。
+    描画するデータの版のKPIペイロードを、まだなければバックグラウンドで作り始める（始めたらTrue）。
+    作成はこのスクリプト実行が終わったあとまで続くことがあるため、描画中のスクリプトの文脈は引き継がない
+    （集計関数の st.error が後の実行の画面に紛れ込まないようにする）。失敗はログに残し、ボタンを押したときにその場で作る。
+    """
+    if not KPI_PREWARM or data.errors:
+        return False
+    build = functools.partial(build_kpi_payload_for_gpt, snapshot=data.snapshot, daily_totals=data.daily_totals,
+                              tenant=tenant, latest=data.latest)
+    cache = get_kpi_payload_cache(table_name="baby_events", tenant=tenant)
+    return cache.prewarm(data.version, build)
+
+def kpi_json_for(data: DashboardData, tenant: Tenant = SINGLE_TENANT, question: str | None = None) -> str:
+    """描画中のデータの（question に合わせて絞り込んだ）KPI_JSON。事前計算済みの辞書があれば、経過分だけを作り直してJSONにする"""
+    cache = get_kpi_payload_cache(table_name="baby_events", tenant=tenant) if KPI_PREWARM and not data.errors else None
+    payload = cache.wait(data.version, timeout=KPI_PREWARM_WAIT_SECONDS) if cache is not None else None
+    if payload is None:
+        payload = build_kpi_payload_for_gpt(snapshot=data.snapshot, daily_totals=data.daily_totals, tenant=tenant, latest=data.latest)
+        if cache is not None:
+            cache.put(data.version, payload)
+    else:
+        # 保持している辞書は他のセッションと共有しているため、書き換えずに複製する
+        payload = {**payload, "elapsed": build_elapsed_payload(data.latest, tenant=tenant)}
+    return encode_kpi_payload(payload, question)
+
+def build_gpt_instruction(user_question: str, include_kpi: bool = False) -> str:
+    """
+    GPTへの指示のうち、質問の種類（include_kpi なら分析指示）ごとに毎回同じ部分。
+    プロンプトキャッシュが効くよう、ユーザー質問・KPI_JSONより前のメッセージとして送る。
     """
     parts = []
-    parts.append("以下のユーザー質問に回答し、その後で与えられたKPI_JSON（あれば）を一次ソースとして事実ベースの分析と示唆を述べてください。")
-    parts.append("\n[ユーザー質問]\n" + user_question)
+    parts.append("ユーザー質問に回答し、その後で与えられたKPI_JSON（あれば）を一次ソースとして事実ベースの分析と示唆を述べてください。")
 
     if include_kpi:
-        kpi_json = json.dumps(build_kpi_payload_for_gpt(), ensure_ascii=False)
         instruction = build_analysis_instruction(user_question)
         parts.append("\n[分析タスク]\n" + instruction)
-        parts.append("\n[KPI_JSON]\n" + kpi_json)
 
     parts.append("\n出力フォーマットは指定の形式（SYSTEM/FORMAT_HINT）に従ってください。")
-    prompt = "\n".join(parts)
-    return get_chat_response(prompt)  # 既存のSYSTEM_PROMPT/FORMAT_HINTが効く
+    return "\n".join(parts)
+
+def build_gpt_prompt(user_question: str, kpi_json: str | None = None) -> str:
+    """
+    GPTへ渡すプロンプトのうち毎回変わる部分（ユーザー質問と、kpi_json があればKPI_JSON）を組み立てる。
+    """
+    parts = ["[ユーザー質問]\n" + user_question]
+    if kpi_json:
+        parts.append("\n[KPI_JSON]\n" + kpi_json)
+    return "\n".join(parts)
 
 
 #---------------------------------------------------------
 # データ生成・グラフ作成
 #---------------------------------------------------------
 
-# 円形プログレスバーの作成（レスポンシブ対応）＜カード1・4＞
-def create_circular_progress(actual_value, max_value):
+# 円形プログレスバー＜カード1・4＞・棒グラフ＜カード2・5＞は charts.py（作成済みのFigureを再利用する）
+
+
+#---------------------------------------------------------
+# ライブ更新カード（経過時間・今何してる）＜カード1・4・6＞
+#---------------------------------------------------------
+# これらのカードはフラグメントとして、自分だけを一定間隔で描き直す（経過時間の表示を進める）。
+# 描き直しでは画面全体の描画時に受け取った最新イベントの時刻（latest）から経過分を計算し直すだけで、
+# DBへの問い合わせも、棒グラフなど他のカードの再描画も発生しない。
+# リアルタイム更新（BABY_REALTIME=1）で購読中は、購読で更新されるイベントストア（プロセス内のメモリ）の
+# 分類ごとの更新回数を LIVE_REFRESH_SECONDS ごとに見て、自分の分類に新しい記録があったカードだけが最新イベントを求め直す
+# （新しい記録も数秒で反映する。棒グラフなどは watch_data_version が画面全体を描き直す）。
+REALTIME_UPDATES = os.getenv("BABY_REALTIME", "0") == "1"
+LIVE_REFRESH_SECONDS = 5
+CARD_TICK_SECONDS = int(os.getenv("BABY_CARD_TICK_SECONDS", "30"))  # 経過時間カードの描き直し間隔
+CARD_REFRESH_SECONDS = LIVE_REFRESH_SECONDS if REALTIME_UPDATES else CARD_TICK_SECONDS
+DIAPER_MAX_MINUTES = 180 # グラフの上限を180分に設定
+FEEDING_MAX_MINUTES = 180 # 授乳グラフの上限を180分（3時間）に設定
+
+def _live_latest_events(table_name: str, tenant: Tenant, latest: dict[str, dict], category: str) -> dict[str, dict]:
     """
-    円形プログレスバーを作成し、中央に値を表示する
-    時間経過に応じて色を動的に変更：
-    - 0-120分: 青色 (#4A90E2)
-    - 121-179分: オレンジ色 (#FFA500) 
-    - 180分以上: 赤色 (#FF4500)
-    
-    Args:
-        actual_value (int): 実際の経過時間（分）。中央に表示される値。
-        max_value (int): グラフの上限（分）。プログレスバーが一周する値。
-        color (str): プログレスバーの色。
-    
-    Returns:
-        go.Figure: PlotlyのFigureオブジェクト。
+    カード1・4・6用の最新イベント（latest の category の分を最新にしたもの）。
+    リアルタイム購読中はイベントストアから求めるが、その分類の更新回数（category_versions）が
+    前回から変わっていなければセッションに覚えた結果を使い、ストアを読み直さない。
+    ストアの保持期間内に記録がなければ、画面全体の描画時に取得した latest を使う（どちらもネットワークへの問い合わせなし）。
     """
-    # 時間経過に応じた色の動的決定
-    if actual_value <= 119:
-        progress_color = "#4A90E2"  # 青色
-    elif actual_value <= 179:
-        progress_color = "#FFA500"  # オレンジ色
-    else:
-        progress_color = "#FF4500"  # 赤色
-
-    # グラフのオレンジ色の領域として表示する値。最大値を超えないように制限する。
-    display_value = min(actual_value, max_value)
-
-    #円形プログレスバー作成
-    fig = go.Figure(data=[go.Pie(
-        values=[display_value, max_value - display_value],
-        hole=.7,
-        marker_colors=[progress_color, '#d3d3d3'],
-        textinfo='none',
-        showlegend=False,
-        hoverinfo='skip',
-        direction='clockwise', # 時計回り 
-        sort=False, 
-        #rotation=90　←最初から12時の方向に開始されるので不要
-    )])
-    
-    fig.update_layout(
-        showlegend=False,
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        margin=dict(t=0, b=0, l=0, r=0),
-        autosize=True,
-        height=150,  # 高さを半分に設定
-        annotations=[
-            dict(
-                # 実際の経過時間 (actual_value) を表示
-                text=f'<span style="color:black; font-size:30px; font-weight:bold;">{actual_value}</span><br><span style="color:black; font-size:16px;"><br>分経過</span>',
-                x=0.5, 
-                y=0.5, 
-                showarrow=False,
-                align='center'
-            )
-        ]
-    )
-    
-    return fig
+    feed = get_realtime_feed(table_name, tenant) if REALTIME_UPDATES else None
+    if feed is None or not feed.connected:
+        return latest
+    store = get_event_store(table_name, tenant)
+    # 更新回数を先に読む（読んだ後に届いた変更は、次の描き直しで回数の違いとして拾う）
+    version = store.category_versions[category]
+    remembered = st.session_state.setdefault('_card_latest_events', {})
+    key = (table_name, tenant, category)
+    if key not in remembered or remembered[key][0] != version:
+        rows = select_events(store.frame, type_slugs=CATEGORY_SLUGS[category])
+        remembered[key] = (version, {"category": category, **rows.iloc[-1].to_dict()} if not rows.empty else None)
+    event = remembered[key][1]
+    return {**latest, category: event} if event is not None else latest
+
+@st.fragment(run_every=CARD_REFRESH_SECONDS)
+def render_diaper_card(table_name: str, tenant: Tenant, latest: dict[str, dict]):
+    # カード1用データ取得: 最新のおむつ替えからの経過時間を取得
+    elapsed_minutes = get_diaper_elapsed_time(table_name=table_name, tenant=tenant, latest=_live_latest_events(table_name, tenant, latest, 'diaper'))
 
-# 棒グラフの作成（デスクトップ1画面対応）＜カード2・5＞
-def create_bar_chart(data, title, color="#4A90E2", average_value=None): 
-    df = pd.DataFrame(data)
+    st.markdown('<div class="card-title">おむつ替え経過時間</div>', unsafe_allow_html=True)
+    # 経過時間と上限値(例：180分)を渡す
+    fig_diaper_progress = create_circular_progress(elapsed_minutes, DIAPER_MAX_MINUTES)
+    st.plotly_chart(fig_diaper_progress, use_container_width=True, config={'displayModeBar': False}, key="diaper_progress")
 
-    # DataFrameの2列目（index 1）をデータの値の列とする
-    value_column = df.columns[1] 
-    
-    # 日付列を 'date' に統一する (get_feeding_summary_dataが出力する形式に合わせる)
-    if 'date' not in df.columns:
-        df.columns = ['date', value_column]
-    
-    num_days = len(df)
-    x_range_indices = None
-    
-    # データが7日分以上ある場合、直近7日間の範囲を設定する
-    if num_days >= 7:
-        # PlotlyはX軸をカテゴリカルデータとして扱うため、インデックスで範囲を指定する。
-        # 直近7日間はインデックスの (num_days - 7) から (num_days - 1) に対応。
-        # グラフの棒が途切れないように、開始と終了のインデックスに +/- 0.5 の調整を加える。
-        x_range_indices = [num_days - 7 - 0.5, num_days - 1 + 0.5]
-
-    # 棒グラフの作成
-    bar_fig = go.Figure(data=[
-        go.Bar(
-            x=df['date'],
-            y=df[value_column], 
-            text=df[value_column].apply(lambda x: f'{int(x)}' if x > 0 else ''), # 0は表示しない
-            marker_color=color,
-            textposition='inside',
-            insidetextanchor='end',
-            marker_cornerradius=3,
-            textfont=dict(color='white', size=12),
-            showlegend=False # 凡例を非表示にする
+@st.fragment(run_every=CARD_REFRESH_SECONDS)
+def render_feeding_card(table_name: str, tenant: Tenant, latest: dict[str, dict]):
+    # カード4用データ取得: 最新の授乳からの経過時間を取得
+    elapsed_minutes_feeding = get_feeding_elapsed_time(table_name=table_name, tenant=tenant, latest=_live_latest_events(table_name, tenant, latest, 'feeding'))
+
+    st.markdown('<div class="card-title">授乳経過時間</div>', unsafe_allow_html=True)
+    fig_feeding_progress = create_circular_progress(elapsed_minutes_feeding, FEEDING_MAX_MINUTES) 
+    st.plotly_chart(fig_feeding_progress, use_container_width=True, config={'displayModeBar': False}, key="feeding_progress")
+
+@st.fragment(run_every=CARD_REFRESH_SECONDS)
+def render_sleep_status_card(table_name: str, tenant: Tenant, latest: dict[str, dict]):
+    # カード6用データ取得　最新の起床or就寝ログを取得
+    sleep_status_log = get_sleep_status_log(table_name=table_name, tenant=tenant, latest=_live_latest_events(table_name, tenant, latest, 'sleep'))
+    latest_sleep_log = sleep_status_log[0] if sleep_status_log else None
+
+    st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+    st.markdown('<div class="card-title">今何してる</div>', unsafe_allow_html=True)
+
+    if latest_sleep_log:
+
+        # 1. データベースの時刻はJSTとして扱う
+        log_time_jst = safe_to_jst(latest_sleep_log['datetime']) # ★ safe_to_jst を使用
+        current_time_jst = datetime.now(JST)
+
+        # 2. 経過時間（分）を計算
+        delta = current_time_jst - log_time_jst
+        total_minutes = int(delta.total_seconds() / 60) # ★ total_minutesをここで定義
+
+        # 3. 状態、絵文字、表示テキストを決定
+        status_text_verb = ""
+        status_text_current = "" # 「起きています」/「寝ています」 
+        emoji = ""
+
+        if latest_sleep_log.get('type_slug') == 'sleep_start':
+            status_text_verb = "就寝" # 表示文言を「就寝中」から「就寝」に変更
+            status_text_current = "寝ています"
+            emoji = "😴"
+        elif latest_sleep_log.get('type_slug') == 'sleep_end':
+            status_text_verb = "起床" # 表示文言を「起床中」から「起床」に変更
+            status_text_current = "起きています"
+            emoji = "🌞"
+        else:
+            status_text_verb = "不明"
+            status_text_current = "不明な状態"
+            emoji = "❓"
+
+        # 4. 経過時間を「〇時間〇分」形式に変換
+        hours = total_minutes // 60
+        minutes = total_minutes % 60
+
+        if total_minutes < 1:
+            formatted_time_passed = "たった今"
+        elif hours == 0:
+            formatted_time_passed = f"{minutes}分経過"
+        else:
+            formatted_time_passed = f"{hours}時間{minutes}分経過" # 「経過」を削除
+
+        # 5. HTML表示
+        st.markdown(
+            f"""
+            <div style="text-align: center;">
+                <div style="font-size: 3.0rem; margin-bottom: 0.5rem;">
+                    {emoji}
+                </div>
+                <div style="font-size: 1.5rem; font-weight: bold; color: #3498db; margin-bottom: 0.5rem;">
+                    {status_text_current}
+                </div>
+                <div style="font-size: 1.0rem; color: #2c3e50;">
+                    {log_time_jst.strftime('%H:%M')}に{status_text_verb} &nbsp; | &nbsp; {formatted_time_passed}
+                </div>
+            </div>
+            """,
+            unsafe_allow_html=True
         )
-    ])
-    
-    # 前週平均線の作成 (average_value が渡された場合にのみ実行)
-    if average_value is not None and average_value > 0:
-        # グラフに表示されている日付リストを取得
-        dates = df['date'].tolist()
-        
-        # 直近7日間の日付のみを抽出 (最後の7つ)
-        # 前週の平均値を今週の棒グラフ領域に表示したい
-        this_week_dates = dates[-7:] # 例: 9/21〜9/27
-        
-        # 直近7日間の日付に対応する平均値のリストを作成
-        # 前週のデータには線を引かないように、直近7日分だけ平均値、残りはNone(Plotlyは無視する)を設定
-        y_line = [None] * (len(dates) - 7) + [average_value] * 7
-        
-        line_fig = go.Figure(data=[
-            go.Scatter(
-                x=df['date'],
-                y=y_line, # ← 14日間のうち直近7日間にのみ平均値を設定
-                mode='lines',
-                line=dict(color='red', width=2, dash='dash'),
-                name='前週平均',
-                showlegend=False 
-            )
-        ])
-        # 棒グラフと折れ線グラフを統合
-        final_fig = go.Figure(data=bar_fig.data + line_fig.data)
     else:
-        final_fig = bar_fig # 平均値がない場合は棒グラフのみ
-        
+        st.info("就寝/起床ログがありません。")
+    st.markdown('</div>', unsafe_allow_html=True)
 
-    final_fig.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='#2c3e50', size=10),
-        xaxis=dict(
-            showgrid=False,
-            zeroline=False,
-            #tickformat='%m/%d',
-            title="",
-            tickfont=dict(size=9),
-            range=x_range_indices,# ★★★ X軸の表示範囲を適用 ★★★
-            rangeslider=dict(visible=False), 
-            type='category' # X軸をカテゴリカルとして扱う
-        ),
-        yaxis=dict(
-            showgrid=False,
-            zeroline=False,
-            title="",
-            tickfont=dict(size=9),
-            # Y軸の最大値を調整して平均線が入りやすいようにする (平均値が存在する場合)
-            range=[0, df[value_column].max() * 1.1 if average_value is None or df[value_column].max() * 1.1 > average_value * 1.1 else average_value * 1.1]
-        ),
-        margin=dict(t=5, b=5, l=15, r=15),
-        autosize=True,
-        height=180
-    )
-    
-    return final_fig
+#---------------------------------------------------------
+# 授乳・おむつ替えの間隔＜間隔の表示＞
+#---------------------------------------------------------
+# 画面全体の描画で受け取ったスナップショット（直近15日分）から間隔を求める（DBへの問い合わせはない）。
+# 既定は非表示で、表示の切り替えではこのフラグメントだけを描き直す。
+INTERVAL_DISPLAY_DAYS = 14
+
+def _format_minutes(minutes: float | None) -> str:
+    """分を「2時間15分」の形にする（Noneは「-」）"""
+    if minutes is None:
+        return "-"
+    hours, rest = divmod(int(round(minutes)), 60)
+    return f"{hours}時間{rest}分" if hours else f"{rest}分"
+
+@st.fragment
+def render_interval_section(snapshot: pd.DataFrame):
+    if not st.toggle(f"授乳・おむつ替えの間隔を表示（直近{INTERVAL_DISPLAY_DAYS}日）", key="intervals_enabled"):
+        return
+    since = JST.localize(datetime.combine(datetime.now().date() - timedelta(days=INTERVAL_DISPLAY_DAYS - 1), datetime.min.time()))
+    columns = st.columns(2)
+    for column, category, title in zip(columns, INTERVAL_CATEGORIES, ("授乳の間隔", "おむつ替えの間隔")):
+        with column:
+            st.markdown(f'<div class="card-title">{title} (時間) 日ごとの中央値・90%</div>', unsafe_allow_html=True)
+            intervals = intervals_since(compute_intervals(snapshot, category), since)
+            if intervals.empty:
+                st.info("この期間の記録がありません。")
+                continue
+            daily = daily_interval_stats(intervals)
+            daily['date'] = daily['date'].apply(lambda x: x.strftime('%m/%d'))
+            fig = create_interval_chart(daily, "#4A90E2")
+            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False}, key=f"interval_{category}_chart")
+            summary = summarize_intervals(intervals)
+            st.caption(
+                f"中央値 {_format_minutes(summary['median'])}・90% {_format_minutes(summary['p90'])}"
+                f"（昼 {_format_minutes(summary['day_median'])} / 夜 {_format_minutes(summary['night_median'])}）・"
+                f"最長 {_format_minutes(summary['longest'])}（{summary['longest_start']}〜{summary['longest_end']}）"
+            )
 
+#---------------------------------------------------------
+# 長期の推移＜長期表示＞
+#---------------------------------------------------------
+# 表示期間の切り替えではこのフラグメントだけを描き直す（上の6枚のカードは再実行しない）。
+# 既定は非表示で、表示するまで長期分の問い合わせは発生しない。
+@st.fragment
+def render_history_section(table_name: str, tenant: Tenant):
+    if not st.toggle("長期の推移を表示（30日・90日・1年）", key="history_enabled"):
+        return
+    days = st.radio("表示期間", list(HISTORY_RANGES), format_func=lambda d: "1年" if d == 365 else f"{d}日",
+                    horizontal=True, key="history_days", label_visibility="collapsed")
+    bucket = HISTORY_RANGES[days]
+    daily = fetch_history_daily_totals(table_name, days=days, tenant=tenant)
+    if daily is None:
+        st.info("長期の推移を表示するには、日次ロールアップ表（baby_daily_rollup）またはRPC（baby_daily_totals）が必要です。")
+        return
+    buckets = bucket_daily_totals(daily, bucket)
+    if buckets.empty:
+        st.info("この期間の記録がありません。")
+        return
+
+    unit = HISTORY_BUCKET_LABELS[bucket]
+    col_sleep, col_milk = st.columns(2)
+    with col_sleep:
+        st.markdown(f'<div class="card-title">睡眠時間 (h/日) {unit}ごとの平均</div>', unsafe_allow_html=True)
+        fig = create_history_chart(buckets, 'sleep_hours', "#4A90E2", "h")
+        st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False}, key="history_sleep_chart")
+    with col_milk:
+        st.markdown(f'<div class="card-title">ミルク量 (ml/日) {unit}ごとの平均</div>', unsafe_allow_html=True)
+        fig = create_history_chart(buckets, 'milk_ml', "#4A90E2", "ml")
+        st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False}, key="history_milk_chart")
+
+#---------------------------------------------------------
+# 新しい記録の検知（データが変わったときだけ画面全体を描き直す）
+#---------------------------------------------------------
+# 14日分の棒グラフ・最新ログは画面全体の描画でしか作り直さない。見えないフラグメントが
+# DATA_POLL_SECONDS ごとに鮮度トークン（最新idの確認1回）を見て、描画時から変わっていれば画面全体を再実行する。
+# 日付が変わったとき（棒グラフの日付軸が進む）も同じく描き直す。
+# リアルタイム購読中はイベントストアの更新回数を見るだけで、DBへは問い合わせない。新しい記録は経過時間などのカードが
+# 分類ごとに数秒で反映するため、画面全体の描き直し（棒グラフ用）は購読中も DATA_POLL_SECONDS ごとに留める。
+DATA_POLL_SECONDS = int(os.getenv("BABY_DATA_POLL_SECONDS", "60"))
+
+def current_data_version(table_name="baby_events", tenant: Tenant = SINGLE_TENANT) -> str:
+    """画面に表示するデータの版（JSTの日付と鮮度トークン、購読中はイベントストアの更新回数）"""
+    return data_version(table_name, tenant, LOOKUP_FRESHNESS)
+
+def data_version(table_name: str, tenant: Tenant, freshness: str | None) -> str:
+    """確認済みの鮮度トークン（LOOKUP_FRESHNESS なら確認する）からデータの版を作る"""
+    jst_date = datetime.now(JST).date().isoformat()
+    feed = get_realtime_feed(table_name, tenant) if REALTIME_UPDATES else None
+    if feed is not None and feed.connected:
+        return f"{jst_date}|store-v{get_event_store(table_name, tenant).version}"
+    return f"{jst_date}|{_resolve_freshness(table_name, tenant, freshness)}"
+
+@st.fragment(run_every=DATA_POLL_SECONDS)
+def watch_data_version(table_name: str, tenant: Tenant, rendered_version: str):
+    # 画面全体の描画時の版から変わっていれば、棒グラフなども含めて描き直す
+    if current_data_version(table_name, tenant) != rendered_version:
+        st.rerun(scope="app")
+
+
+#---------------------------------------------------------
+# AIによる育児アドバイス（ストリーミング表示）
+#---------------------------------------------------------
+def render_streamed_advice(pending: dict, data: DashboardData, tenant: Tenant = SINGLE_TENANT):
+    """
+    目的:
+        サイドバーで受け付けた質問（pending_question）の回答を生成し、届いた順に表示する。
+    実装メモ:
+        - KPI_JSONは描画時に事前計算したもの（kpi_json_for）を使い、ボタンが押されてから集計し直さない。
+        - 生成前に pending_question を消しておく。途中で別のウィジェット操作による再実行が
+          入っても同じ質問を二重に投げず、そこまでの回答（chat_response）を表示する。
+        - 新しい質問による再実行で st.write_stream が中断されたら、finally でストリームを閉じる。
+        - 分析ボタンの質問は、夜間に作成した分析（load_digest）があればそれをすぐに表示する
+          （「最新のデータで分析し直す」で押された質問は use_digest=False で、その場で生成する）。
+        - 回答キャッシュにあればそれを表示し、最後まで受け取れた回答だけをキャッシュに保存する。
+    """
+    st.session_state.pending_question = None
+    st.session_state.chat_response = ""
+    metrics = {}
+    st.session_state.chat_metrics = metrics
+
+    started = time.perf_counter()
+    digest = load_digest(tenant, pending["text"]) if pending["include_kpi"] and pending.get("use_digest", True) else None
+    if digest is not None:
+        metrics.update(cached=True, digest=True, total_sec=round(time.perf_counter() - started, 3),
+                       digest_generated_at=digest["generated_at"], question=pending["text"])
+        record_gpt_metrics(pending["text"], metrics)
+        st.session_state.chat_response = digest["response"]
+        st.info(digest["response"])
+        render_advice_caption(metrics)
+        return
+
+    kpi_json = kpi_json_for(data, tenant=tenant, question=pending["text"]) if pending["include_kpi"] else ""
+
+    # 同じ質問・同じKPI_JSONの回答が保存済みなら、OpenAIを呼ばずにそれを表示する
+    cache = get_response_cache()
+    key = gpt_cache_key(pending["text"], kpi_json, tenant)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        metrics.update(cached=True, total_sec=round(time.perf_counter() - started, 3))
+        record_gpt_metrics(pending["text"], metrics, include_kpi=pending["include_kpi"])
+        st.session_state.chat_response = cached
+        st.info(cached)
+        render_advice_caption(metrics)
+        return
+
+    # 質問の種類ごとに同じ指示を先に、毎回変わるユーザー質問・KPI_JSONを最後に送る（build_chat_messages）
+    instruction = build_gpt_instruction(pending["text"], pending["include_kpi"])
+    prompt = build_gpt_prompt(pending["text"], kpi_json=kpi_json)
+    report_prompt_tokens(prompt, instruction, kpi_json, metrics)
+    if not GPT_STREAMING:
+        with st.spinner("回答を作成しています..."):
+            st.session_state.chat_response = get_chat_response(prompt, instruction=instruction, metrics=metrics)
+        record_gpt_metrics(pending["text"], metrics, include_kpi=pending["include_kpi"])
+        if cache is not None and not _is_failed_response(st.session_state.chat_response):
+            cache.put(key, st.session_state.chat_response)
+        st.info(st.session_state.chat_response)
+        return
+
+    def keep_partial(chunks):
+        for text in chunks:
+            st.session_state.chat_response += text
+            yield text
+
+    chunks = stream_chat_response(prompt, metrics=metrics, instruction=instruction)
+    try:
+        with st.container(border=True):
+            st.write_stream(keep_partial(chunks))
+    finally:
+        chunks.close()
+        record_gpt_metrics(pending["text"], metrics, include_kpi=pending["include_kpi"])
+    # 最後まで受け取れた回答だけを保存する（途中で打ち切った回答・エラーは保存しない）
+    if cache is not None and metrics.get("completed"):
+        cache.put(key, st.session_state.chat_response)
+    render_advice_caption(metrics)
+
+def report_prompt_tokens(prompt: str, instruction: str | None, kpi_json: str, metrics: dict):
+    """送信するメッセージ（SYSTEM_PROMPT・FORMAT_HINT・分析指示を含む）の見積もりトークン数を metrics に入れ、ログに残す"""
+    text = "\n".join(message["content"] for message in build_chat_messages(prompt, instruction=instruction))
+    metrics.update(prompt_token_report(text, kpi_json, model=GPT_MODEL))
+    logger.info("GPT prompt tokens: %d (KPI_JSON %d, %s, model=%s)", metrics["prompt_tokens"], metrics["kpi_tokens"],
+                "tiktoken" if metrics["tokens_exact"] else "estimated", GPT_MODEL)
+
+def render_advice_caption(metrics: dict | None):
+    """回答の下に、応答時間（またはキャッシュから返したこと）・入力トークン数とキャッシュのヒット率を小さく表示する"""
+    if not metrics:
+        return
+    if metrics.get("digest"):
+        generated = datetime.fromtimestamp(metrics["digest_generated_at"], JST).strftime("%m/%d %H:%M")
+        st.caption(f"{generated} に作成した分析を表示しました（{metrics['total_sec'] * 1000:.0f} ミリ秒）")
+        st.button("最新のデータで分析し直す", key="refresh_digest", on_click=fire_and_scroll,
+                  args=(metrics["question"],), kwargs={"include_kpi": True, "use_digest": False})
+        return
+    if metrics.get("cached"):
+        text = f"保存済みの回答を表示しました（{metrics['total_sec'] * 1000:.0f} ミリ秒）"
+    elif "ttft_sec" in metrics:
+        text = f"最初の応答まで {metrics['ttft_sec']:.1f} 秒 / 回答完了まで {metrics['total_sec']:.1f} 秒"
+        usage = metrics.get("usage")
+        if usage:
+            # OpenAIが数えた実際の値（cached_tokens はプロンプトキャッシュで処理された入力）
+            text += f" ・ 入力 {usage['prompt_tokens']} トークン（うちキャッシュ {usage['cached_tokens']}）/ 出力 {usage['completion_tokens']}"
+        elif "prompt_tokens" in metrics:
+            approx = "" if metrics["tokens_exact"] else "約"
+            text += f" ・ 入力 {approx}{metrics['prompt_tokens']} トークン（うちKPI_JSON {approx}{metrics['kpi_tokens']}）"
+    else:
+        return
+    cache = get_response_cache()
+    if cache is not None:
+        stats = cache.stats()
+        text += f" ・ 回答キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']}"
+    st.caption(text)
 
 
 #---------------------------------------------------------
 # メイン画面
 #---------------------------------------------------------
+CARD_GROUPS = ('elapsed', 'charts', 'log')  # 経過時間（カード1・4・6）・棒グラフ（カード2・5）・最新ログ（カード3）
+
+def render_card_error(data: DashboardData, card: str):
+    """取得に失敗・時間切れになったデータに頼るカード（CARD_GROUPS のいずれか）に、その内容を表示する"""
+    message = data.errors.get(card)
+    # すべてのカードが表示できない場合（Supabaseに接続できないときなど）は、画面の上に1つだけ表示する
+    if message and len(data.errors) < len(CARD_GROUPS):
+        st.warning(message)
+
 def main():
+    # 表示する家庭・赤ちゃん（以降の取得・キャッシュはすべてこの単位で分かれる）
+    tenant = current_tenant()
+
     # ヘッダー
     st.header("ベビーケア ダッシュボード")
     st.markdown("---")
 
-    # カード1用データ取得: 最新のおむつ替えからの経過時間を取得
-    elapsed_minutes = get_diaper_elapsed_time(table_name="baby_events")
-    DIAPER_MAX_MINUTES = 180 # グラフの上限を180分に設定
+    # 全カード共通: 分類ごとの最新イベント・日次合計・直近15日分のイベントを並行して取得し、以降のカードはここから導出する
+    # （サーバー側集計モードでは日次合計をRPCで受け取り、イベントは直近分だけ取得する）
+    # 描画するデータの版は取得の最初に確認した鮮度トークンから作り、取得中に入った記録も次の確認で検知できるようにする
+    data = fetch_dashboard_data(table_name="baby_events", tenant=tenant)
+    snapshot, daily_totals, rendered_version = data.snapshot, data.daily_totals, data.version
+
+    # カード1・4・6用: 分類ごとの最新イベント（1回のRPC）。フラグメントはこの時刻から経過時間を計算し直す
+    latest = data.latest
+    if len(data.errors) == len(CARD_GROUPS):
+        st.warning(data.errors['log'])
+    # 「ダッシュボード分析」ボタン用のKPI_JSONを、この版のデータでバックグラウンドで作っておく
+    prewarm_kpi_payload(data, tenant=tenant)
 
     # カード2用データ取得: 睡眠時間の日ごとの累計と前週平均 
-    sleep_chart_data, last_week_avg_sleep = get_sleep_summary_data(table_name="baby_events")
+    sleep_chart_data, last_week_avg_sleep = get_sleep_summary_data(table_name="baby_events", tenant=tenant, snapshot=snapshot, daily_totals=daily_totals)
 
-    # カード3用データ取得　Supabaseから最新ログデータを取得
-    supabase_log_data = get_supabase_data(table_name="baby_events") # テーブル名を編集
-
-    # カード4用データ取得: 最新の授乳からの経過時間を取得
-    elapsed_minutes_feeding = get_feeding_elapsed_time(table_name="baby_events")
-    FEEDING_MAX_MINUTES = 180 # 授乳グラフの上限を180分（3時間）に設定
+    # カード3用データ取得　スナップショットから最新ログデータを取得
+    latest_log_data = get_supabase_data(table_name="baby_events", tenant=tenant, snapshot=snapshot) # テーブル名を編集
 
     # カード5用データ取得: ミルク量の日ごとの累計と前週平均 
-    feeding_chart_data, last_week_avg_amount = get_feeding_summary_data(table_name="baby_events")
-    
-    # カード6用データ取得　Supabaseから最新の起床or就寝ログを取得
-    supabase_log_data = get_sleep_status_log(table_name="baby_events")  
-    latest_sleep_log = supabase_log_data[0] if supabase_log_data else None 
+    feeding_chart_data, last_week_avg_amount = get_feeding_summary_data(table_name="baby_events", tenant=tenant, snapshot=snapshot, daily_totals=daily_totals)
     
     
     
@@ -1191,18 +2194,17 @@ def main():
     
     # カード1: おむつ替え経過時間
     with cols[0]:
-        st.markdown('<div class="card-title">おむつ替え経過時間</div>', unsafe_allow_html=True)
-        # 経過時間と上限値(例：180分)を渡す
-        fig_diaper_progress = create_circular_progress(elapsed_minutes, DIAPER_MAX_MINUTES)
-        st.plotly_chart(fig_diaper_progress, use_container_width=True, config={'displayModeBar': False}, key="diaper_progress")
+        render_card_error(data, 'elapsed')
+        render_diaper_card(table_name="baby_events", tenant=tenant, latest=latest)
     
     # カード2: 睡眠時間 前週平均比較
     with cols[1]:
         st.markdown('<div class="card-title">睡眠時間 (h) 前週平均比較</div>', unsafe_allow_html=True)
+        render_card_error(data, 'charts')
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
         
         fig_sleep_chart = create_bar_chart(sleep_chart_data, "睡眠時間 前週平均比較", "#4A90E2", last_week_avg_sleep)
-        st.plotly_chart(fig_sleep_chart, use_container_width=True, config={'displayModeBar': False})
+        st.plotly_chart(fig_sleep_chart, use_container_width=True, config={'displayModeBar': False}, key="sleep_chart")
         
         st.markdown('</div>', unsafe_allow_html=True)
         
@@ -1210,6 +2212,7 @@ def main():
     # カード3: 最新ログ
     with cols[2]:
         st.markdown('<div class="card-title">最新ログ</div>', unsafe_allow_html=True)
+        render_card_error(data, 'log')
         st.markdown(
         """
         <div style="display: flex; flex-direction: column; align-items: center; height: 100%;">
@@ -1218,95 +2221,41 @@ def main():
         unsafe_allow_html=True
         )
         
-        #Supabaseのデータベースを表示
-        data = get_supabase_data()
-        if data:
-            st.dataframe(data)
+        #Supabaseのデータベースを表示（main()冒頭で取得済みの最新ログを使い回す）
+        if latest_log_data:
+            st.dataframe(latest_log_data)
         else:
             st.info("データがありません。テーブル名を確認してください。")
 
     
     # カード4: 授乳経過時間
     with cols[3]:
-        st.markdown('<div class="card-title">授乳経過時間</div>', unsafe_allow_html=True)
-        fig_feeding_progress = create_circular_progress(elapsed_minutes_feeding, FEEDING_MAX_MINUTES) 
-        st.plotly_chart(fig_feeding_progress, use_container_width=True, config={'displayModeBar': False}, key="feeding_progress")
+        render_card_error(data, 'elapsed')
+        render_feeding_card(table_name="baby_events", tenant=tenant, latest=latest)
     
     # カード5: ミルク量 前週平均比較
     with cols[4]:
         st.markdown('<div class="card-title">　ミルク量(ml)　前週平均比較</div>', unsafe_allow_html=True)
+        render_card_error(data, 'charts')
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
         # === 修正点: 動的データと前週平均を渡す ===
         fig_feeding_chart = create_bar_chart(feeding_chart_data, "ミルク量  前週平均比較", "#4A90E2", last_week_avg_amount)
-        st.plotly_chart(fig_feeding_chart, use_container_width=True, config={'displayModeBar': False})
+        st.plotly_chart(fig_feeding_chart, use_container_width=True, config={'displayModeBar': False}, key="feeding_chart")
         st.markdown('</div>', unsafe_allow_html=True)
         
     
     # カード6: 現在の起床/睡眠状態
     with cols[5]:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.markdown('<div class="card-title">今何してる</div>', unsafe_allow_html=True)
-        
-        # latest_sleep_logがmain()で定義されていることを前提とする
-        if latest_sleep_log:
-        
-            # 1. データベースの時刻はJSTとして扱う
-            log_time_jst = safe_to_jst(latest_sleep_log['datetime']) # ★ safe_to_jst を使用
-            current_time_jst = datetime.now(JST)
-            
-            # 2. 経過時間（分）を計算
-            delta = current_time_jst - log_time_jst
-            total_minutes = int(delta.total_seconds() / 60) # ★ total_minutesをここで定義
-
-            # 3. 状態、絵文字、表示テキストを決定
-            status_text_verb = ""
-            status_text_current = "" # 「起きています」/「寝ています」 
-            emoji = ""
-            
-            if latest_sleep_log.get('type_slug') == 'sleep_start':
-                status_text_verb = "就寝" # 表示文言を「就寝中」から「就寝」に変更
-                status_text_current = "寝ています"
-                emoji = "😴"
-            elif latest_sleep_log.get('type_slug') == 'sleep_end':
-                status_text_verb = "起床" # 表示文言を「起床中」から「起床」に変更
-                status_text_current = "起きています"
-                emoji = "🌞"
-            else:
-                status_text_verb = "不明"
-                status_text_current = "不明な状態"
-                emoji = "❓"
-
-            # 4. 経過時間を「〇時間〇分」形式に変換
-            hours = total_minutes // 60
-            minutes = total_minutes % 60
-            
-            if total_minutes < 1:
-                formatted_time_passed = "たった今"
-            elif hours == 0:
-                formatted_time_passed = f"{minutes}分経過"
-            else:
-                formatted_time_passed = f"{hours}時間{minutes}分経過" # 「経過」を削除
-                
-            # 5. HTML表示
-            st.markdown(
-                f"""
-                <div style="text-align: center;">
-                    <div style="font-size: 3.0rem; margin-bottom: 0.5rem;">
-                        {emoji}
-                    </div>
-                    <div style="font-size: 1.5rem; font-weight: bold; color: #3498db; margin-bottom: 0.5rem;">
-                        {status_text_current}
-                    </div>
-                    <div style="font-size: 1.0rem; color: #2c3e50;">
-                        {log_time_jst.strftime('%H:%M')}に{status_text_verb} &nbsp; | &nbsp; {formatted_time_passed}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        else:
-            st.info("就寝/起床ログがありません。")
-        st.markdown('</div>', unsafe_allow_html=True)
+        render_card_error(data, 'elapsed')
+        render_sleep_status_card(table_name="baby_events", tenant=tenant, latest=latest)
+
+    # 授乳・おむつ替えの間隔（直近14日、日ごとの中央値・90%）
+    render_interval_section(snapshot)
+    # 長期の推移（30日・90日・1年、週・月ごとの平均）
+    render_history_section(table_name="baby_events", tenant=tenant)
+
+    # 新しい記録が入ったら画面全体を描き直す（経過時間だけならカードのフラグメントが更新する）
+    watch_data_version(table_name="baby_events", tenant=tenant, rendered_version=rendered_version)
 
     #質問入力時、AIによる育児アドバイス部分に遷移するようにアンカーを設置。
     # ChatGPTによる回答表示欄
@@ -1314,11 +2263,6 @@ def main():
     st.header("AIによる育児アドバイス")
     st.markdown("---")
 
-    if 'chat_response' in st.session_state and st.session_state.chat_response: # セッションステートに回答が保存されていれば表示
-        st.info(st.session_state.chat_response)
-    else:
-        st.info("サイドバーから質問を入力してください。")
-
     if '_last_scrolled' not in st.session_state:
         st.session_state['_last_scrolled'] = 0
     #ボタン押下後にAIによる育児アドバイス部分までスクロールさせる処理
@@ -1351,6 +2295,16 @@ def main():
         #消費したトリガーを記録
         st.session_state['_last_scrolled'] = st.session_state['scroll_trigger']
 
+    # サイドバーで受け付けた質問があれば、ダッシュボードを描き終えたこの位置で回答を生成する
+    pending = st.session_state.get('pending_question')
+    if pending:
+        render_streamed_advice(pending, data=data, tenant=tenant)
+    elif 'chat_response' in st.session_state and st.session_state.chat_response: # セッションステートに回答が保存されていれば表示
+        st.info(st.session_state.chat_response)
+        render_advice_caption(st.session_state.get('chat_metrics'))
+    else:
+        st.info("サイドバーから質問を入力してください。")
+
     
 #---------------------------------------------------------
 # サイドバー（質問・相談機能）
@@ -1364,14 +2318,23 @@ with st.sidebar:
         st.session_state.chat_response = ""
     if 'scroll_trigger' not in st.session_state: #スクロールのために追加
         st.session_state.scroll_trigger = 0 #初期化する
+    if 'pending_question' not in st.session_state: # 回答待ちの質問（ストリーミング表示用）
+        st.session_state.pending_question = None
 
     # チャット入力
     user_input = st.text_area("", placeholder="入力してください...", key="chat_input", height=150)
     
-    def fire_and_scroll(text: str, include_kpi: bool = True):
-        st.session_state.chat_response = ask_gpt_with_optional_kpi(text, include_kpi=include_kpi)
+    def fire_and_scroll(text: str, include_kpi: bool = True, use_digest: bool = True):
+        # ここではGPTを呼ばず質問を受け付けるだけにする（回答は main() がダッシュボードを描いた後にストリーミングで表示）
+        # 生成中に新しい質問が来た場合は、この再実行で前の生成が打ち切られ、新しい質問に置き換わる
+        # use_digest=False は夜間に作成した分析を使わず、その場で生成する（「最新のデータで分析し直す」）
+        st.session_state.pending_question = {
+            "id": st.session_state.get("scroll_trigger", 0) + 1,
+            "text": text,
+            "include_kpi": include_kpi,
+            "use_digest": use_digest,
+        }
         st.session_state.scroll_trigger = st.session_state.get("scroll_trigger", 0) + 1#毎回トリガー値が変わり、HTMLの中身が変わってJSが再実行される
-        st.rerun()
 
     if st.button("検索 🔎", key="send_button", use_container_width=True):
         if user_input and user_input.strip():
@@ -1384,14 +2347,7 @@ with st.sidebar:
     st.subheader("") #スペース
     st.subheader("ダッシュボード分析") #よく使う質問→ダッシュボード分析
     
-    questions = [
-        "睡眠パターンを分析して",
-        "授乳間隔を分析して", 
-        "おむつ替えタイミングを分析して",
-        "ミルク量を分析して"
-    ]
-    
-    for idx, question in enumerate(questions):
+    for idx, question in enumerate(ANALYSIS_QUESTIONS):
         if st.button(question, key=f"quick_q_{idx}", use_container_width=True):
             fire_and_scroll(question, include_kpi=True)
 
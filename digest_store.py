@@ -0,0 +1,81 @@
+"""
+夜間に作成した分析（ダイジェスト）の保存先（SQLite）
+
+digest_worker.py が赤ちゃん（テナント）ごとに「ダッシュボード分析」の4つの質問の回答を作って保存し、
+ダッシュボードはボタンが押されたときにOpenAIを呼ばずにここから返す。
+- キーは（赤ちゃんの識別子 Tenant.digest_scope, 分析の種類 kpi_prompt.analysis_type）。同じキーは新しい回答で上書きする
+- 回答を作ったときのKPI_JSONと作成時刻も保存する（古すぎるものは読むときに除く）
+- ワーカーとダッシュボードは別プロセスなので、同じファイルを開く（書き込みはWALモードで読み込みを止めない）
+"""
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+create table if not exists ai_digests (
+    scope text not null,
+    analysis_type text not null,
+    question text not null,
+    response text not null,
+    kpi_json text not null,
+    model text not null,
+    generated_at real not null,
+    primary key (scope, analysis_type)
+);
+"""
+
+
+class DigestStore:
+    """テナント×分析の種類ごとに最新の回答を1件保存する"""
+
+    def __init__(self, path: str = "gpt_digests.db"):
+        # Streamlitのセッション・ワーカーのスレッドから使うため、接続を共有してロックで守る
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("pragma journal_mode=wal")
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def put(self, scope: str, analysis_type: str, question: str, response: str, kpi_json: str, model: str,
+            generated_at: float | None = None):
+        with self._lock:
+            self._conn.execute(
+                "insert into ai_digests (scope, analysis_type, question, response, kpi_json, model, generated_at) "
+                "values (?, ?, ?, ?, ?, ?, ?) "
+                "on conflict(scope, analysis_type) do update set question = excluded.question, "
+                "response = excluded.response, kpi_json = excluded.kpi_json, model = excluded.model, "
+                "generated_at = excluded.generated_at",
+                (scope, analysis_type, question, response, kpi_json, model,
+                 generated_at if generated_at is not None else time.time()),
+            )
+            self._conn.commit()
+
+    def get(self, scope: str, analysis_type: str, max_age_seconds: float | None = None) -> dict | None:
+        """
+        保存済みの回答。なければ（max_age_seconds より古ければ）None。
+
+        Returns:
+            dict | None: question, response, kpi_json, model, generated_at（UNIX時刻）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "select question, response, kpi_json, model, generated_at from ai_digests "
+                "where scope = ? and analysis_type = ?",
+                (scope, analysis_type),
+            ).fetchone()
+        if row is None:
+            return None
+        digest = dict(zip(("question", "response", "kpi_json", "model", "generated_at"), row))
+        if max_age_seconds is not None and time.time() - digest["generated_at"] > max_age_seconds:
+            return None
+        return digest
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("select count(*) from ai_digests").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
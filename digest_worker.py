@@ -0,0 +1,250 @@
+"""
+夜間バッチ: 赤ちゃんごとの「ダッシュボード分析」の回答（ダイジェスト）を作って保存する
+
+直近に記録のある赤ちゃん（テナント）ごとに、ダッシュボードと同じ関数で KPI_JSON を作り
+（fetch_dashboard_data → build_kpi_payload_for_gpt）、サイドバーの4つの質問（ANALYSIS_QUESTIONS）の回答を
+OpenAIに作らせて digest_store.py に保存する。ダッシュボードはボタンが押されたら保存済みの回答をすぐに表示する。
+- 回答の作成は --workers 個のスレッドで並行して行う（赤ちゃん×質問ごとに1件）
+- レート制限（429）・タイムアウト・5xx・接続エラーは、Retry-After（なければ指数バックオフ＋ジッター）だけ待って再試行する。
+  429を受けたら、ほかのワーカーも Retry-After まで送信を止める
+- 1件ずつの使用量・再試行の回数は gpt_metrics.jsonl にも記録する（python gpt_metrics.py で集計）
+
+使い方:
+    python digest_worker.py                              # 直近7日に記録のあるすべての赤ちゃん
+    python digest_worker.py --baby-id b-123              # 1人分だけ（--household-id でその家庭の赤ちゃんだけ）
+    python digest_worker.py --workers 8 --max-retries 6
+    python digest_worker.py --active-days 3
+
+接続先・APIキーは dashboard.py と同じく .env の SUPABASE_URL / SUPABASE_KEY / OPENAI_API_KEY を使う。
+家庭ごとのRLS（supabase/migrations/20261017120000_baby_rls.sql）を入れた構成では、すべての家庭を読むため
+SUPABASE_KEY に service_role のキーを指定する。
+OPENAI_BASE_URL を指定すると、ローカルの代替サーバー（benchmarks/fake_openai_server.py）に送れる。
+保存先は BABY_DIGEST_PATH（既定 gpt_digests.db）。cron などで毎晩実行する:
+    0 3 * * * cd /path/to/app && python digest_worker.py >> digest_worker.log 2>&1
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from digest_store import DigestStore
+from kpi_prompt import analysis_type
+from tenancy import SINGLE_TENANT, Tenant
+
+logger = logging.getLogger("baby_dashboard")
+
+# 再試行するHTTPステータス（ほかに5xx。ステータスのない接続エラー・タイムアウトも再試行する）
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+def load_dashboard():
+    """
+    dashboard.py を画面なしで読み込む（Streamlitのウィジェットは何もしない）。
+    バッチでは購読・ディスクのイベントキャッシュ・KPI_JSONの事前計算を使わない（環境変数で指定があればそちらを優先）。
+    再試行は run_job が全ワーカーで揃えて行うため、openai パッケージの自動再試行は使わない。
+    """
+    os.environ.setdefault("BABY_REALTIME", "0")
+    os.environ.setdefault("BABY_EVENT_CACHE", "0")
+    os.environ.setdefault("BABY_KPI_PREWARM", "0")
+    os.environ.setdefault("BABY_OPENAI_MAX_RETRIES", "0")
+    # 画面なしで読み込むときの警告（missing ScriptRunContext など）を出さない
+    # （設定を読み込むとログのレベルが設定値に戻るため、先に読み込ませてから下げる）
+    import streamlit.logger
+    from streamlit import config
+    config.get_option("logger.level")
+    streamlit.logger.set_log_level("error")
+    import dashboard
+    return dashboard
+
+
+class DigestJob(NamedTuple):
+    tenant: Tenant
+    question: str
+    kpi_json: str
+
+
+class DigestResult(NamedTuple):
+    job: DigestJob
+    ok: bool
+    attempts: int
+    error: str | None = None
+
+
+class RateLimitGate:
+    """429を受けたワーカーが hold した時刻まで、すべてのワーカーの送信を止める（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0
+
+    def hold(self, seconds: float):
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + seconds)
+
+    def wait(self, sleep=time.sleep):
+        while True:
+            with self._lock:
+                delay = self._until - time.monotonic()
+            if delay <= 0:
+                return
+            sleep(delay)
+
+
+def is_retryable(metrics: dict) -> bool:
+    """get_chat_response の metrics から、再試行すれば成功しうる失敗か（APIキーなし・400番台は再試行しない）"""
+    if metrics.get("completed") or not metrics.get("error"):
+        return False
+    status = metrics.get("error_status")
+    return status is None or status in RETRYABLE_STATUS or status >= 500
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: float | None = None) -> float:
+    """
+    attempt 回目（0始まり）の失敗のあとに待つ秒数。
+    Retry-After があればそれに少しのジッターを足し、なければ min(cap, base * 2**attempt) までの一様乱数（フルジッター）。
+    """
+    if retry_after is not None:
+        return min(cap, retry_after + random.uniform(0, base))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def active_tenants(client, days: int = 7, table_name: str = "baby_events", page_size: int = 1000) -> list[Tenant]:
+    """
+    直近 days 日にイベントのある赤ちゃん（household_id, baby_id）。idの順にページ分けして読む。
+    baby_id のない行（テナント列を追加する前の記録）は、どの赤ちゃんの分析にも含めない。
+    ただし baby_id のある行が1件もない構成（1家庭だけで使う既存の構成）では、絞り込みなし（SINGLE_TENANT）の1件を返す。
+    """
+    since = (datetime.now() - timedelta(days=days)).isoformat()
+    tenants: dict[Tenant, None] = {}
+    unscoped = False
+    last_id = None
+    while True:
+        query = client.table(table_name).select("id, household_id, baby_id").gte("datetime", since)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(page_size).execute().data or []
+        for row in rows:
+            if row.get("baby_id") is None:
+                unscoped = True
+            else:
+                tenants.setdefault(Tenant(row.get("household_id"), row.get("baby_id")), None)
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1]["id"]
+    if not tenants:
+        return [SINGLE_TENANT] if unscoped else []
+    if unscoped:
+        logger.warning("Skipping events without baby_id (they are not part of any baby's digest)")
+    return list(tenants)
+
+
+def build_jobs(dash, tenant: Tenant, table_name: str = "baby_events") -> list[DigestJob]:
+    """tenant のKPIペイロードを1回作り、質問ごとのKPI_JSONにする（データを取得できない・保存先のキーがなければ例外）"""
+    if tenant.digest_scope is None:
+        raise ValueError("分析は赤ちゃんごとに作るため、baby_id を指定してください")
+    data = dash.fetch_dashboard_data(table_name, tenant)
+    if data.errors:
+        failed = ", ".join(f"{card}: {error}" for card, error in data.errors.items())
+        raise RuntimeError(f"データを取得できませんでした（{failed}）")
+    if data.snapshot.empty:
+        return []
+    payload = dash.build_kpi_payload_for_gpt(data.snapshot, data.daily_totals, tenant, latest=data.latest)
+    return [DigestJob(tenant, question, dash.encode_kpi_payload(payload, question)) for question in dash.ANALYSIS_QUESTIONS]
+
+
+def run_job(dash, store: DigestStore, gate: RateLimitGate, job: DigestJob, max_retries: int = 4,
+            backoff_base: float = 1.0, backoff_max: float = 60.0, sleep=time.sleep) -> DigestResult:
+    """1件の回答を作って保存する。再試行できる失敗は max_retries 回まで待って送り直す"""
+    instruction = dash.build_gpt_instruction(job.question, include_kpi=True)
+    prompt = dash.build_gpt_prompt(job.question, kpi_json=job.kpi_json)
+    attempt = 0
+    while True:
+        gate.wait(sleep)
+        metrics = {"attempts": attempt + 1}
+        response = dash.get_chat_response(prompt, instruction=instruction, metrics=metrics)
+        dash.record_gpt_metrics(job.question, metrics)
+        if metrics.get("completed"):
+            store.put(job.tenant.digest_scope, analysis_type(job.question), job.question, response, job.kpi_json, dash.GPT_MODEL)
+            return DigestResult(job, True, attempt + 1)
+        if attempt >= max_retries or not is_retryable(metrics):
+            return DigestResult(job, False, attempt + 1, metrics.get("error") or response)
+        delay = backoff_delay(attempt, backoff_base, backoff_max, metrics.get("retry_after"))
+        if metrics.get("error_status") == 429:
+            gate.hold(delay)
+        logger.warning("Retrying digest %s / %s in %.1fs (attempt %d, status %s)", job.tenant.label(),
+                       analysis_type(job.question), delay, attempt + 1, metrics.get("error_status"))
+        sleep(delay)
+        attempt += 1
+
+
+def run(dash, store: DigestStore, tenants: list[Tenant], workers: int = 4, max_retries: int = 4,
+        backoff_base: float = 1.0, backoff_max: float = 60.0, echo=print) -> list[DigestResult]:
+    """tenants のダイジェストをすべて作る。データを取得できなかった赤ちゃんは飛ばす（結果に含めない）"""
+    gate = RateLimitGate()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="digest") as executor:
+        jobs = []
+        for tenant, future in [(tenant, executor.submit(build_jobs, dash, tenant)) for tenant in tenants]:
+            try:
+                jobs.extend(future.result())
+            except Exception as e:
+                echo(f"{tenant.label()}: 飛ばしました（{e}）")
+        futures = [executor.submit(run_job, dash, store, gate, job, max_retries, backoff_base, backoff_max) for job in jobs]
+        results = []
+        for future in futures:
+            result = future.result()
+            status = "OK" if result.ok else f"失敗（{result.error}）"
+            echo(f"{result.job.tenant.label()} / {analysis_type(result.job.question)}: {status}・{result.attempts} 回")
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="赤ちゃんごとのダッシュボード分析の回答を作って保存する")
+    parser.add_argument("--baby-id", help="この赤ちゃんだけ作る（省略時は直近に記録のあるすべての赤ちゃん）")
+    parser.add_argument("--household-id", help="この家庭の（直近に記録のある）赤ちゃんだけ作る")
+    parser.add_argument("--active-days", type=int, default=7, help="この日数以内に記録のある赤ちゃんを対象にする")
+    parser.add_argument("--workers", type=int, default=4, help="並行して送るリクエストの数")
+    parser.add_argument("--max-retries", type=int, default=4, help="1件あたりの再試行の回数")
+    parser.add_argument("--backoff-base", type=float, default=1.0, help="指数バックオフの初回の秒数")
+    parser.add_argument("--backoff-max", type=float, default=60.0, help="1回に待つ最長の秒数")
+    args = parser.parse_args()
+    # このアプリのログだけINFOから出す（HTTPクライアントの1リクエストごとのログは出さない）
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    logger.setLevel(logging.INFO)
+
+    dash = load_dashboard()
+    if not dash.DIGEST_PATH:
+        sys.exit("BABY_DIGEST_PATH が空のため、保存先がありません")
+    if dash.get_api_key() is None:
+        sys.exit("OPENAI_API_KEY が設定されていません（.env を確認してください）")
+
+    if args.baby_id:
+        tenants = [Tenant(args.household_id, args.baby_id)]
+    else:
+        tenants = active_tenants(dash.supabase_client, args.active_days)
+        if args.household_id:
+            tenants = [tenant for tenant in tenants if tenant.household_id == args.household_id]
+    if not tenants:
+        print(f"直近{args.active_days}日に記録のある赤ちゃんがいません")
+        return
+
+    store = DigestStore(dash.DIGEST_PATH)
+    started = time.perf_counter()
+    results = run(dash, store, tenants, workers=args.workers, max_retries=args.max_retries,
+                  backoff_base=args.backoff_base, backoff_max=args.backoff_max)
+    failed = [result for result in results if not result.ok]
+    print(f"{len(tenants)} 人・{len(results)} 件中 {len(results) - len(failed)} 件を保存しました"
+          f"（再試行 {sum(result.attempts - 1 for result in results)} 回、{time.perf_counter() - started:.1f} 秒）")
+    store.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+baby_events のローカル列指向キャッシュ（Arrow IPC / Feather v2）
+
+イベントストア（event_store.EventStore）の内容をテナントごとのディレクトリにArrow IPCファイルとして保存する。
+- 差分取得で増えた行は小さなセグメントファイル（part-XXXXXX.arrow）として追記する
+- 起動時はセグメントをメモリマップで開き、期間内の行だけをArrowのまま絞り込んでからpandasに変換する
+  （数値・時刻列は変換時にコピーしない。ファイル全体をメモリに読み込むこともない。種別の列はカテゴリ型になる）
+- セグメントが増えたとき・行の削除があったときは、現在の内容で1ファイルに作り直す（コンパクション）
+- 取得位置（last_id・last_seen）・修正/削除の回数・鮮度トークンは meta.json に保存し、再起動後も前回の続きから差分だけを取得する
+
+Supabaseに接続できない間も、ダッシュボードは保存済みの内容で表示を続けられる（読み取り専用）。
+書き込みは一時ファイルに書いてから置き換えるため、途中で止まっても壊れたファイルは残らない。
+"""
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from tenancy import SINGLE_TENANT, Tenant
+
+# イベントストアと同じく型を詰めて保存する（時刻はエポックミリ秒、種別は辞書エンコード、量はfloat32）
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("datetime", pa.timestamp("ms", tz="Asia/Tokyo")),
+    ("type_slug", pa.dictionary(pa.int16(), pa.string())),
+    ("type_jp", pa.dictionary(pa.int16(), pa.string())),
+    ("amount_ml", pa.float32()),
+])
+# 保存形式の版。SCHEMAを変えたら上げる（版の異なる保存内容は読まずに消す）
+CACHE_FORMAT = 2
+SEGMENT_PATTERN = re.compile(r"^part-(\d{6})\.arrow$")
+
+
+class EventCache:
+    """テナントごとのイベントをArrow IPCのセグメントファイルとして保存するキャッシュ"""
+
+    def __init__(self, directory: str, table_name: str = "baby_events", tenant: Tenant = SINGLE_TENANT,
+                 max_segments: int = 32):
+        # テナントごとに別ディレクトリにする（ファイル名に使えない文字は置き換える）
+        name = re.sub(r"[^A-Za-z0-9_.=-]", "_", f"{table_name}-{tenant.label()}")
+        self.path = os.path.join(directory, name)
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    # ---------------------------------------------------------
+    # 読み込み
+    # ---------------------------------------------------------
+    def load(self, since: datetime | None = None) -> tuple[pd.DataFrame | None, dict]:
+        """
+        保存済みのイベントとメタデータを読み込む。
+
+        Args:
+            since: この時刻（JST）以降の行だけを返す（Arrowのまま絞り込む）
+        Returns:
+            tuple[pd.DataFrame | None, dict]: (古い順のイベント。保存がなければNone, {"last_seen", "last_id", "changes", "freshness", "synced_at"})
+        """
+        with self._lock:
+            segments = self._segments()
+            if not segments:
+                return None, {}
+            meta = self._read_meta()
+            if meta.get("format") != CACHE_FORMAT:
+                self._clear()
+                return None, {}
+            table = pa.concat_tables([self._read(name) for name in segments])
+        if since is not None:
+            table = table.filter(pc.greater_equal(table["datetime"], pa.scalar(pd.Timestamp(since), SCHEMA.field("datetime").type)))
+        # 辞書エンコードの列はカテゴリ型になる（セグメントごとに異なる辞書は変換時にまとめられる）
+        frame = table.to_pandas(split_blocks=True)
+        # 同じidの行は後のセグメント（新しい取得）を優先する
+        if frame['id'].notna().all():
+            frame = frame.drop_duplicates(subset='id', keep='last')
+        return frame.sort_values('datetime', kind='stable').reset_index(drop=True), meta
+
+    # ---------------------------------------------------------
+    # 書き込み
+    # ---------------------------------------------------------
+    def append(self, rows: pd.DataFrame, meta: dict, snapshot: pd.DataFrame | None = None):
+        """
+        差分の行をセグメントとして追記し、メタデータを更新する。
+        セグメント数が上限を超えた場合は snapshot（ストアの現在の内容）で作り直す。
+        """
+        with self._lock:
+            if not rows.empty:
+                segments = self._segments()
+                if snapshot is not None and len(segments) >= self.max_segments:
+                    self._rewrite(snapshot, segments)
+                else:
+                    self._write(self._next_segment(segments), rows)
+            self._write_meta(meta)
+
+    def rewrite(self, frame: pd.DataFrame, meta: dict):
+        """現在の内容で1ファイルに作り直す（行の削除・期間外の行の整理）"""
+        with self._lock:
+            self._rewrite(frame, self._segments())
+            self._write_meta(meta)
+
+    def save_meta(self, meta: dict):
+        with self._lock:
+            self._write_meta(meta)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # ---------------------------------------------------------
+    # ファイル操作（ロックを取った状態で呼ぶ）
+    # ---------------------------------------------------------
+    def _segments(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.path) if SEGMENT_PATTERN.match(name))
+
+    def _clear(self):
+        for name in self._segments():
+            os.remove(os.path.join(self.path, name))
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+    def _next_segment(self, segments: list[str]) -> str:
+        last = int(SEGMENT_PATTERN.match(segments[-1]).group(1)) if segments else 0
+        return f"part-{last + 1:06d}.arrow"
+
+    def _read(self, name: str) -> pa.Table:
+        # メモリマップで開く（読み込んだ列はファイルのページを直接参照する）
+        with pa.memory_map(os.path.join(self.path, name), "r") as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _write(self, name: str, frame: pd.DataFrame):
+        table = pa.Table.from_pandas(frame[SCHEMA.names], preserve_index=False).cast(SCHEMA)
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        # メモリマップで読めるよう非圧縮で書く
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+            writer.write_table(table)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def _rewrite(self, frame: pd.DataFrame, segments: list[str]):
+        name = self._next_segment(segments)
+        self._write(name, frame)
+        for old in segments:
+            os.remove(os.path.join(self.path, old))
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, meta: dict):
+        tmp = os.path.join(self.path, ".meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**meta, "format": CACHE_FORMAT}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
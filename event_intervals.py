@@ -0,0 +1,107 @@
+"""
+授乳・おむつ替えの間隔の集計
+
+古い順のイベント（event_store の型を詰めたDataFrame）から、分類ごとの記録の間隔を配列演算で求める。
+- 間隔: 分類（授乳・おむつ）の記録時刻を並べた配列の差（np.diff）。1回の走査で全期間分を求める
+- 同じ回の記録（ミルクと母乳、おしっことうんちを続けて記録した場合など）は、SAME_SESSION_MINUTES 未満の間隔として除く
+- 昼・夜: 間隔の中間の時刻（JST）が NIGHT_START_HOUR〜NIGHT_END_HOUR なら夜
+- 日ごと: 間隔が終わった日（次の記録の日）ごとの中央値・90パーセンタイル・最長
+
+時刻はミリ秒のint64のまま計算し、Pythonの繰り返しは使わない（90日分以上でも画面表示のたびに計算できる）。
+計算時間は benchmarks/interval_benchmark.py で計測できる。
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from event_store import CATEGORY_SLUGS, JST, select_events
+
+INTERVAL_CATEGORIES = ("feeding", "diaper")
+SAME_SESSION_MINUTES = 10
+NIGHT_START_HOUR = 20  # 夜: 20時〜翌6時
+NIGHT_END_HOUR = 6
+
+MS_PER_MINUTE = 60_000
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 86_400_000
+
+def compute_intervals(frame: pd.DataFrame, category: str, min_gap_minutes: float = SAME_SESSION_MINUTES) -> pd.DataFrame:
+    """
+    分類（CATEGORY_SLUGS のキー）の記録の間隔を求める。
+
+    Args:
+        frame: 古い順のイベントDataFrame（datetime(JST), type_slug 列）
+        category: 'feeding' / 'diaper' など
+        min_gap_minutes: これより短い間隔は同じ回の記録とみなして除く
+    Returns:
+        pd.DataFrame: start, end（JSTのdatetime）, minutes, date（終わった日）, night（夜の間隔か）列。古い順
+    """
+    rows = select_events(frame, type_slugs=CATEGORY_SLUGS[category])
+    # JSTの壁時計時刻のエポックミリ秒（int64）にして計算する
+    times = rows['datetime'].dt.tz_localize(None).to_numpy(dtype='datetime64[ms]').astype(np.int64)
+
+    gaps = np.diff(times)
+    keep = gaps >= min_gap_minutes * MS_PER_MINUTE
+    starts = times[:-1][keep]
+    ends = times[1:][keep]
+    middle_hours = ((starts + ends) // 2 // MS_PER_HOUR) % 24
+
+    return pd.DataFrame({
+        'start': pd.DatetimeIndex(starts.astype('datetime64[ms]')).tz_localize(JST),
+        'end': pd.DatetimeIndex(ends.astype('datetime64[ms]')).tz_localize(JST),
+        'minutes': gaps[keep] / MS_PER_MINUTE,
+        'date': pd.DatetimeIndex((ends // MS_PER_DAY).astype('datetime64[D]')).date,
+        'night': (middle_hours >= NIGHT_START_HOUR) | (middle_hours < NIGHT_END_HOUR),
+    })
+
+def daily_interval_stats(intervals: pd.DataFrame) -> pd.DataFrame:
+    """
+    日ごと（間隔が終わった日）の間隔の統計。
+
+    Returns:
+        pd.DataFrame: date, count, median, p90, longest（分）列。間隔のある日だけ、古い順
+    """
+    grouped = intervals.groupby('date', sort=True)['minutes']
+    daily = pd.DataFrame({
+        'count': grouped.size(),
+        'median': grouped.median(),
+        'p90': grouped.quantile(0.9),
+        'longest': grouped.max(),
+    })
+    daily.index.name = 'date'
+    return daily.reset_index()
+
+def summarize_intervals(intervals: pd.DataFrame) -> dict:
+    """
+    期間全体の間隔の要約（分）。間隔がなければ数値はNone。
+
+    Returns:
+        dict: count, median, p90, day_median, night_median, longest, longest_start, longest_end
+    """
+    minutes = intervals['minutes'].to_numpy()
+    night = intervals['night'].to_numpy()
+
+    def median(values: np.ndarray) -> float | None:
+        return round(float(np.median(values)), 1) if values.size else None
+
+    summary = {
+        'count': int(minutes.size),
+        'median': median(minutes),
+        'p90': round(float(np.percentile(minutes, 90)), 1) if minutes.size else None,
+        'day_median': median(minutes[~night]),
+        'night_median': median(minutes[night]),
+        'longest': None,
+        'longest_start': None,
+        'longest_end': None,
+    }
+    if minutes.size:
+        i = int(np.argmax(minutes))
+        summary['longest'] = round(float(minutes[i]), 1)
+        summary['longest_start'] = intervals['start'].iloc[i].strftime('%m/%d %H:%M')
+        summary['longest_end'] = intervals['end'].iloc[i].strftime('%m/%d %H:%M')
+    return summary
+
+def intervals_since(intervals: pd.DataFrame, since: datetime) -> pd.DataFrame:
+    """since（JST）以降に終わった間隔（古い順なので二分探索で切り出す）"""
+    return intervals.iloc[int(intervals['end'].searchsorted(pd.Timestamp(since).ceil('ms'))):]
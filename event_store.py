@@ -0,0 +1,495 @@
+"""
+baby_events のイベントストア
+
+ダッシュボードの各カードが使うイベント（直近15日分）をプロセス内に保持し、
+前回取得した最新時刻以降の差分だけをSupabaseから取得して追記する。
+あわせて、日ごとのミルク量・睡眠時間の合計を保持し、差分で影響を受けた日だけ再計算する。
+
+イベントは型を詰めたDataFrame（events_to_frame）で保持する。1行あたり約20バイト（辞書のリストでは約1KB）:
+    id        : int64
+    datetime  : datetime64[ms, Asia/Tokyo]（中身はエポックミリ秒のint64）
+    type_slug : カテゴリ型（int8のコード＋種別の一覧）
+    type_jp   : カテゴリ型（int8のコード＋表示名の一覧）
+    amount_ml : float32
+時刻は古い順に並べて持つため、期間の切り出しは二分探索、種別の絞り込みはコードの配列比較になる（select_events）。
+
+時刻の扱いは dashboard.py の safe_to_jst と同じく、DBの時刻表記をそのままJSTとみなす。
+"""
+import logging
+import threading
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+from pandas.api.types import union_categoricals
+
+from tenancy import SINGLE_TENANT, Tenant
+
+JST = pytz.timezone('Asia/Tokyo')
+
+logger = logging.getLogger("baby_dashboard")
+
+EVENT_COLUMNS = ["id", "datetime", "type_slug", "type_jp", "amount_ml"]
+CATEGORICAL_COLUMNS = ["type_slug", "type_jp"]
+SLEEP_SLUGS = ['sleep_start', 'sleep_end']
+
+# カードごとの分類（リアルタイム更新で「どのカードに影響したか」を判定するため）
+CATEGORY_SLUGS = {
+    "diaper": ['diaper_pee', 'diaper_poop'],
+    "feeding": ['formula', 'breast'],
+    "sleep": SLEEP_SLUGS,
+}
+# type_slug のカテゴリの並び（既知の種別を先頭に固定し、未知の種別は後ろに追加する）
+KNOWN_SLUGS = [slug for slugs in CATEGORY_SLUGS.values() for slug in slugs]
+
+# ---------------------------------------------------------
+# 時刻の一括変換
+# ---------------------------------------------------------
+# 末尾のタイムゾーン表記（Z / +09:00 / -0500 など）。時刻部分（HH:MM[:SS[.ffffff]]）の直後にあるものだけを対象にする
+_TZ_SUFFIX_PATTERN = r'(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)(?:Z|[+-]\d{2}(?::?\d{2})?)$'
+# events_to_frame の結果の attrs に入れる、時刻を解析できなかった行数（画面への警告は dashboard.py が出す）
+UNPARSED_ATTR = "unparsed_datetimes"
+
+def parse_jst_series(values: pd.Series) -> tuple[pd.Series, int]:
+    """
+    datetime文字列の列をまとめてJSTのdatetime64[ns, Asia/Tokyo]列に変換する（safe_to_jstの一括版）。
+
+    safe_to_jstと同じ前提で、末尾のZやオフセットは取り除き、表記された時刻をそのままJSTとみなす。
+    解析できなかった行は現在時刻（JST）で代替し、ログは行ごとではなく1回にまとめて出す。
+
+    Args:
+        values: データベースから取得したdatetime文字列のSeries
+
+    Returns:
+        tuple[pd.Series, int]: dtypeが datetime64[ns, Asia/Tokyo] のSeries（indexは入力と同じ）と、解析できなかった行数
+    """
+    text = values.astype('string').str.strip()
+    # Z・オフセットを取り除き（ナイーブ化）、JSTとして確定する
+    naive_text = text.str.replace(_TZ_SUFFIX_PATTERN, r'\1', regex=True)
+    parsed = pd.to_datetime(naive_text, format='ISO8601', errors='coerce')
+    parsed = parsed.dt.tz_localize(JST).dt.as_unit('ns')
+
+    failed = parsed.isna()
+    if failed.any():
+        # 変換エラーの行は現在時刻（JST）で代替（safe_to_jstと同じ扱い）
+        samples = ", ".join(str(v) for v in values[failed].head(3))
+        logger.warning("Could not parse %d event datetimes (e.g. %s); using the current time instead", int(failed.sum()), samples)
+        parsed = parsed.fillna(pd.Timestamp(datetime.now(JST)))
+
+    return parsed, int(failed.sum())
+
+def events_to_frame(rows: list[dict]) -> pd.DataFrame:
+    """
+    Supabaseのレスポンス（辞書のリスト）を、型を詰めたイベント用DataFrameに変換する。
+    datetime列はJSTとして解釈し、古い順に並べて返す。時刻を解析できなかった行数は attrs[UNPARSED_ATTR] に入れる。
+    """
+    df = pd.DataFrame(rows, columns=EVENT_COLUMNS)
+
+    # データベースの時刻はJSTとして扱う（全行を一括で変換。0件でも列の型はそろえる）
+    parsed, unparsed = parse_jst_series(df['datetime'])
+    df['datetime'] = parsed.dt.as_unit('ms')
+    df.attrs[UNPARSED_ATTR] = unparsed
+    slugs = df['type_slug'].dropna().unique()
+    df['type_slug'] = pd.Categorical(df['type_slug'], categories=KNOWN_SLUGS + sorted(set(slugs) - set(KNOWN_SLUGS)))
+    df['type_jp'] = df['type_jp'].astype('category')
+    df['amount_ml'] = pd.to_numeric(df['amount_ml'], errors='coerce').astype('float32')
+    return df.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+def concat_events(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    イベント用DataFrameを連結する。
+    カテゴリの一覧が異なるとpd.concatは文字列の列に戻してしまうため、カテゴリ列は一覧の和集合でつなぎ直す。
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return events_to_frame([])
+    if len(frames) == 1:
+        return frames[0]
+    merged = pd.concat(frames, ignore_index=True)
+    for column in CATEGORICAL_COLUMNS:
+        if not isinstance(merged[column].dtype, pd.CategoricalDtype):
+            merged[column] = union_categoricals([frame[column] for frame in frames], ignore_order=True)
+    return merged
+
+def _search_time(frame: pd.DataFrame, moment: datetime) -> int:
+    """
+    datetime列で moment 以降になる最初の位置。
+    列の中身（UTCのエポックミリ秒）を直接二分探索する。境界はミリ秒に切り上げる（[start, end) の判定を保つ）。
+    """
+    epoch_ms = -(-pd.Timestamp(moment).value // 1_000_000)
+    return int(np.searchsorted(frame['datetime'].values, np.datetime64(epoch_ms, 'ms')))
+
+def select_events(frame: pd.DataFrame, start: datetime | None = None, end: datetime | None = None,
+                  type_slugs: list[str] | None = None) -> pd.DataFrame:
+    """
+    古い順のイベントDataFrameから、期間 [start, end) と種別で行を切り出す。
+
+    期間は datetime 列の二分探索で、種別は type_slug のカテゴリコードの配列比較で絞り込む
+    （文字列の比較は種別の一覧に対して1回だけ）。
+
+    Args:
+        start / end: JSTのdatetime（Noneなら制限なし）
+        type_slugs: 対象の type_slug（Noneなら全種別）
+    """
+    lo = _search_time(frame, start) if start is not None else 0
+    hi = _search_time(frame, end) if end is not None else len(frame)
+    rows = frame.iloc[lo:hi]
+    if type_slugs is None or rows.empty:
+        return rows
+    slug_column = rows['type_slug']
+    if not isinstance(slug_column.dtype, pd.CategoricalDtype):
+        return rows[slug_column.isin(type_slugs)]
+    wanted = set(type_slugs)
+    codes = [code for code, slug in enumerate(slug_column.cat.categories) if slug in wanted]
+    return rows.take(np.flatnonzero(np.isin(slug_column.array.codes, codes)))
+
+def latest_events_from_frame(frame: pd.DataFrame) -> dict[str, dict]:
+    """
+    古い順のイベントDataFrameから、分類（CATEGORY_SLUGS）ごとの最新イベントを取り出す。
+    RPC baby_latest_events と同じ形（{分類: 行の辞書}、記録のない分類は含めない）で返す。
+    """
+    result = {}
+    for category, slugs in CATEGORY_SLUGS.items():
+        rows = select_events(frame, type_slugs=slugs)
+        if not rows.empty:
+            result[category] = {"category": category, **rows.iloc[-1].to_dict()}
+    return result
+
+# ---------------------------------------------------------
+# 睡眠セッションの組み立て・日付ごとの分割
+# ---------------------------------------------------------
+def pair_sleep_sessions(sleep_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    古い順に並んだ睡眠ログ（sleep_start / sleep_end）から睡眠セッションを組み立てる。
+    「sleep_start の直後に sleep_end が続く」組だけをペアとみなす（ログ抜けは無視）。
+
+    Args:
+        sleep_rows: datetime(JST), type_slug 列を持つ古い順のDataFrame
+
+    Returns:
+        pd.DataFrame: start, end (JST), duration_hours, date（睡眠終了時の日付）列を持つDataFrame
+    """
+    # JSTの壁時計時刻のdatetime64配列にして、Pythonオブジェクトを介さずに計算する
+    slugs = sleep_rows['type_slug'].to_numpy(dtype=object)
+    times = sleep_rows['datetime'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+
+    # 1行ずらした配列同士を比較し、(i, i+1) が (sleep_start, sleep_end) になっている位置を一括で求める
+    # ※ 1行が start と end を同時に満たすことはないので、ペア同士が重なることはない
+    is_pair = (slugs[:-1] == 'sleep_start') & (slugs[1:] == 'sleep_end')
+    starts = times[:-1][is_pair]
+    ends = times[1:][is_pair]
+
+    return pd.DataFrame({
+        'start': pd.DatetimeIndex(starts).tz_localize(JST),
+        'end': pd.DatetimeIndex(ends).tz_localize(JST),
+        'duration_hours': (ends - starts) / np.timedelta64(1, 'h'),
+        'date': pd.DatetimeIndex(ends.astype('datetime64[D]')).date,  # 睡眠終了時の日付をキーとする
+    })
+
+def split_sleep_sessions_by_day(sessions: pd.DataFrame) -> pd.DataFrame:
+    """
+    睡眠セッションを0時で分割し、日ごとの累計睡眠時間（時間）を返す。
+    例）22:00〜翌6:00 の睡眠 → 当日に2時間、翌日に6時間を計上する。
+
+    Returns:
+        pd.DataFrame: date, count（その日の睡眠時間の合計[h]）列を持つDataFrame
+    """
+    if sessions.empty:
+        return pd.DataFrame({'date': pd.Series(dtype=object), 'count': pd.Series(dtype=float)})
+
+    starts = sessions['start'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+    ends = sessions['end'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+
+    # 各セッションがまたぐ日数（日付をまたがなければ1）だけセッションを複製する
+    first_days = starts.astype('datetime64[D]')
+    n_days = (ends.astype('datetime64[D]') - first_days).astype(np.int64) + 1
+    n_days = np.maximum(n_days, 1)
+    idx = np.repeat(np.arange(len(starts)), n_days)
+    # セッション内での何日目か（0, 1, 2, ...）
+    offsets = np.arange(idx.size) - np.repeat(np.cumsum(n_days) - n_days, n_days)
+
+    # 各日の [0時, 翌0時) とセッションの重なり部分を切り出す
+    days = first_days[idx] + offsets.astype('timedelta64[D]')
+    seg_start = np.maximum(starts[idx], days.astype('datetime64[ns]'))
+    seg_end = np.minimum(ends[idx], (days + np.timedelta64(1, 'D')).astype('datetime64[ns]'))
+    hours = (seg_end - seg_start) / np.timedelta64(1, 'h')
+
+    # ちょうど0時に終わった場合などの長さ0の分割片は捨てる（元のセッションの1日目は残す）
+    keep = (hours > 0) | (offsets == 0)
+    segments = pd.DataFrame({'date': pd.DatetimeIndex(days[keep]).date, 'count': hours[keep]})
+    return segments.groupby('date', sort=True)['count'].sum().reset_index()
+
+# ---------------------------------------------------------
+# 差分取得つきイベントストア
+# ---------------------------------------------------------
+class EventStore:
+    """
+    直近 window_days 日分のイベントと日ごとの合計を保持するストア。
+
+    - 初回は期間全体を取得し、以降は `gt('id', last_id)` で前回より後に書き込まれた行だけを取得する
+      （過去の時刻でさかのぼって記録された行も取りこぼさない。期間より前の行は取り込んだあと取り除く）。
+    - 既存の行の修正・削除は差分では分からないため、修正・削除の回数（changes）が変わったとき、
+      または回数が分からず鮮度トークンだけが変わって差分が空だったときは、期間全体を取得し直す。
+    - 期間外になった行は取り除く。
+    - 日ごとのミルク量・睡眠時間は、差分が入った日（と睡眠のために前日）だけ再計算する。
+    - cache（event_cache.EventCache）を渡すと、内容をディスクにArrow IPCで保存し、再起動時はそこから復元する。
+    複数のStreamlitセッション（スレッド）から共有されるため、更新はロックで直列化し、
+    frame は更新のたびに新しいDataFrameに差し替える（読む側は取得時点のframeをそのまま使える）。
+    """
+
+    def __init__(self, window_days: int = 15, tenant: Tenant = SINGLE_TENANT, cache=None):
+        self.window_days = window_days
+        self.tenant = tenant                  # このストアが保持する家庭・赤ちゃん（問い合わせ・通知を絞り込む）
+        self.frame = events_to_frame([])
+        self.last_seen: str | None = None     # 取得済みの最新datetime（DBの表記のまま）
+        self.last_id: int | None = None       # 取得済みの最大id（差分はこれより大きいidの行）
+        self.changes: int | None = None       # 最後に取得したときの修正・削除の回数（不明ならNone）
+        self.freshness: str | None = None     # 最後に取得したときの鮮度トークン
+        self.synced_at: str | None = None     # 最後にDBから取得できた時刻（オフライン表示用）
+        self.version = 0                      # 内容が変わるたびに増える
+        self.unparsed = 0                     # 最後の取り込みで時刻を解析できなかった行数（現在時刻で代替した）
+        self.daily_milk = pd.Series(dtype=float)    # index: date, 値: ミルク量合計[ml]
+        self.daily_sleep = pd.Series(dtype=float)   # index: date, 値: 睡眠時間合計[h]
+        self.category_versions = {category: 0 for category in CATEGORY_SLUGS}  # 分類ごとの更新回数
+        self._lock = threading.Lock()
+        self._cache = cache                   # ディスクのキャッシュ（event_cache.EventCache）。Noneなら保存しない
+        self._unsaved: list[pd.DataFrame] = []  # ディスクへ未保存の追加行
+        self._needs_rewrite = False           # 行の削除があり、ディスクの内容を作り直す必要がある
+        if cache is not None:
+            self._load_cache()
+
+    def _load_cache(self):
+        """ディスクのキャッシュから期間内の行と取得位置を復元する（再起動直後もDBを待たずに表示できる）"""
+        frame, meta = self._cache.load(since=self._window_start())
+        if frame is None:
+            return
+        self.frame = frame
+        self.last_seen = meta.get('last_seen')
+        # 取得位置をidで保存する前のキャッシュは last_id・changes を持たないため、次の取得で期間全体を読み直す
+        self.last_id = meta.get('last_id')
+        self.changes = meta.get('changes')
+        self.freshness = meta.get('freshness')
+        self.synced_at = meta.get('synced_at')
+        if not frame.empty:
+            self._recompute_from(frame['datetime'].iloc[0].date())
+            self.version += 1
+            for category in self.category_versions:
+                self.category_versions[category] += 1
+
+    @property
+    def loaded_from_cache(self) -> bool:
+        """DBから取得する前に、ディスクのキャッシュの内容を持っているか"""
+        return self._cache is not None and self.synced_at is not None
+
+    def _window_start(self) -> datetime:
+        # DBの時刻文字列と同じく、サーバーの現在時刻をJSTの壁時計時刻とみなして比較する
+        return JST.localize(datetime.now() - timedelta(days=self.window_days))
+
+    def refresh(self, client, table_name="baby_events", freshness: str | None = None,
+                changes: int | None = None) -> set[date]:
+        """
+        Supabaseから差分を取得してストアを更新する。
+
+        Args:
+            client: Supabaseクライアント（または local_backend の代替）
+            freshness: 鮮度トークン。前回と同じならDBへ問い合わせない。
+            changes: 修正・削除の回数（鮮度トークンに含まれるもの）。前回と変わっていれば期間全体を取得し直す。
+        Returns:
+            set[date]: 内容が変わった日付
+        """
+        with self._lock:
+            changed: set[date] = set()
+            slugs: list = []
+            queried = self.last_id is None or freshness is None or freshness != self.freshness
+            if queried:
+                self.unparsed = 0
+                reload = self.last_id is None or (changes is not None and changes != self.changes)
+                if not reload:
+                    query = self.tenant.apply(client.table(table_name).select(", ".join(EVENT_COLUMNS)))
+                    rows = query.gt('id', self.last_id).order("id", desc=False).execute().data or []
+                    # 回数が分からない環境で、新しい行がないのにトークンだけ変わった → 修正・削除があったとみなす
+                    reload = not rows and changes is None and freshness is not None and self.freshness is not None
+                if reload:
+                    query = self.tenant.apply(client.table(table_name).select(", ".join(EVENT_COLUMNS)))
+                    query = query.gte('datetime', (datetime.now() - timedelta(days=self.window_days)).isoformat())
+                    rows = query.order("datetime", desc=False).execute().data or []
+                    slugs += self.frame['type_slug'].tolist()
+                    changed |= self._replace(rows)
+                else:
+                    changed |= self._merge(rows)
+                slugs += [row.get('type_slug') for row in rows]
+                self.freshness = freshness
+                self.changes = changes
+                self.synced_at = datetime.now(JST).isoformat(timespec='seconds')
+            changed |= self._evict()
+            # さかのぼって記録された期間より前の行は取り除いたため、その日は変更に含めない
+            changed = {day for day in changed if day >= self._window_start().date()}
+            self._commit(changed, slugs)
+            if queried:
+                self._persist()
+            return changed
+
+    def evict_expired(self) -> set[date]:
+        """DBへ問い合わせず、期間外になった行だけを取り除く（リアルタイム更新中に使う）"""
+        with self._lock:
+            changed = self._evict()
+            self._commit(changed, [])
+            return changed
+
+    def apply_change(self, change: dict) -> set[date]:
+        """
+        Supabase Realtime の変更通知（postgres_changes の data 部分）を1件反映する。
+
+        Args:
+            change: {"type": "INSERT" | "UPDATE" | "DELETE", "record": {...}, "old_record": {...}}
+        Returns:
+            set[date]: 内容が変わった日付
+        """
+        kind = str(getattr(change.get('type'), 'value', change.get('type', ''))).upper()
+        record = change.get('record') or {}
+        old_record = change.get('old_record') or {}
+        # 別の家庭・赤ちゃんの行は追加しない（UPDATEで別の赤ちゃんに移った行は、同じidの行を取り除くだけ）
+        foreign = bool(record) and not self.tenant.matches(record)
+        if foreign and kind == 'INSERT':
+            return set()
+        with self._lock:
+            changed: set[date] = set()
+            slugs: list[str] = []
+            self.unparsed = 0
+
+            # UPDATE/DELETE は旧行を、INSERT/UPDATE は同じidの行を取り除いてから追加する（upsert）
+            remove_ids = {old_record.get('id'), record.get('id')} - {None}
+            if remove_ids and not self.frame.empty:
+                removed = self.frame[self.frame['id'].isin(remove_ids)]
+                if not removed.empty:
+                    changed |= set(removed['datetime'].dt.date)
+                    slugs += removed['type_slug'].tolist()
+                    self.frame = self.frame.drop(removed.index).reset_index(drop=True)
+                    self._needs_rewrite = True
+
+            if kind in ('INSERT', 'UPDATE') and record and not foreign:
+                changed |= self._merge([record])
+                slugs.append(record.get('type_slug'))
+
+            changed |= self._evict()
+            self._commit(changed, slugs)
+            self._persist()
+            return changed
+
+    def _commit(self, changed: set[date], slugs: list):
+        """変更があれば日ごとの合計を再計算し、バージョンを進める"""
+        if not changed:
+            return
+        self._recompute_from(min(changed))
+        self.version += 1
+        for category, category_slugs in CATEGORY_SLUGS.items():
+            if any(slug in category_slugs for slug in slugs):
+                self.category_versions[category] += 1
+
+    def _merge(self, rows: list[dict]) -> set[date]:
+        if not rows:
+            return set()
+        # 取得済みの最新datetime・最大idを更新（DBの表記は同じ形式なので文字列で比較できる）
+        newest = max(row['datetime'] for row in rows)
+        if self.last_seen is None or newest > self.last_seen:
+            self.last_seen = newest
+        ids = [row['id'] for row in rows if row.get('id') is not None]
+        if ids and (self.last_id is None or max(ids) > self.last_id):
+            self.last_id = max(ids)
+        new = events_to_frame(rows)
+        self.unparsed += new.attrs.get(UNPARSED_ATTR, 0)
+        if self._cache is not None:
+            self._unsaved.append(new)
+        merged = concat_events([self.frame, new])
+        if merged['id'].notna().all():
+            merged = merged.drop_duplicates(subset='id', keep='last')
+        else:
+            merged = merged.drop_duplicates(subset=['datetime', 'type_slug', 'type_jp', 'amount_ml'], keep='last')
+        self.frame = merged.sort_values('datetime', kind='stable').reset_index(drop=True)
+        return set(new['datetime'].dt.date)
+
+    def _replace(self, rows: list[dict]) -> set[date]:
+        """期間全体を取得し直した rows で内容を置き換える。置き換え前後の行のある日をすべて返す"""
+        changed = set(self.frame['datetime'].dt.date)
+        self.frame = events_to_frame(rows).sort_values('datetime', kind='stable').reset_index(drop=True)
+        self.unparsed += self.frame.attrs.get(UNPARSED_ATTR, 0)
+        self.last_seen = max((row['datetime'] for row in rows), default=None)
+        self.last_id = max((row['id'] for row in rows if row.get('id') is not None), default=None)
+        self._unsaved = []
+        self._needs_rewrite = self._cache is not None
+        return changed | set(self.frame['datetime'].dt.date)
+
+    def _persist(self):
+        """追加行・取得位置をディスクのキャッシュに書く（削除があった場合は作り直す）。保存の失敗は表示に影響させない"""
+        if self._cache is None:
+            return
+        meta = {'last_seen': self.last_seen, 'last_id': self.last_id, 'changes': self.changes,
+                'freshness': self.freshness, 'synced_at': self.synced_at}
+        try:
+            if self._needs_rewrite:
+                self._cache.rewrite(self.frame, meta)
+            elif self._unsaved:
+                self._cache.append(concat_events(self._unsaved), meta, snapshot=self.frame)
+            else:
+                self._cache.save_meta(meta)
+        except OSError:
+            return
+        self._unsaved = []
+        self._needs_rewrite = False
+
+    def _evict(self) -> set[date]:
+        """期間外の行を取り除く。取り除いた場合は期間の先頭日（途中から欠けた日）を返す。"""
+        if self.frame.empty:
+            return set()
+        window_start = self._window_start()
+        lo = _search_time(self.frame, window_start)
+        if lo == 0:
+            return set()
+        self.frame = self.frame.iloc[lo:].reset_index(drop=True)
+        first_day = window_start.date()
+        self.daily_milk = self.daily_milk[self.daily_milk.index >= first_day]
+        self.daily_sleep = self.daily_sleep[self.daily_sleep.index >= first_day]
+        return {first_day}
+
+    def _rows_from(self, day: date, type_slugs: list[str] | None = None) -> pd.DataFrame:
+        """dayの0時以降の行（frameは古い順なので二分探索で切り出す）"""
+        return select_events(self.frame, start=JST.localize(datetime.combine(day, time())), type_slugs=type_slugs)
+
+    def select(self, start: datetime | None = None, end: datetime | None = None, category: str | None = None) -> pd.DataFrame:
+        """
+        期間 [start, end) と分類（CATEGORY_SLUGSのキー。Noneなら全分類）で行を切り出す。
+        取得時点のframeから切り出すため、ロックは不要。
+        """
+        return select_events(self.frame, start, end, CATEGORY_SLUGS[category] if category is not None else None)
+
+    def _recompute_from(self, first_day: date):
+        """
+        first_day以降の日ごとの合計だけを再計算する。
+        睡眠は前日の夜から続くセッションがあるため、前日分も再計算する
+        （そのために前々日の0時以降のログからセッションを組み立てる。24時間を超える睡眠は想定しない）。
+        """
+        # ミルク量
+        formula = self._rows_from(first_day, ['formula'])
+        # float32で持つ量は、合計の誤差が出ないようfloat64にしてから集計する
+        milk = formula['amount_ml'].astype('float64').fillna(0).groupby(formula['datetime'].dt.date).sum()
+        self.daily_milk = pd.concat([self.daily_milk[self.daily_milk.index < first_day], milk]).sort_index()
+
+        # 睡眠時間
+        sleep_first_day = first_day - timedelta(days=1)
+        sleep_rows = self._rows_from(sleep_first_day - timedelta(days=1), SLEEP_SLUGS)
+        daily = split_sleep_sessions_by_day(pair_sleep_sessions(sleep_rows))
+        sleep = daily.set_index('date')['count']
+        sleep = sleep[sleep.index >= sleep_first_day]
+        self.daily_sleep = pd.concat([self.daily_sleep[self.daily_sleep.index < sleep_first_day], sleep]).sort_index()
+
+    def daily_totals(self) -> pd.DataFrame:
+        """
+        日ごとの合計を dashboard.fetch_daily_totals と同じ形式で返す。
+
+        Returns:
+            pd.DataFrame: date, milk_ml, sleep_hours 列（データのない指標はNaN）
+        """
+        daily = pd.concat([self.daily_milk.rename('milk_ml'), self.daily_sleep.rename('sleep_hours')], axis=1)
+        daily.index.name = 'date'
+        return daily.reset_index()[['date', 'milk_ml', 'sleep_hours']]
@@ -0,0 +1,122 @@
+"""
+GPT呼び出しの使用量・応答時間の記録（JSON Lines）
+
+回答1件ごとに、OpenAIの応答の usage（入力トークン・うちプロンプトキャッシュで処理されたトークン・出力トークン）と
+応答時間（最初のトークンまで・回答完了まで）を1行のJSONとして追記する。回答キャッシュから返した回答も
+response_cache=true として記録する（OpenAIは呼んでいないのでトークン数は空。夜間に作成した分析を表示したときは
+digest=true も付ける）。digest_worker.py の呼び出しは再試行の回数（attempts）も記録する。
+
+分析の種類（kpi_prompt.analysis_type: 睡眠パターン / 授乳間隔 / おむつ替え / ミルク量 / free）ごとに、
+入力のうちキャッシュ済みトークンの割合と応答時間を集計できる。
+
+使い方:
+    python gpt_metrics.py                       # 既定の gpt_metrics.jsonl を集計
+    python gpt_metrics.py logs/gpt_metrics.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import unicodedata
+
+DEFAULT_PATH = "gpt_metrics.jsonl"
+# 1行に残す項目（metrics の値。usage は prompt_tokens / cached_tokens / completion_tokens に展開する）
+FIELDS = ("response_cache", "digest", "prompt_tokens", "cached_tokens", "completion_tokens", "ttft_sec", "total_sec",
+          "completed", "error", "attempts")
+
+
+class GptMetricsLog:
+    """回答ごとの使用量・応答時間を JSON Lines のファイルに追記する（スレッドセーフ）"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, analysis_type: str, model: str, metrics: dict):
+        # トークン数はOpenAIが返した usage の値だけを使う（送信前の見積もりは記録しない）
+        usage = metrics.get("usage") or {}
+        values = {**metrics, "response_cache": bool(metrics.get("cached")),
+                  **{key: usage.get(key) for key in ("prompt_tokens", "cached_tokens", "completion_tokens")}}
+        entry = {"ts": round(time.time(), 3), "analysis_type": analysis_type, "model": model}
+        entry.update({field: values.get(field) for field in FIELDS})
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def read_entries(path: str = DEFAULT_PATH) -> list[dict]:
+    """記録を古い順に読む（壊れた行は飛ばす）"""
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def summarize(entries: list[dict]) -> dict[str, dict]:
+    """
+    分析の種類ごとの集計。
+
+    Returns:
+        dict[str, dict]: {分析の種類: {calls, cache_hits, prompt_tokens, cached_tokens, cached_ratio,
+                          completion_tokens, ttft_median_sec, total_median_sec}}。
+                         トークン数はOpenAIを呼んだ回の合計、応答時間はOpenAIを呼んだ回の中央値
+    """
+    summary = {}
+    for analysis_type in sorted({entry.get("analysis_type") or "free" for entry in entries}):
+        rows = [entry for entry in entries if (entry.get("analysis_type") or "free") == analysis_type]
+        calls = [entry for entry in rows if not entry.get("response_cache")]
+        prompt = sum(entry.get("prompt_tokens") or 0 for entry in calls)
+        cached = sum(entry.get("cached_tokens") or 0 for entry in calls)
+        ttft = [entry["ttft_sec"] for entry in calls if entry.get("ttft_sec") is not None]
+        total = [entry["total_sec"] for entry in calls if entry.get("total_sec") is not None]
+        summary[analysis_type] = {
+            "calls": len(calls),
+            "cache_hits": len(rows) - len(calls),
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "cached_ratio": round(cached / prompt, 3) if prompt else None,
+            "completion_tokens": sum(entry.get("completion_tokens") or 0 for entry in calls),
+            "ttft_median_sec": round(statistics.median(ttft), 3) if ttft else None,
+            "total_median_sec": round(statistics.median(total), 3) if total else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPT呼び出しの使用量・応答時間を分析の種類ごとに集計する")
+    parser.add_argument("path", nargs="?", default=os.getenv("BABY_GPT_METRICS_LOG") or DEFAULT_PATH)
+    args = parser.parse_args()
+
+    summary = summarize(read_entries(args.path))
+    if not summary:
+        print(f"記録がありません: {args.path}")
+        return
+
+    def fmt(value, spec=""):
+        return "-" if value is None else format(value, spec)
+
+    def ljust(text: str, width: int) -> str:
+        # 全角文字は2桁分として左寄せする
+        used = sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+        return text + " " * max(0, width - used)
+
+    print(f"{ljust('analysis', 12)} {'calls':>5} {'hits':>5} {'prompt':>8} {'cached':>8} {'ratio':>6} {'output':>7} {'ttft':>7} {'total':>7}")
+    for analysis_type, row in summary.items():
+        print(f"{ljust(analysis_type, 12)} {row['calls']:>5} {row['cache_hits']:>5} {row['prompt_tokens']:>8} {row['cached_tokens']:>8} "
+              f"{fmt(row['cached_ratio'], '.1%'):>6} {row['completion_tokens']:>7} "
+              f"{fmt(row['ttft_median_sec'], '.2f'):>7} {fmt(row['total_median_sec'], '.2f'):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""
+KPIエンジン（日ごとの指標の平均・標準偏差・傾きと日常語ラベル）
+
+GPTに渡すKPI_JSONの派生統計（series_stats）と日常語ラベル（qualitative_labels）を計算する。
+- RollingStats: 直近 window 日分の値の和・二乗和・x·y の和を持ち、1日締まるごとに O(1) で更新する
+- KpiEngine: 指標（睡眠・ミルク・おむつ回数・授乳回数）× 期間（7/14/28日）ごとの RollingStats をまとめて持ち、
+  日次合計から締まった日だけを追加する（過去の日の値が変わったときだけ作り直す）
+- batch_kpis: 複数の赤ちゃんの日次合計から、期間内の統計・ラベルを配列演算でまとめて計算する（定期的な事前計算用）
+
+どれも series_stats と同じ定義（母標準偏差 ddof=0、x=0..n-1 への一次回帰の傾き）で計算する。
+計算時間は benchmarks/kpi_benchmark.py で計測できる。
+"""
+import math
+import threading
+from collections import deque
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 指標ごとの単位と、傾きを「増えている/減っている」とみなす絶対閾値（qualitative_labels の abs_threshold）
+METRICS = {
+    "sleep_hours": {"unit": "時間/日", "abs_threshold": 0.2},
+    "milk_ml": {"unit": "ml/日", "abs_threshold": 20.0},
+    "diaper_count": {"unit": "回/日", "abs_threshold": 1.0},
+    "feeding_count": {"unit": "回/日", "abs_threshold": 1.0},
+}
+WINDOWS = (7, 14, 28)
+
+# ---------------------------------------------------------
+# 系列の統計量・日常語ラベル（1系列ずつ）
+# ---------------------------------------------------------
+def series_stats(values: list[float]) -> dict:
+    """
+    目的:
+        数値系列(list[float])から「平均」「標準偏差」「１日あたりの直線的傾き」を計算する。
+    引数:
+        values:日単位の値(例:睡眠時間[h/日])、ミルク量[ml/日]
+    戻り値(dict):
+        {
+            "mean": 平均値(float),
+            "std": 標準偏差（float, 不偏ではなく母標準偏差 ddof=0）,
+            "trend_slope_per_day": 直線回帰で推定した1日あたりの傾き（float）
+        }
+    実装メモ:
+        - 配列化（np.array）して計算を安定化。
+        - データが空ならすべて0で返す（ダッシュボード側の表示を安全にするため）。
+        - 傾きはX=0..n-1を説明変数にpolyfit(1次)で取得（要素2以上の時のみ）。
+    """
+    #以下は上記戻り値（dict）の補足説明
+    #ddof=0 とは今あるデータ集合そのもののばらつき”**をそのまま測る、という意味。今週の実測データの事実を示すならddof=0がいいとのこと。ddof=1にすると分母がn-1になる。
+    #trend_slope_per_day 1日あたりに平均してどれくらい増減しているかを示す数値（単位は/日）
+
+    arr = np.array(values, dtype=float)#floatで少数を表せる数値型にすることで、平均・標準偏差・回帰の傾きなどの小数点計算を正確にする。
+    if arr.size == 0:#配列が空（要素数が０）かどうかチェック。データが１つもないと計算できないため使用。
+        return {"mean": 0.0, "std": 0.0, "trend_slope_per_day": 0.0}#空データの場合の安全な初期値を返す。0.0にすることでダッシュボードや後続処理でのエラーを防ぐ。
+    #以下のコードでやりたいこと
+    #日ごとのデータ（arr）があるとき、「最近1日あたりどのくらい増えている？減っている？」＝傾きをざっくり出したい
+    #そのために日数の番号（0日目、1日目、2日目…）を説明変数として使って直線を当てはめる（一次回帰）→直線の傾きを取り出す。
+    x = np.arange(arr.size, dtype=float)#データの本数分 x = 0,1,2という連番を作って「日数の流れを横軸にしている」 
+    #np.polyfit(x, arr, 1) は「x と arr の点群に、一次式（直線）を一番いい感じにフィットさせる」関数
+    #戻り値は [傾き, 切片] の2つ。[0] で傾き（slope）だけ取り出している。
+    #if文：ただし、データが1点しかないと直線の傾きは決められないので、その場合は 0.0 としている。
+    slope = float(np.polyfit(x, arr, 1)[0]) if arr.size >= 2 else 0.0
+    return {
+        "mean": float(arr.mean()), #平均=全体の基準
+        "std": float(arr.std(ddof=0)), #標準偏差＝日々のムラ
+        "trend_slope_per_day": slope, #傾き＝最近の流れ（増えている？減っている？横這い？）
+        #上記3点セットがそろっていると状況の要約がやりやすい。
+    }
+
+def qualitative_labels(mean: float, std: float, slope: float, unit: str,
+                        abs_threshold: float | None = None) -> dict:
+    """
+    目的:
+        数字の統計量（平均/標準偏差/傾き）を「日常語の短い表現」に変換する。
+    
+    引数:
+        mean:   平均
+        std:    標準偏差
+        slope:  1日あたりの傾き（series_statsのtrend_slope_per_day）
+        unit:   単位の短い表記（例:"時間/日"、"ml/日"）
+        abs_threshold: 絶対値で傾きを有意とみなす下限（例:睡眠0.2h/日、ミルク20ml/日）
+                       （「傾きがこれ以上なら"増えている/減っている"と言い切ろう」という最低ラインのこと）
+                       Noneの場合は、絶対閾値を使わず、相対判定（±5%/日）だけで判定
+                       （絶対量ではなく「平均と比べて1日あたり±5% 以上なら増減とみなす」という相対的な目安だけで判定）
+    判定ロジック（概略）:
+    - 変動の大きさ(平均と比べて、どれくらい日々の差があるか): 変動係数 CV=std/|mean|を用い、閾値10%/25%で3段階に言語化: 『10%未満：ほぼ毎日おなじ / 10~25%：日によって少しちがう / 25%以上:日によってかなりちがう』
+      目安幅として±10%/±25% を実数化にして同梱
+      例）平均６時間なら
+      ・±10%~±0.6時間（この範囲内のブレなら小さめ）
+      ・±25%~±1.5時間（ここを超えるブレは大きめ）
+
+    - 傾き: slope（1日あたりの増減）が
+        ・プラスで十分大きい→「少し増えつつある」
+        ・マイナスで十分大きい→「少し減りつつある」
+        ・どちらでもない→「だいたい同じ」
+    　※「十分大きい」の判断は2つのどちらかを満たしたとき：
+        1.abs_threshold(絶対ライン)以上
+        　例：睡眠で+0.25h/日は0.2h/日を超えるので「増えてる」と言いやすい
+        2.平均と比べて±5%/日以上（相対ライン）
+        　例：平均6hで+0.4h/日は0.4/6~6.7%/日→増えてる判定
+    
+    戻り値（dict）:
+        {
+        "variability": 変動の大きさ,
+        "variability_phrase": 変動の説明（1行）,
+        "trend": 傾向
+        "trend_phrase": 傾向の説明（1行）
+        "guideline_band_10pct": 目安幅（±10%の実数(平均×0.10)）,
+        "guideline_band_25pct": 目安幅（±25%の実数(平均×0.25)）
+        }
+    
+    実装メモ:
+    - meanが0近傍で割り算が不安定にならないようepsを加算。
+        「変動の大きさ」を出すときにCV=標準偏差÷平均という計算をしている。
+        平均値が0に近いと分母が小さすぎて結果が「異常に大きな数字」になってしまう。
+        さらに平均が完全に0.0ならゼロ割エラーが発生する。
+        そこでeps（ごく小さい数。例:1e-8）を足すことで分母が完全に0になることや計算が極端に跳ね上がるのを防ぐ。
+    - "日常語"のみで返す要件のため、専門用語は返却値に含めない。
+    
+    具体例（数値でイメージ）
+    直近7日の睡眠：だいたい 6.0時間/日
+    日々のバラつき：0.6時間（平均の10%）
+    傾き：+0.25時間/日（ここ数日で少しずつ増えている）
+    単位：「時間/日」
+    絶対の目安（abs_threshold）：0.2時間/日
+
+    この場合の出力イメージ：
+    変動：10% → 「ほぼ毎日おなじ」
+    説明：「日ごとの差は小さめ（目安：±0.6時間/日以内）。」
+    傾向：+0.25h/日 は 0.2h/日 を超える → 「少し増えつつある」
+    説明：「ここ数日は時間/日がゆるやかに増えています。」
+    目安幅：
+    10% → ±0.6時間
+    25% → ±1.5時間
+    """
+    eps = 1e-9 #ゼロ割を回避
+    cv = std / (abs(mean) + eps) #平均に対してどれくらいブレているか
+    band10 = abs(mean) * 0.10 #平均の10%を実際の単位(時間/日、ml/日)の数値に直す。abs(mean)を使うのは幅が必ず正の値になるようにするため。
+    band25 = abs(mean) * 0.25
+
+    #統計用語を使わず、一目でニュアンスが伝わる日本語に落とし込むための閾値設計。
+    #具体例:平均6.0時間/日、標準偏差:0.9時間
+    #cv = 0.9/6.0 = 0.15(15%)→日によって少し違う
+    #UI/説明向け：単位を含む自然な一文(variability_phrase)をそのまま画面やプロンプトに出せる。
+
+    if cv < 0.10: #cv(=ブレの割合)に応じて3つのラベルのどれかを選ぶ
+        variability = "ほぼ毎日おなじ"
+        variability_phrase = f"日ごとの差は小さめ（目安: ±{band10:.1f}{unit}以内）。" #.1fは小数点1桁で丸めて見やすくする工夫
+    elif cv < 0.25:
+        variability = "日によって少しちがう"
+        variability_phrase = f"日ごとの差は中くらい（目安: ±{band10:.1f}〜±{band25:.1f}{unit}）。"
+    else:
+        variability = "日によってかなりちがう"
+        variability_phrase = f"日ごとの差は大きめ（目安: ±{band25:.1f}{unit}以上）。"
+
+    #二段構えの有意性チェック（絶対・相対）で言い過ぎを防止
+    #相対しきい値（5%/日）や絶対しきい値（0.2h/日、20ml/日）は対象に合わせて調整可能。
+    #平均が0のときは%判定を切り離し、絶対量で判断
+
+    #1日あたりの変化量slopeが平均meanに対してどれくらいの割合かを出している。
+    #同じ「+0.3/日」でも平均6なら+5%/日、平均12なら+2.5%/日。平均に対する割合でみると大小の比較がフェアになる。
+    rel = abs(slope) / (abs(mean) + eps) if mean else 0.0
+    #相対基準だけだと平均が極端に小さい/大きいと判定がブレる、絶対基準だけだと指標のスケール以前になり比較がしにくい。
+    #両方用意して、どちらかを満たせば有意とすることで現実的で過剰反応しない判定にしている。
+    use_abs = abs_threshold is not None and abs(slope) >= abs_threshold #絶対的な基準を超えたか（睡眠時間0.2時間/日、ミルクなら20ml/日）
+    use_rel = rel >= 0.05  # 相対的な基準(5%/日)を超えたか
+
+    if (slope > 0) and (use_abs or use_rel):
+        trend = "少し増えつつある"
+        trend_phrase = f"ここ数日は{unit}がゆるやかに増えています。"
+    elif (slope < 0) and (use_abs or use_rel):
+        trend = "少し減りつつある"
+        trend_phrase = f"ここ数日は{unit}がゆるやかに減っています。"
+    else:
+        trend = "だいたい同じ"
+        trend_phrase = f"ここ数日は{unit}は大きく変わっていません。"
+
+    return {
+        "variability": variability,
+        "variability_phrase": variability_phrase,
+        "trend": trend,
+        "trend_phrase": trend_phrase,
+        "guideline_band_10pct": band10,
+        "guideline_band_25pct": band25,
+    }
+
+# ---------------------------------------------------------
+# 和の差分更新による統計量（1日ごとに O(1)）
+# ---------------------------------------------------------
+RESYNC_INTERVAL = 256  # この回数更新するごとに和を数え直す（引き算の丸め誤差をためない）
+
+def _stats_from_sums(n: int, total: float, total_sq: float, total_xy: float) -> dict:
+    """値の個数・和・二乗和・x·yの和（x=0..n-1）から series_stats と同じ形の統計量を求める"""
+    if n == 0:
+        return {"mean": 0.0, "std": 0.0, "trend_slope_per_day": 0.0}
+    mean = total / n
+    var = total_sq / n - mean * mean
+    # 全日同じ値のときに丸め誤差で小さな正の値が残らないようにする
+    if var <= 1e-12 * max(mean * mean, 1.0):
+        var = 0.0
+    slope = 0.0
+    if n >= 2:
+        # x=0..n-1 の和と二乗和は公式で求める
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        slope = (n * total_xy - sum_x * total) / (n * sum_xx - sum_x * sum_x)
+    return {"mean": float(mean), "std": math.sqrt(var), "trend_slope_per_day": float(slope)}
+
+class RollingStats:
+    """
+    直近 window 個の値（古い順。x=0..n-1）の和・二乗和・x·yの和を保持し、統計量を O(1) で返す。
+
+    値を追加するとき、窓からあふれた最古の値を引き、残りの値の x が1つずつ前にずれる分
+    （Σ(x-1)·y = Σx·y - Σy）を補正してから、新しい値を末尾に足す。
+    """
+    __slots__ = ("window", "values", "total", "total_sq", "total_xy", "_updates")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque[float] = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.total_xy = 0.0
+        self._updates = 0
+
+    def push(self, value: float):
+        value = float(value)
+        if len(self.values) == self.window:
+            oldest = self.values.popleft()
+            self.total -= oldest
+            self.total_sq -= oldest * oldest
+            self.total_xy -= self.total
+        self.total_xy += len(self.values) * value
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        self._updates += 1
+        if self._updates % RESYNC_INTERVAL == 0:
+            self._resync()
+
+    def stats(self, extra: float | None = None) -> dict:
+        """
+        現在の窓の統計量。extra を渡すと、その値を追加した場合の統計量を（状態を変えずに）返す
+        （集計途中の今日の値を含めるときに使う）。
+        """
+        n, total, total_sq, total_xy = len(self.values), self.total, self.total_sq, self.total_xy
+        if extra is not None:
+            extra = float(extra)
+            if n == self.window:
+                oldest = self.values[0]
+                total -= oldest
+                total_sq -= oldest * oldest
+                total_xy -= total
+                n -= 1
+            total_xy += n * extra
+            total += extra
+            total_sq += extra * extra
+            n += 1
+        return _stats_from_sums(n, total, total_sq, total_xy)
+
+    def _resync(self):
+        self.total = math.fsum(self.values)
+        self.total_sq = math.fsum(v * v for v in self.values)
+        self.total_xy = math.fsum(i * v for i, v in enumerate(self.values))
+
+# ---------------------------------------------------------
+# KPIエンジン（1人分。日が締まるごとに差分更新）
+# ---------------------------------------------------------
+class KpiEngine:
+    """
+    指標 × 期間ごとの RollingStats を持つ、1人分のKPIエンジン。
+
+    - sync() に日次合計を渡すと、前回から新しく締まった日（今日より前の日）だけを追加する。
+      記録のない日は0として追加する（ダッシュボードのグラフと同じ扱い）。
+    - 既に追加した日の値が日次合計と食い違う場合（過去の記録の修正・削除）は作り直す。
+    - stats() / labels() は集計途中の今日の値を含めて計算できる。
+    複数のStreamlitセッション（スレッド）から共有されるため、更新はロックで直列化する。
+    """
+
+    def __init__(self, metrics=tuple(METRICS), windows=WINDOWS):
+        self.metrics = tuple(metrics)
+        self.windows = tuple(windows)
+        self.last_day: date | None = None   # 最後に追加した（締まった）日
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.last_day = None
+        self._history: deque[tuple[date, tuple]] = deque(maxlen=max(self.windows))
+        self._rolling = {(metric, window): RollingStats(window) for metric in self.metrics for window in self.windows}
+
+    def close_day(self, day: date, values: dict):
+        """1日分の値（{指標: 値}。無い指標は0）を追加する。last_day との間の日は0で埋める"""
+        with self._lock:
+            self._close_day(day, values)
+
+    def _close_day(self, day: date, values: dict):
+        if self.last_day is not None:
+            if day <= self.last_day:
+                return
+            # 間の日（記録なし）は0で埋める。窓より長い空白は窓の分だけ埋めれば足りる
+            gap = min((day - self.last_day).days - 1, max(self.windows))
+            for offset in range(gap, 0, -1):
+                self._push(day - timedelta(days=offset), {})
+        self._push(day, values)
+
+    def _push(self, day: date, values: dict):
+        row = tuple(float(values.get(metric) or 0.0) for metric in self.metrics)
+        for metric, value in zip(self.metrics, row):
+            for window in self.windows:
+                self._rolling[(metric, window)].push(value)
+        self._history.append((day, row))
+        self.last_day = day
+
+    def sync(self, daily: pd.DataFrame, today: date, since: date | None = None) -> int:
+        """
+        日次合計から、締まった日（today より前）のうち未追加の日を追加する。
+
+        Args:
+            daily: date 列と指標の列を持つDataFrame（データのない日は行がなくてよい）
+            today: 集計途中の日（この日は追加しない）
+            since: daily が網羅している最初の日（これ以降で行のない日は0とみなす）。省略時は daily の最初の日
+        Returns:
+            int: 追加した日数
+        """
+        by_day, since = self._closed_days(daily, today, since)
+        with self._lock:
+            return self._sync(by_day, today, since)
+
+    def sync_and_stats(self, daily: pd.DataFrame, today: date, window: int, today_values: dict[str, float],
+                       since: date | None = None) -> dict[str, dict]:
+        """
+        sync() と、today_values の指標ごとの stats()・labels() を1回のロックの中で行う
+        （同じ家庭の別セッションが間に sync しても、統計量とラベルが別の日次合計から計算されることがない）。
+
+        Returns:
+            dict: {指標: {"stats": stats() と同じ形, "labels": labels() と同じ形}}
+        """
+        by_day, since = self._closed_days(daily, today, since)
+        with self._lock:
+            self._sync(by_day, today, since)
+            result = {}
+            for metric, today_value in today_values.items():
+                stats = self._rolling[(metric, window)].stats(today_value)
+                result[metric] = {"stats": stats, "labels": _labels_from_stats(metric, stats)}
+            return result
+
+    def _closed_days(self, daily: pd.DataFrame, today: date, since: date | None) -> tuple[dict, date]:
+        """日次合計のうち締まった日を {日付: {指標: 値}} にし、網羅している最初の日とともに返す"""
+        columns = [metric for metric in self.metrics if metric in daily.columns]
+        closed = daily[daily['date'] < today]
+        by_day = closed.set_index('date')[columns].fillna(0).to_dict('index')
+        if since is None:
+            since = min(by_day) if by_day else today
+        return by_day, since
+
+    def _sync(self, by_day: dict, today: date, since: date) -> int:
+        # 追加済みの日の値が変わっていたら作り直す（網羅範囲外の古い日は確かめられないのでそのまま）
+        for day, row in self._history:
+            if day >= since and row != tuple(float(by_day.get(day, {}).get(metric) or 0.0) for metric in self.metrics):
+                self._reset()
+                break
+
+        start = self.last_day + timedelta(days=1) if self.last_day is not None else today - timedelta(days=max(self.windows))
+        added = 0
+        day = start
+        while day < today:
+            self._close_day(day, by_day.get(day, {}))
+            day += timedelta(days=1)
+            added += 1
+        return added
+
+    def stats(self, metric: str, window: int, today_value: float | None = None) -> dict:
+        """直近 window 日の統計量（series_stats と同じ形）。today_value を渡すと最古の日の代わりに今日を含める"""
+        with self._lock:
+            return self._rolling[(metric, window)].stats(today_value)
+
+    def labels(self, metric: str, window: int, today_value: float | None = None) -> dict:
+        """stats() から作った日常語ラベル（qualitative_labels と同じ形）"""
+        return _labels_from_stats(metric, self.stats(metric, window, today_value))
+
+
+def _labels_from_stats(metric: str, stats: dict) -> dict:
+    return qualitative_labels(mean=stats["mean"], std=stats["std"], slope=stats["trend_slope_per_day"], **METRICS[metric])
+
+# ---------------------------------------------------------
+# 複数の赤ちゃんの一括計算（配列演算）
+# ---------------------------------------------------------
+def batch_series_stats(values: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    行ごとに series_stats と同じ統計量をまとめて計算する。
+
+    Args:
+        values: 形が (系列数, 日数) の配列（各行が古い順の日ごとの値）
+    Returns:
+        dict[str, np.ndarray]: "mean" / "std" / "trend_slope_per_day"（それぞれ長さ 系列数）
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[1]
+    if n == 0:
+        zeros = np.zeros(values.shape[0])
+        return {"mean": zeros, "std": zeros.copy(), "trend_slope_per_day": zeros.copy()}
+    mean = values.mean(axis=1)
+    std = values.std(axis=1, ddof=0)
+    slope = np.zeros(values.shape[0])
+    if n >= 2:
+        x = np.arange(n, dtype=float) - (n - 1) / 2
+        slope = (values - mean[:, None]) @ x / (x @ x)
+    return {"mean": mean, "std": std, "trend_slope_per_day": slope}
+
+def batch_kpis(daily: pd.DataFrame, end: date, window: int = 7, key: str = "baby_id",
+               metrics=tuple(METRICS), with_labels: bool = True) -> pd.DataFrame:
+    """
+    複数の赤ちゃんの日次合計から、end までの直近 window 日の統計量（とラベル）を一括で計算する。
+    記録のない日は0とみなす（KpiEngine・ダッシュボードのグラフと同じ）。
+
+    Args:
+        daily: key 列・date 列と指標の列を持つDataFrame（例: baby_daily_rollup を全員分読んだもの）
+        end: 期間の最終日（この日を含む）
+        metrics: 計算する指標（daily にない指標は飛ばす）
+        with_labels: True なら variability / trend などの日常語ラベルの列も付ける
+    Returns:
+        pd.DataFrame: key, metric, mean, std, trend_slope_per_day（＋ラベルの列）を持つ、赤ちゃん×指標ごとの行
+    """
+    days = pd.Index([end - timedelta(days=i) for i in range(window - 1, -1, -1)], name='date')
+    in_window = daily[(daily['date'] >= days[0]) & (daily['date'] <= end)]
+    keys = pd.Index(daily[key].unique(), name=key)
+
+    frames = []
+    for metric in metrics:
+        if metric not in daily.columns:
+            continue
+        # 赤ちゃん × 日 の行列にする（記録のない日は0）
+        matrix = (in_window.pivot_table(index=key, columns='date', values=metric, aggfunc='sum')
+                  .reindex(index=keys, columns=days).fillna(0.0))
+        stats = batch_series_stats(matrix.to_numpy())
+        frame = pd.DataFrame({key: keys, "metric": metric, **stats})
+        if with_labels:
+            labels = [qualitative_labels(mean=m, std=s, slope=t, **METRICS[metric])
+                      for m, s, t in zip(stats["mean"], stats["std"], stats["trend_slope_per_day"])]
+            frame = pd.concat([frame, pd.DataFrame(labels)], axis=1)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=[key, "metric", "mean", "std", "trend_slope_per_day"])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,139 @@
+"""
+GPTに送るKPI_JSONの圧縮と、プロンプトのトークン数の見積もり
+
+「ダッシュボード分析」の質問はそれぞれ1つの指標だけを分析させるため、質問に関係する項目だけを送る。
+- 質問ごとの絞り込み: QUESTION_FIELDS の見出し語を含む質問には、その項目（入れ子の辞書は一部のキー）だけを残す。
+  見出し語を含まない質問にはすべての項目を送る
+- 列形式: 日ごとの辞書のリスト（[{"date": .., "hours": ..}, ...]）を、列ごとの配列（{"date": [..], "hours": [..]}）にする
+- 小数は ROUND_DIGITS 桁に丸め、JSONは空白なしで出力する
+- 日常語ラベルの目安の数値（guideline_band_*）は variability_phrase と重複するため送らない
+
+トークン数は tiktoken があればモデルの符号化で数え、なければ文字数から見積もる（ASCIIは4文字で1、それ以外は1文字で1）。
+"""
+import json
+import math
+from functools import lru_cache
+
+ROUND_DIGITS = 2
+
+# 質問の見出し語 → 送る項目（None は項目全体、タプルは入れ子の辞書のうち残すキー）
+QUESTION_FIELDS = {
+    "睡眠パターン": {
+        "units": ("sleep_hours_per_day",),
+        "sleep_last7": None,
+        "sleep_prev_week_avg_hours": None,
+        "sleep_last7_stats": None,
+        "sleep_last7_labels": None,
+    },
+    "授乳間隔": {
+        "units": ("milk_amount_per_day", "elapsed_since_feeding", "intervals"),
+        "elapsed": ("feeding_minutes", "feeding_bucket"),
+        "milk_last7": None,
+        "milk_prev_week_avg_ml": None,
+        "milk_last7_stats": None,
+        "milk_last7_labels": None,
+        "feeding_interval_last7": None,
+        "feeding_interval_daily_last7": None,
+    },
+    "おむつ替え": {
+        "units": ("elapsed_since_diaper", "intervals"),
+        "elapsed": ("diaper_minutes", "diaper_bucket"),
+        "diaper_interval_last7": None,
+        "diaper_interval_daily_last7": None,
+    },
+    "ミルク量": {
+        "units": ("milk_amount_per_day",),
+        "milk_last7": None,
+        "milk_prev_week_avg_ml": None,
+        "milk_last7_stats": None,
+        "milk_last7_labels": None,
+    },
+}
+# どの質問にも付ける項目
+COMMON_FIELDS = ("notes",)
+# 送らない入れ子のキー（ほかの項目と重複する）
+DROPPED_KEYS = ("guideline_band_10pct", "guideline_band_25pct")
+
+
+def analysis_type(question: str | None) -> str:
+    """分析の種類（質問に含まれる QUESTION_FIELDS の見出し語。どれも含まなければ "free"）"""
+    if question:
+        for keyword in QUESTION_FIELDS:
+            if keyword in question:
+                return keyword
+    return "free"
+
+
+def question_fields(question: str | None) -> dict | None:
+    """質問に対応する項目の指定（QUESTION_FIELDS の値）。見出し語を含まなければNone（すべて送る）"""
+    return QUESTION_FIELDS.get(analysis_type(question))
+
+
+def slice_payload(payload: dict, question: str | None) -> dict:
+    """KPIペイロードから質問に関係する項目だけを取り出す（元の辞書は書き換えない。項目の順番は元のまま）"""
+    fields = question_fields(question)
+    if fields is None:
+        return dict(payload)
+    sliced = {}
+    for key, value in payload.items():
+        if key in COMMON_FIELDS:
+            sliced[key] = value
+        elif key in fields:
+            keep = fields[key]
+            sliced[key] = value if keep is None else {k: v for k, v in value.items() if k in keep}
+    return sliced
+
+
+def compact_value(value):
+    """辞書のリストを列形式に、小数を ROUND_DIGITS 桁にし、重複するキーを落とす（入れ子にも適用する）"""
+    if isinstance(value, dict):
+        return {k: compact_value(v) for k, v in value.items() if k not in DROPPED_KEYS}
+    if isinstance(value, list):
+        if value and all(isinstance(row, dict) for row in value) and all(row.keys() == value[0].keys() for row in value):
+            return {k: [compact_value(row[k]) for row in value] for k in value[0]}
+        return [compact_value(v) for v in value]
+    if isinstance(value, float):
+        rounded = round(value, ROUND_DIGITS)
+        return int(rounded) if rounded.is_integer() else rounded
+    return value
+
+
+def encode_kpi_json(payload: dict, question: str | None = None) -> str:
+    """質問に合わせて絞り込み、列形式・空白なしにしたKPI_JSON"""
+    return json.dumps(compact_value(slice_payload(payload, question)), ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------------------------------------------------------
+# トークン数
+# ---------------------------------------------------------
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> tuple[int, bool]:
+    """
+    text のトークン数。
+
+    Returns:
+        tuple[int, bool]: （トークン数, tiktokenで数えた正確な値か。Falseなら文字数からの見積もり）
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text)), True
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars), False
+
+
+def prompt_token_report(prompt: str, kpi_json: str = "", model: str = "gpt-4o-mini") -> dict:
+    """プロンプト全体とそのうちKPI_JSONのトークン数（metricsに入れてログ・画面に出す）"""
+    prompt_tokens, exact = count_tokens(prompt, model)
+    kpi_tokens, _ = count_tokens(kpi_json, model) if kpi_json else (0, exact)
+    return {"prompt_tokens": prompt_tokens, "kpi_tokens": kpi_tokens, "tokens_exact": exact}
@@ -0,0 +1,432 @@
+"""
+Supabaseクライアントのローカル代替（SQLite）
+
+オフラインでダッシュボードを動かしたり、RPCの集計結果を確かめたりするための簡易実装。
+dashboard.py が使う範囲のクエリ（select / eq / in_ / gte / gt / lte / lt / order / limit / insert）と
+supabase/migrations にあるRPC（baby_daily_totals / baby_rollup_backfill / baby_latest_events）と、
+書き込み時に日次ロールアップ（baby_daily_rollup）を更新するトリガーと同じ処理をSQLiteで再現する。
+修正・削除の回数（baby_event_changes）は、SQLで直接 update / delete した場合もSQLiteのトリガーで数える。
+
+使い方:
+    .env に SUPABASE_URL="sqlite:///local_baby.db" と書くとダッシュボードがこのクライアントを使う
+    （SUPABASE_KEY は不要）。
+"""
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+SQLITE_URL_PREFIX = "sqlite:///"
+
+# baby_events の最小スキーマ（Supabase側のテーブルと同じ列名）
+SCHEMA = """
+create table if not exists baby_events (
+    id integer primary key autoincrement,
+    datetime text not null,
+    type_slug text not null,
+    type_jp text,
+    amount_ml real,
+    household_id text,
+    baby_id text
+);
+create table if not exists baby_daily_rollup (
+    baby_id text not null default '',
+    day text not null,
+    milk_ml real,
+    breast_count integer not null default 0,
+    pee_count integer not null default 0,
+    poop_count integer not null default 0,
+    sleep_hours real,
+    updated_at text not null default (datetime('now')),
+    primary key (baby_id, day)
+);
+create table if not exists baby_event_changes (
+    scope text primary key,
+    changes integer not null default 0,
+    changed_at text not null default (datetime('now'))
+);
+"""
+
+# baby_events の修正・削除の回数（supabase/migrations/20261016121000_baby_event_changes.sql・20261016140000_baby_tenancy.sql のトリガーと同じ）
+CHANGE_TRIGGERS = """
+create trigger if not exists baby_events_changes_update after update on baby_events
+begin
+    insert into baby_event_changes (scope, changes, changed_at) values (coalesce(old.baby_id, ''), 1, datetime('now'))
+        on conflict (scope) do update set changes = changes + 1, changed_at = excluded.changed_at;
+    insert into baby_event_changes (scope, changes, changed_at)
+        select coalesce(new.baby_id, ''), 1, datetime('now') where new.baby_id is not old.baby_id
+        on conflict (scope) do update set changes = changes + 1, changed_at = excluded.changed_at;
+    insert into baby_event_changes (scope, changes, changed_at) values ('*', 1, datetime('now'))
+        on conflict (scope) do update set changes = changes + 1, changed_at = excluded.changed_at;
+end;
+create trigger if not exists baby_events_changes_delete after delete on baby_events
+begin
+    insert into baby_event_changes (scope, changes, changed_at) values (coalesce(old.baby_id, ''), 1, datetime('now'))
+        on conflict (scope) do update set changes = changes + 1, changed_at = excluded.changed_at;
+    insert into baby_event_changes (scope, changes, changed_at) values ('*', 1, datetime('now'))
+        on conflict (scope) do update set changes = changes + 1, changed_at = excluded.changed_at;
+end;
+"""
+
+# 索引（supabase/migrations の推奨と同じく baby_id を先頭にした複合索引）
+INDEXES = """
+create index if not exists baby_events_type_slug_datetime_idx on baby_events (type_slug, datetime desc);
+create index if not exists baby_events_datetime_idx on baby_events (datetime);
+create index if not exists baby_events_baby_type_slug_datetime_idx on baby_events (baby_id, type_slug, datetime desc);
+create index if not exists baby_events_baby_datetime_idx on baby_events (baby_id, datetime);
+create index if not exists baby_events_baby_id_idx on baby_events (baby_id, id);
+create index if not exists baby_events_baby_key_datetime_idx on baby_events (coalesce(baby_id, ''), datetime);
+"""
+
+# テーブル名・列名として許可する文字（SQLに直接埋め込むため）
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# 時刻文字列の表記をそのままJSTの壁時計時刻とみなす（Z・オフセット・小数秒を無視し、
+# SQLiteのdatetime()と比較できるよう区切りの T を空白にそろえる）
+_TS = "replace(substr({col}, 1, 19), 'T', ' ')"
+
+# baby_daily_totals（supabase/migrations/20261016120000_baby_daily_totals.sql）のSQLite版
+DAILY_TOTALS_SQL = """
+with recursive days(day) as (
+    select date(:p_today, '-' || (:p_days - 1) || ' days')
+    union all
+    select date(day, '+1 day') from days where day < date(:p_today)
+),
+events as (
+    select {ts} as ts, type_slug, amount_ml
+    from {table}
+    where {ts} >= datetime(date(:p_today, '-' || :p_days || ' days'))
+      and {ts} < datetime(date(:p_today, '+1 day'))
+      -- 索引を使うための粗い絞り込み（列そのままの文字列比較。前後1日の余裕を持たせる）
+      and datetime >= date(:p_today, '-' || (:p_days + 1) || ' days')
+      and datetime < date(:p_today, '+2 day')
+      and type_slug in ('formula', 'sleep_start', 'sleep_end')
+      {tenant_filter}
+),
+milk as (
+    select date(ts) as day, sum(coalesce(amount_ml, 0)) as milk_ml
+    from events
+    where type_slug = 'formula'
+    group by 1
+),
+sleep_rows as (
+    select ts, type_slug,
+           lead(type_slug) over (order by ts) as next_slug,
+           lead(ts) over (order by ts) as next_ts
+    from events
+    where type_slug in ('sleep_start', 'sleep_end')
+),
+sessions as (
+    select ts as s, next_ts as e
+    from sleep_rows
+    where type_slug = 'sleep_start' and next_slug = 'sleep_end'
+),
+sleep as (
+    select d.day,
+           sum((julianday(min(x.e, datetime(d.day, '+1 day'))) - julianday(max(x.s, datetime(d.day)))) * 24) as sleep_hours
+    from days d
+    join sessions x on x.s < datetime(d.day, '+1 day') and x.e > datetime(d.day)
+    group by d.day
+)
+select d.day as day, m.milk_ml as milk_ml, round(s.sleep_hours, 4) as sleep_hours
+from days d
+left join milk m on m.day = d.day
+left join sleep s on s.day = d.day
+where m.milk_ml is not null or s.sleep_hours is not null
+order by d.day
+"""
+
+# baby_rollup_refresh_day（supabase/migrations/20261016130000_baby_daily_rollup.sql）のSQLite版
+# （SQLiteのトリガーではCTEが使えないため、insert のあとにPythonから該当日ごとに呼ぶ）
+ROLLUP_DAY_SQL = """
+with events as (
+    select {ts} as ts, type_slug, amount_ml
+    from baby_events
+    where coalesce(baby_id, '') = :p_baby_id
+      and {ts} >= datetime(:p_day, '-1 day')
+      and {ts} < datetime(:p_day, '+2 day')
+      and datetime >= date(:p_day, '-2 day')
+      and datetime < date(:p_day, '+3 day')
+),
+today as (
+    select * from events where ts >= datetime(:p_day) and ts < datetime(:p_day, '+1 day')
+),
+sleep_rows as (
+    select ts, type_slug,
+           lead(type_slug) over (order by ts) as next_slug,
+           lead(ts) over (order by ts) as next_ts
+    from events
+    where type_slug in ('sleep_start', 'sleep_end')
+),
+sessions as (
+    select ts as s, next_ts as e
+    from sleep_rows
+    where type_slug = 'sleep_start' and next_slug = 'sleep_end'
+      and ts < datetime(:p_day, '+1 day') and next_ts > datetime(:p_day)
+)
+select
+    (select sum(coalesce(amount_ml, 0)) from today where type_slug = 'formula') as milk_ml,
+    (select count(*) from today where type_slug = 'breast') as breast_count,
+    (select count(*) from today where type_slug = 'diaper_pee') as pee_count,
+    (select count(*) from today where type_slug = 'diaper_poop') as poop_count,
+    (select round(sum((julianday(min(e, datetime(:p_day, '+1 day'))) - julianday(max(s, datetime(:p_day)))) * 24), 4)
+       from sessions) as sleep_hours,
+    (select count(*) from today) as event_count
+"""
+
+SLEEP_SLUGS = ("sleep_start", "sleep_end")
+
+
+def rollup_days_for_event(datetime_text: str, type_slug: str) -> list[str]:
+    """1件のイベントで更新が必要な日（YYYY-MM-DD）。睡眠の記録は前日・翌日の組み方も変える"""
+    day = date.fromisoformat(str(datetime_text)[:10])
+    days = [day]
+    if type_slug in SLEEP_SLUGS:
+        days += [day - timedelta(days=1), day + timedelta(days=1)]
+    return [d.isoformat() for d in days]
+
+
+class LocalBackendError(Exception):
+    """ローカル代替で未対応の操作・存在しないRPCを呼んだ場合の例外"""
+
+
+def _identifier(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise LocalBackendError(f"不正な識別子です: {name}")
+    return name
+
+
+class LocalQuery:
+    """supabase-py のクエリビルダーのうち、ダッシュボードで使う部分だけを真似たもの"""
+
+    def __init__(self, client: "LocalSupabaseClient", table: str):
+        self._client = client
+        self._table = _identifier(table)
+        self._columns = "*"
+        self._where: list[str] = []
+        self._params: list = []
+        self._order: list[str] = []
+        self._limit: int | None = None
+        self._insert_rows: list[dict] | None = None
+
+    def select(self, columns: str = "*"):
+        cols = [c.strip() for c in columns.split(",") if c.strip()]
+        self._columns = "*" if cols == ["*"] else ", ".join(_identifier(c) for c in cols)
+        return self
+
+    def _filter(self, column: str, op: str, value):
+        self._where.append(f"{_identifier(column)} {op} ?")
+        self._params.append(value)
+        return self
+
+    def eq(self, column: str, value):
+        return self._filter(column, "=", value)
+
+    def gte(self, column: str, value):
+        return self._filter(column, ">=", value)
+
+    def gt(self, column: str, value):
+        return self._filter(column, ">", value)
+
+    def lte(self, column: str, value):
+        return self._filter(column, "<=", value)
+
+    def lt(self, column: str, value):
+        return self._filter(column, "<", value)
+
+    def in_(self, column: str, values):
+        values = list(values)
+        placeholders = ", ".join("?" for _ in values) or "null"
+        self._where.append(f"{_identifier(column)} in ({placeholders})")
+        self._params.extend(values)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order.append(f"{_identifier(column)} {'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, count: int):
+        self._limit = int(count)
+        return self
+
+    def insert(self, rows):
+        self._insert_rows = [rows] if isinstance(rows, dict) else list(rows)
+        return self
+
+    def execute(self):
+        if self._insert_rows is not None:
+            return SimpleNamespace(data=self._client._insert(self._table, self._insert_rows))
+
+        sql = f"select {self._columns} from {self._table}"
+        if self._where:
+            sql += " where " + " and ".join(self._where)
+        if self._order:
+            sql += " order by " + ", ".join(self._order)
+        if self._limit is not None:
+            sql += f" limit {self._limit}"
+        return SimpleNamespace(data=self._client._fetch(sql, self._params))
+
+
+class LocalRpc:
+    def __init__(self, client: "LocalSupabaseClient", name: str, params: dict | None):
+        self._client = client
+        self._name = name
+        self._params = dict(params or {})
+
+    def execute(self):
+        handler = self._client.rpc_handlers.get(self._name)
+        if handler is None:
+            # PostgRESTで関数が見つからない場合と同じく例外にする
+            raise LocalBackendError(f"PGRST202: function public.{self._name} not found")
+        return SimpleNamespace(data=handler(self._client, self._params))
+
+
+def _daily_totals(client: "LocalSupabaseClient", params: dict) -> list[dict]:
+    table = "baby_events"
+    # 指定のあるテナント列だけ条件にする（「:p is null or ...」の形だと索引が使われないため）
+    tenant_filter = " ".join(
+        f"and {column} = :p_{column}" for column in ("baby_id", "household_id") if params.get(f"p_{column}") is not None
+    )
+    sql = DAILY_TOTALS_SQL.format(table=table, ts=_TS.format(col="datetime"), tenant_filter=tenant_filter)
+    return client._fetch(sql, {
+        "p_today": params["p_today"],
+        "p_days": int(params.get("p_days", 14)),
+        "p_baby_id": params.get("p_baby_id"),
+        "p_household_id": params.get("p_household_id"),
+    })
+
+
+def _rollup_backfill(client: "LocalSupabaseClient", params: dict) -> int:
+    first, last = date.fromisoformat(params["p_from"]), date.fromisoformat(params["p_to"])
+    days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    with client._lock:
+        # p_baby_id を省略すると、期間内に記録のあるすべての赤ちゃんを作り直す
+        babies = [params["p_baby_id"]] if params.get("p_baby_id") is not None else [
+            row[0] for row in client._conn.execute(
+                "select distinct coalesce(baby_id, '') from baby_events where datetime >= ? and datetime < ?",
+                ((first - timedelta(days=2)).isoformat(), (last + timedelta(days=3)).isoformat()),
+            )
+        ]
+        keys = [(baby, day) for baby in babies for day in days]
+        client._refresh_rollup(keys)
+        client._conn.commit()
+    return len(keys)
+
+
+# baby_latest_events の分類（supabase/migrations/20261016150000_baby_latest_events.sql と同じ）
+LATEST_EVENT_SLUGS = {
+    "diaper": ("diaper_pee", "diaper_poop"),
+    "feeding": ("formula", "breast"),
+    "sleep": SLEEP_SLUGS,
+}
+
+
+def _latest_events(client: "LocalSupabaseClient", params: dict) -> list[dict]:
+    table = "baby_events"
+    tenant_filter = " ".join(
+        f"and {column} = :p_{column}" for column in ("baby_id", "household_id") if params.get(f"p_{column}") is not None
+    )
+    values = {"p_baby_id": params.get("p_baby_id"), "p_household_id": params.get("p_household_id")}
+    columns = "id, datetime, type_slug, type_jp, amount_ml"
+    rows = []
+    # type_slug ごとに索引の先頭1行だけを読み、分類ごとに最も新しいものを選ぶ（Postgres版の DISTINCT ON と同じ）
+    for category, slugs in LATEST_EVENT_SLUGS.items():
+        candidates = [
+            found[0] for slug in slugs
+            if (found := client._fetch(
+                f"select {columns} from {table} where type_slug = :slug {tenant_filter} order by datetime desc limit 1",
+                {**values, "slug": slug},
+            ))
+        ]
+        if candidates:
+            rows.append({"category": category, **max(candidates, key=lambda row: row["datetime"])})
+    latest = client._fetch(f"select {columns} from {table} where 1 = 1 {tenant_filter} order by id desc limit 1", values)
+    # 'any' 行には修正・削除の回数（baby_id の指定がなければ表全体の '*'）を付ける
+    scope = params.get("p_baby_id") if params.get("p_baby_id") is not None else "*"
+    changes = client._fetch("select changes from baby_event_changes where scope = ?", (scope,))
+    rows.extend({"category": "any", **row, "changes": changes[0]["changes"] if changes else 0} for row in latest)
+    return rows
+
+
+class LocalSupabaseClient:
+    """SQLiteファイル（または :memory:）を使うSupabaseクライアントの代替"""
+
+    def __init__(self, path: str = ":memory:"):
+        # Streamlitはセッションごとに別スレッドでスクリプトを実行するため、スレッド間で共有してロックで守る
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.rpc_handlers = {
+            "baby_daily_totals": _daily_totals,
+            "baby_rollup_backfill": _rollup_backfill,
+            "baby_latest_events": _latest_events,
+        }
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            self._conn.executescript(INDEXES)
+            self._conn.executescript(CHANGE_TRIGGERS)
+
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self, name)
+
+    def rpc(self, name: str, params: dict | None = None) -> LocalRpc:
+        return LocalRpc(self, name, params)
+
+    def _fetch(self, sql: str, params) -> list[dict]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def _insert(self, table: str, rows: list[dict]) -> list[dict]:
+        inserted = []
+        with self._lock:
+            for row in rows:
+                cols = [_identifier(c) for c in row]
+                cur = self._conn.execute(
+                    f"insert into {table} ({', '.join(cols)}) values ({', '.join('?' for _ in cols)})",
+                    list(row.values()),
+                )
+                inserted.append({"id": cur.lastrowid, **row})
+            if table == "baby_events":
+                # Supabase側のトリガー（baby_events_rollup）と同じく、影響を受けた日のロールアップを更新する
+                self._refresh_rollup({
+                    (row.get("baby_id") or "", d)
+                    for row in rows for d in rollup_days_for_event(row["datetime"], row.get("type_slug"))
+                })
+            self._conn.commit()
+        return inserted
+
+    def _refresh_rollup(self, keys):
+        """指定した（baby_id, 日付）のロールアップを生イベントから計算し直す（ロックを取った状態で呼ぶ）"""
+        sql = ROLLUP_DAY_SQL.format(ts=_TS.format(col="datetime"))
+        for baby_id, day in sorted(keys):
+            row = self._conn.execute(sql, {"p_baby_id": baby_id, "p_day": day}).fetchone()
+            if row["event_count"] or row["sleep_hours"] is not None:
+                self._conn.execute(
+                    "insert or replace into baby_daily_rollup "
+                    "(baby_id, day, milk_ml, breast_count, pee_count, poop_count, sleep_hours, updated_at) "
+                    "values (?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+                    (baby_id, day, row["milk_ml"], row["breast_count"], row["pee_count"], row["poop_count"], row["sleep_hours"]),
+                )
+            else:
+                self._conn.execute("delete from baby_daily_rollup where baby_id = ? and day = ?", (baby_id, day))
+
+    def _migrate(self):
+        """テナント列を追加する前に作ったDBファイルを、今のスキーマにそろえる（ロックを取った状態で呼ぶ）"""
+        columns = {row[1] for row in self._conn.execute("pragma table_info(baby_events)")}
+        for column in ("household_id", "baby_id"):
+            if column not in columns:
+                self._conn.execute(f"alter table baby_events add column {column} text")
+        # ロールアップは生イベントから作り直せるため、主キーが古い形なら作り直す（rollup_backfill.py で再作成）
+        rollup_columns = {row[1] for row in self._conn.execute("pragma table_info(baby_daily_rollup)")}
+        if "baby_id" not in rollup_columns:
+            self._conn.execute("drop table baby_daily_rollup")
+            self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+
+def create_local_client(url: str) -> LocalSupabaseClient:
+    """'sqlite:///path/to.db' 形式のURLからローカルクライアントを作る"""
+    path = url[len(SQLITE_URL_PREFIX):] if url.startswith(SQLITE_URL_PREFIX) else url
+    return LocalSupabaseClient(path or ":memory:")
@@ -0,0 +1,185 @@
+"""
+baby_events の変更をリアルタイムに受け取り、イベントストアに反映する購読スレッド
+
+Supabase Realtime（postgres_changes）で INSERT / UPDATE / DELETE を受け取り、
+EventStore.apply_change で差分だけをストアに反映する。DBへのポーリングは行わない。
+ダッシュボード側は、ストアの分類ごとのバージョン（category_versions）を見て
+影響を受けたカード（経過時間・今何してる）だけが最新イベントを求め直し、棒グラフなどの画面全体は
+ストア全体のバージョン（version）が変わったときに一定間隔で描き直す。
+
+テスト・オフライン用に、用意した変更通知を順に流すだけの FakeChannel も用意している。
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from typing import Awaitable, Callable
+
+from event_store import EventStore
+from tenancy import SINGLE_TENANT, Tenant
+
+# 購読処理: (変更通知を受け取る関数, 購読開始を知らせる関数) を受け取り、購読中は戻らないコルーチン関数
+# 切断・購読エラー時は例外を送出する（RealtimeFeed が connected を下ろして再接続する）
+Subscriber = Callable[[Callable[[dict], None], Callable[[], None]], Awaitable[None]]
+
+SOCKET_CHECK_SECONDS = 5.0  # WebSocket が切れていないかを確かめる間隔（秒）
+
+
+def supabase_subscriber(url: str, key: str, table_name: str = "baby_events", schema: str = "public",
+                        tenant: Tenant = SINGLE_TENANT,
+                        access_token: Callable[[], str | None] | None = None) -> Subscriber:
+    """
+    Supabase Realtime の postgres_changes を購読する Subscriber を作る。
+    tenant に baby_id があれば、その赤ちゃんの変更だけをサーバー側で絞り込んで受け取る
+    （postgres_changes のフィルタは1条件だけなので、household_id はストア側で照合する）。
+    access_token が署名付きトークンを返す場合は、（再）接続のたびにそのJWTで購読する（RLSでその家庭の変更だけが届く）。
+
+    購読開始（on_ready）はチャネルの状態が SUBSCRIBED になってから知らせる。
+    CHANNEL_ERROR / TIMED_OUT / CLOSED の通知や WebSocket の切断を検知したら ConnectionError を送出する。
+    """
+    filters = tenant.filters()
+    column = "baby_id" if "baby_id" in filters else next(iter(filters), None)
+    change_filter = f"{column}=eq.{filters[column]}" if column else None
+
+    async def subscribe(on_change, on_ready):
+        # 非同期クライアントは購読スレッドの中でだけ使う（ダッシュボード本体の読み込みを重くしないため）
+        from realtime import RealtimePostgresChangesListenEvent, RealtimeSubscribeStates
+        from supabase import acreate_client
+
+        client = await acreate_client(url, key)
+        token = access_token() if access_token is not None else None
+        if token is not None:
+            await client.realtime.set_auth(token)
+        channel = client.channel(f"{table_name}-changes-{tenant.label()}")
+        channel.on_postgres_changes(
+            RealtimePostgresChangesListenEvent.All,
+            schema=schema,
+            table=table_name,
+            filter=change_filter,
+            callback=lambda payload: on_change(payload["data"]),
+        )
+        states: asyncio.Queue = asyncio.Queue()
+        await channel.subscribe(lambda state, error: states.put_nowait((state, error)))
+        try:
+            # 状態の通知を待ちながら接続を維持する（停止時はタスクのキャンセルで抜ける）
+            while True:
+                try:
+                    state, error = await asyncio.wait_for(states.get(), SOCKET_CHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    if not client.realtime.is_connected:
+                        raise ConnectionError("realtime socket closed")
+                    continue
+                if state == RealtimeSubscribeStates.SUBSCRIBED:
+                    on_ready()
+                else:
+                    raise ConnectionError(f"realtime channel {state.value}") from error
+        finally:
+            # 切断済みのソケットでは後片付けに失敗することがある（元の例外を優先する）
+            with contextlib.suppress(Exception):
+                await client.remove_all_channels()
+
+    return subscribe
+
+
+class FakeChannel:
+    """
+    用意した変更通知（postgres_changes の data 部分の辞書）を順に流すだけの購読チャネル。
+    例: {"type": "INSERT", "record": {"id": 1, "datetime": "...", "type_slug": "formula", ...}}
+    """
+
+    def __init__(self, changes: list[dict], interval: float = 0.0, hold_open: bool = True):
+        self.changes = list(changes)
+        self.interval = interval          # 通知の間隔（秒）
+        self.hold_open = hold_open        # 流し終えた後も接続中のふりを続けるか
+        self.replayed = threading.Event()
+
+    async def __call__(self, on_change, on_ready):
+        on_ready()
+        for change in self.changes:
+            if self.interval:
+                await asyncio.sleep(self.interval)
+            on_change(change)
+        self.replayed.set()
+        if self.hold_open:
+            await asyncio.Event().wait()
+
+
+class RealtimeFeed:
+    """
+    Subscriber をバックグラウンドスレッドで動かし、受け取った変更を EventStore に反映する。
+    切断・エラー時は connected を下ろし（その間はダッシュボードがDBから差分取得する）、
+    間隔を延ばしながら再接続する。
+    """
+
+    def __init__(self, store: EventStore, subscriber: Subscriber, max_backoff_seconds: float = 60.0):
+        self.store = store
+        self.subscriber = subscriber
+        self.max_backoff_seconds = max_backoff_seconds
+        self.connected = False            # 購読中か（Falseの間はダッシュボードがDBから差分取得する）
+        self.catch_up_pending = False     # 接続直後、購読開始前の取りこぼしをDBから1回取り込む必要があるか
+        self.received = 0                 # 反映した通知の件数
+        self.last_error: Exception | None = None
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._backoff = 1.0
+
+    def start(self) -> "RealtimeFeed":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="baby-events-realtime", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._task = self._loop.create_task(self._main())
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.connected = False
+            self._loop.close()
+
+    async def _main(self):
+        while not self._stopping:
+            try:
+                await self.subscriber(self._on_change, self._on_ready)
+                return  # 購読処理が自分で終わった（FakeChannel の hold_open=False など）
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.connected = False
+                self.last_error = e
+                await asyncio.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, self.max_backoff_seconds)
+
+    def _on_ready(self):
+        self.connected = True
+        self.catch_up_pending = True
+        self._backoff = 1.0  # 購読できたら再接続の間隔を戻す
+
+    def _on_change(self, change: dict):
+        self.store.apply_change(change)
+        self.received += 1
+
+
+def wait_until(predicate: Callable[[], bool], timeout: float = 5.0, interval: float = 0.01) -> bool:
+    """predicate が真になるまで待つ（FakeChannel を使った確認用）"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
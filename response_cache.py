@@ -0,0 +1,116 @@
+"""
+GPTの回答キャッシュ（SQLite・LRU）
+
+「ダッシュボード分析」ボタンは、同じ分析指示と、新しい記録が入るまで変わらない KPI_JSON を毎回送っている。
+(モデル, temperature, SYSTEM_PROMPT, FORMAT_HINT, 質問, sha256(KPI_JSON)) をキーに回答を保存し、
+同じ条件の質問にはOpenAIを呼ばずに保存済みの回答を返す。
+
+- 保存先はSQLiteファイル（プロセスを再起動しても残る）
+- 上限件数を超えたら、最後に使われた時刻が古いものから削除する（LRU）
+- ヒット/ミスの件数も同じファイルに記録する
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+create table if not exists gpt_responses (
+    key text primary key,
+    response text not null,
+    created_at real not null,
+    last_used_at real not null,
+    hits integer not null default 0
+);
+create index if not exists gpt_responses_last_used_idx on gpt_responses (last_used_at);
+create table if not exists gpt_cache_stats (
+    name text primary key,
+    value integer not null
+);
+insert or ignore into gpt_cache_stats (name, value) values ('hits', 0), ('misses', 0);
+"""
+
+
+def make_cache_key(model: str, temperature: float, system_prompt: str, format_hint: str,
+                   question: str, kpi_json: str = "", max_tokens: int | None = None, scope: str = "",
+                   instruction: str = "") -> str:
+    """
+    キャッシュキー（sha256の16進文字列）を作る。
+    KPI_JSONはsha256にしてからキーに含める（KPIなしの自由質問は空文字）。
+    instruction には質問の種類ごとの指示（SYSTEM_PROMPTの後に送るもの）を渡す。
+    scope には家庭・赤ちゃんの識別子を渡し、別の家庭の回答を返さないようにする。
+    """
+    kpi_hash = hashlib.sha256(kpi_json.encode("utf-8")).hexdigest() if kpi_json else ""
+    material = json.dumps(
+        [scope, model, temperature, max_tokens, system_prompt, format_hint, instruction, question, kpi_hash],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLiteに保存するLRUの回答キャッシュ"""
+
+    def __init__(self, path: str = ":memory:", max_entries: int = 256):
+        self.max_entries = max_entries
+        # Streamlitはセッションごとに別スレッドで実行するため、接続を共有してロックで守る
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        """保存済みの回答を返す（無ければNone）。ヒット/ミスを数え、使った時刻を更新する"""
+        with self._lock:
+            row = self._conn.execute("select response from gpt_responses where key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "update gpt_responses set last_used_at = ?, hits = hits + 1 where key = ?",
+                (time.time(), key),
+            )
+            self._count("hits")
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """回答を保存し、上限件数を超えた分を古い順に削除する"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert into gpt_responses (key, response, created_at, last_used_at) values (?, ?, ?, ?) "
+                "on conflict(key) do update set response = excluded.response, last_used_at = excluded.last_used_at",
+                (key, response, now, now),
+            )
+            self._conn.execute(
+                "delete from gpt_responses where key in ("
+                " select key from gpt_responses order by last_used_at desc limit -1 offset ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """ヒット/ミスの件数と保存件数"""
+        with self._lock:
+            counts = dict(self._conn.execute("select name, value from gpt_cache_stats"))
+            entries = self._conn.execute("select count(*) from gpt_responses").fetchone()[0]
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "entries": entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("delete from gpt_responses")
+            self._conn.execute("update gpt_cache_stats set value = 0")
+            self._conn.commit()
+
+    def _count(self, name: str):
+        self._conn.execute("update gpt_cache_stats set value = value + 1 where name = ?", (name,))
@@ -0,0 +1,88 @@
+"""
+日次ロールアップ（baby_daily_rollup）のバックフィル
+
+トリガー（baby_events_rollup）を入れる前から記録されている履歴について、
+RPC baby_rollup_backfill を期間ごとに呼んでロールアップを作り直す。
+何度実行しても同じ結果になる（各日を生イベントから計算し直すだけ）。
+
+使い方:
+    python rollup_backfill.py                              # 最も古いイベントの日〜今日（JST）
+    python rollup_backfill.py --from 2025-09-01 --to 2025-09-30
+    python rollup_backfill.py --chunk-days 7               # 1回のRPCで処理する日数
+    python rollup_backfill.py --baby-id b-123              # 1人分だけ（省略時は記録のあるすべての赤ちゃん）
+
+接続先は dashboard.py と同じく .env の SUPABASE_URL / SUPABASE_KEY を使う
+（SUPABASE_URL="sqlite:///local_baby.db" ならローカル代替のDBを更新する）。
+家庭ごとのRLS（supabase/migrations/20261017120000_baby_rls.sql）を入れた構成では、SUPABASE_KEY に service_role のキーを指定する。
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytz
+
+JST = pytz.timezone('Asia/Tokyo')
+
+
+def create_client_from_env():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url:
+        sys.exit("SUPABASE_URL が設定されていません（.env を確認してください）")
+    if url.startswith("sqlite:///"):
+        from local_backend import create_local_client
+        return create_local_client(url)
+    if not key:
+        sys.exit("SUPABASE_KEY が設定されていません（.env を確認してください）")
+    from supabase import create_client
+    return create_client(url, key)
+
+
+def first_event_date(client, table_name: str = "baby_events") -> date | None:
+    response = client.table(table_name).select("datetime").order("datetime", desc=False).limit(1).execute()
+    if not response.data:
+        return None
+    return date.fromisoformat(str(response.data[0]["datetime"])[:10])
+
+
+def backfill(client, first: date, last: date, chunk_days: int = 31, baby_id: str | None = None, echo=print) -> int:
+    """first〜last を chunk_days ごとに区切って baby_rollup_backfill を呼ぶ。処理した（赤ちゃん×日）の数を返す"""
+    total = 0
+    start = first
+    while start <= last:
+        end = min(start + timedelta(days=chunk_days - 1), last)
+        params = {"p_from": start.isoformat(), "p_to": end.isoformat()}
+        if baby_id is not None:
+            params["p_baby_id"] = baby_id
+        response = client.rpc("baby_rollup_backfill", params).execute()
+        total += int(response.data or 0)
+        echo(f"{start} 〜 {end}: {response.data} 件（赤ちゃん×日）を更新しました")
+        start = end + timedelta(days=1)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="baby_daily_rollup を既存の履歴から作り直す")
+    parser.add_argument("--from", dest="first", type=date.fromisoformat, help="開始日（省略時は最も古いイベントの日）")
+    parser.add_argument("--to", dest="last", type=date.fromisoformat, help="終了日（省略時は今日・JST）")
+    parser.add_argument("--chunk-days", type=int, default=31, help="1回のRPCで処理する日数")
+    parser.add_argument("--baby-id", help="この赤ちゃんだけ作り直す（baby_id のない既存の記録は ''）")
+    args = parser.parse_args()
+
+    client = create_client_from_env()
+    first = args.first or first_event_date(client)
+    if first is None:
+        print("イベントがないため、バックフィルは不要です")
+        return
+    last = args.last or datetime.now(JST).date()
+    total = backfill(client, first, last, chunk_days=args.chunk_days, baby_id=args.baby_id)
+    print(f"完了: {total} 件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+-- ---------------------------------------------------------
+-- 14日分の棒グラフ用の日次集計（ダッシュボードの BABY_SERVER_AGGREGATION=1 で使用）
+-- ---------------------------------------------------------
+-- 呼び出し: supabase_client.rpc('baby_daily_totals', {'p_today': '2025-09-22', 'p_days': 14})
+--
+-- 読み込む表は public.baby_events に固定する（表の名前を引数で受け取って動的SQLに埋め込むと、
+-- 実行を許可したロールから任意の表を読ませることができてしまう）。security invoker のため、
+-- baby_events の権限は呼び出したロールのものが効く。
+--
+-- 戻り値: データのある日だけを最大 p_days 行返す
+--   day         : JSTの日付
+--   milk_ml     : その日の formula の amount_ml 合計（ログがなければ null）
+--   sleep_hours : その日の睡眠時間合計[h]（睡眠がなければ null）
+--
+-- 時刻の扱いはダッシュボード（safe_to_jst）と同じく、保存されている時刻の表記をそのままJSTとみなす。
+-- ("datetime"::timestamp はセッションのタイムゾーン=UTC で表記どおりの壁時計時刻になる)
+--
+-- 睡眠は「sleep_start の直後に sleep_end が続く」組だけをセッションとし、0時をまたぐ場合は両日に分割して計上する。
+
+create or replace function public.baby_daily_totals(
+    p_today date default (now() at time zone 'Asia/Tokyo')::date,
+    p_days integer default 14
+)
+returns table(day date, milk_ml numeric, sleep_hours numeric)
+language sql
+stable
+set search_path = public
+as $$
+    with bounds as (
+        select (p_today - (p_days - 1))::date as first_day, p_today as last_day
+    ),
+    events as (
+        -- 前日の夜から続く睡眠を拾うため、1日前から読む
+        select e."datetime"::timestamp as ts, e.type_slug, e.amount_ml
+        from public.baby_events e, bounds b
+        where e."datetime" >= (b.first_day - 1)
+          and e."datetime" < (b.last_day + 1)
+          and e.type_slug in ('formula', 'sleep_start', 'sleep_end')
+    ),
+    days as (
+        select generate_series(b.first_day, b.last_day, interval '1 day')::date as day
+        from bounds b
+    ),
+    milk as (
+        select ts::date as day, sum(coalesce(amount_ml, 0))::numeric as milk_ml
+        from events
+        where type_slug = 'formula'
+        group by 1
+    ),
+    sleep_rows as (
+        select ts, type_slug,
+               lead(type_slug) over (order by ts) as next_slug,
+               lead(ts) over (order by ts) as next_ts
+        from events
+        where type_slug in ('sleep_start', 'sleep_end')
+    ),
+    sessions as (
+        select ts as s, next_ts as e
+        from sleep_rows
+        where type_slug = 'sleep_start' and next_slug = 'sleep_end'
+    ),
+    sleep as (
+        select d.day,
+               sum(extract(epoch from (least(x.e, (d.day + 1)::timestamp) - greatest(x.s, d.day::timestamp))) / 3600)::numeric as sleep_hours
+        from days d
+        join sessions x on x.s < (d.day + 1)::timestamp and x.e > d.day::timestamp
+        group by d.day
+    )
+    select d.day, m.milk_ml, round(s.sleep_hours, 4)
+    from days d
+    left join milk m on m.day = d.day
+    left join sleep s on s.day = d.day
+    where m.milk_ml is not null or s.sleep_hours is not null
+    order by d.day
+$$;
+
+grant execute on function public.baby_daily_totals(date, integer) to anon, authenticated;
+
+-- 日次集計・スナップショット取得で使う索引
+create index if not exists baby_events_type_slug_datetime_idx
+    on public.baby_events (type_slug, "datetime" desc);
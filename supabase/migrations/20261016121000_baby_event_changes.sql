@@ -0,0 +1,51 @@
+-- ---------------------------------------------------------
+-- イベントの修正・削除の回数（鮮度トークンの変更マーカー）
+-- ---------------------------------------------------------
+-- ダッシュボードの鮮度トークンは最新の id / datetime から作るため、新しい記録は数秒で反映されるが、
+-- 既存の記録の修正（時刻・量の訂正）や削除ではトークンが変わらず、キャッシュのTTLが切れるまで古い値が残っていた。
+-- baby_events の UPDATE / DELETE のたびにトリガーで回数を数える。
+-- ダッシュボードはこの回数も鮮度トークンに含め、変わったらキャッシュを取り直し、イベントストアは期間内を読み直す。
+--
+-- 列:
+--   scope      : 数える範囲。'*' は表全体
+--   changes    : これまでの修正・削除の回数
+--   changed_at : 最後に修正・削除した時刻
+--
+-- INSERT は最新idで分かるため数えない。
+
+create table if not exists public.baby_event_changes (
+    scope text primary key,
+    changes bigint not null default 0,
+    changed_at timestamptz not null default now()
+);
+
+-- イベントを書き込むロール（anon など）に回数表への書き込み権限を与えずに済むよう security definer にする
+create or replace function public.baby_event_changes_bump(p_scope text)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    insert into public.baby_event_changes (scope, changes, changed_at)
+    values (p_scope, 1, now())
+    on conflict (scope) do update set
+        changes = baby_event_changes.changes + 1,
+        changed_at = excluded.changed_at;
+$$;
+
+create or replace function public.baby_events_on_change()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform public.baby_event_changes_bump('*');
+    return null;
+end;
+$$;
+
+drop trigger if exists baby_events_changes on public.baby_events;
+create trigger baby_events_changes
+    after update or delete on public.baby_events
+    for each row execute function public.baby_events_on_change();
+
+grant select on public.baby_event_changes to anon, authenticated;
@@ -0,0 +1,149 @@
+-- ---------------------------------------------------------
+-- 日次ロールアップ表（baby_events への書き込みのたびに該当日だけ更新）
+-- ---------------------------------------------------------
+-- ダッシュボードの BABY_DAILY_ROLLUP=1 で、14日分の棒グラフ・KPIをこの表から読む。
+-- 主キー（JSTの日付）の範囲読みで最大14行を返すだけなので、1日に記録するイベント数が増えても
+-- 画面表示のコストは変わらない。
+--
+-- 列:
+--   day          : JSTの日付（主キー）
+--   milk_ml      : formula の amount_ml 合計（formula の記録がない日は null）
+--   breast_count : breast の回数
+--   pee_count    : diaper_pee の回数
+--   poop_count   : diaper_poop の回数
+--   sleep_hours  : 睡眠時間合計[h]（睡眠がない日は null）。0時をまたぐ睡眠は両日に分割して計上
+--
+-- 時刻・睡眠の組み方は baby_daily_totals（20261016120000_baby_daily_totals.sql）と同じ。
+-- 既存の履歴は baby_rollup_backfill（または rollup_backfill.py）で作成する。
+
+create table if not exists public.baby_daily_rollup (
+    day date primary key,
+    milk_ml numeric,
+    breast_count integer not null default 0,
+    pee_count integer not null default 0,
+    poop_count integer not null default 0,
+    sleep_hours numeric,
+    updated_at timestamptz not null default now()
+);
+
+-- 1日分を生イベントから計算し直して書き込む（イベントがなくなった日は行を消す）
+-- イベントを書き込むロール（anon など）にロールアップ表への書き込み権限を与えずに済むよう security definer にする
+create or replace function public.baby_rollup_refresh_day(p_day date)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    with events as (
+        -- 前日の夜から続く睡眠・翌日まで続く睡眠を組むため、前後1日も読む
+        select e."datetime"::timestamp as ts, e.type_slug, e.amount_ml
+        from public.baby_events e
+        where e."datetime" >= (p_day - 1)
+          and e."datetime" < (p_day + 2)
+    ),
+    today as (
+        select * from events where ts >= p_day::timestamp and ts < (p_day + 1)::timestamp
+    ),
+    sleep_rows as (
+        select ts, type_slug,
+               lead(type_slug) over (order by ts) as next_slug,
+               lead(ts) over (order by ts) as next_ts
+        from events
+        where type_slug in ('sleep_start', 'sleep_end')
+    ),
+    sessions as (
+        select ts as s, next_ts as e
+        from sleep_rows
+        where type_slug = 'sleep_start' and next_slug = 'sleep_end'
+          and ts < (p_day + 1)::timestamp and next_ts > p_day::timestamp
+    ),
+    totals as (
+        select
+            (select sum(coalesce(amount_ml, 0)) from today where type_slug = 'formula')::numeric as milk_ml,
+            (select count(*) from today where type_slug = 'breast')::integer as breast_count,
+            (select count(*) from today where type_slug = 'diaper_pee')::integer as pee_count,
+            (select count(*) from today where type_slug = 'diaper_poop')::integer as poop_count,
+            (select round(sum(extract(epoch from (least(e, (p_day + 1)::timestamp) - greatest(s, p_day::timestamp))) / 3600)::numeric, 4)
+               from sessions) as sleep_hours,
+            (select count(*) from today) as event_count
+    )
+    insert into public.baby_daily_rollup (day, milk_ml, breast_count, pee_count, poop_count, sleep_hours, updated_at)
+    select p_day, t.milk_ml, t.breast_count, t.pee_count, t.poop_count, t.sleep_hours, now()
+    from totals t
+    where t.event_count > 0 or t.sleep_hours is not null
+    on conflict (day) do update set
+        milk_ml = excluded.milk_ml,
+        breast_count = excluded.breast_count,
+        pee_count = excluded.pee_count,
+        poop_count = excluded.poop_count,
+        sleep_hours = excluded.sleep_hours,
+        updated_at = excluded.updated_at;
+
+    if not found then
+        delete from public.baby_daily_rollup where day = p_day;
+    end if;
+end;
+$$;
+
+-- 1件のイベント（時刻・種別）で影響を受ける日だけを更新する。
+-- 睡眠の記録は前後の日のセッションの組み方を変えるため、前日・翌日も更新する。
+-- （p_datetime は表記どおりの壁時計時刻として扱うため text で受け取る）
+create or replace function public.baby_rollup_refresh_for_event(p_datetime text, p_type_slug text)
+returns void
+language plpgsql
+as $$
+declare
+    d date := p_datetime::timestamp::date;
+begin
+    if p_type_slug in ('sleep_start', 'sleep_end') then
+        perform public.baby_rollup_refresh_day(d - 1);
+        perform public.baby_rollup_refresh_day(d + 1);
+    end if;
+    perform public.baby_rollup_refresh_day(d);
+end;
+$$;
+
+create or replace function public.baby_rollup_on_event()
+returns trigger
+language plpgsql
+as $$
+begin
+    if TG_OP in ('UPDATE', 'DELETE') then
+        perform public.baby_rollup_refresh_for_event(OLD."datetime"::text, OLD.type_slug);
+    end if;
+    if TG_OP in ('INSERT', 'UPDATE') then
+        perform public.baby_rollup_refresh_for_event(NEW."datetime"::text, NEW.type_slug);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists baby_events_rollup on public.baby_events;
+create trigger baby_events_rollup
+    after insert or update or delete on public.baby_events
+    for each row execute function public.baby_rollup_on_event();
+
+-- 既存の履歴からロールアップを作る（p_from〜p_to の各日を計算し直す）。処理した日数を返す。
+create or replace function public.baby_rollup_backfill(p_from date, p_to date)
+returns integer
+language plpgsql
+as $$
+declare
+    d date;
+    n integer := 0;
+begin
+    for d in select generate_series(p_from, p_to, interval '1 day')::date loop
+        perform public.baby_rollup_refresh_day(d);
+        n := n + 1;
+    end loop;
+    return n;
+end;
+$$;
+
+grant select on public.baby_daily_rollup to anon, authenticated;
+grant execute on function public.baby_rollup_backfill(date, date) to authenticated;
+
+-- 1日分の再計算で使う索引（日付範囲の読み出し）
+create index if not exists baby_events_datetime_idx
+    on public.baby_events ("datetime");
@@ -0,0 +1,248 @@
+-- ---------------------------------------------------------
+-- 複数の家庭・赤ちゃん（テナント）への対応
+-- ---------------------------------------------------------
+-- baby_events に household_id / baby_id を追加し、ダッシュボードの問い合わせを baby_id で絞り込む。
+-- 既存の行（1家庭だけで使っていた頃の記録）は null のまま残り、テナント指定なしの表示で従来どおり読める。
+--
+-- 索引は baby_id を先頭にした複合索引にし、表全体が何百万行に増えても
+-- 1人分の問い合わせが読む範囲はその赤ちゃんの行だけになるようにする。
+--   (baby_id, type_slug, "datetime" desc) : 種別ごとの最新イベント・日次集計（baby_daily_totals）
+--   (baby_id, "datetime")                 : カード用スナップショット（直近15日分の範囲読み）
+--   (baby_id, id)                         : 鮮度トークン（その赤ちゃんの最新id）の確認
+--   (coalesce(baby_id, ''), "datetime")   : 日次ロールアップの再計算
+--
+-- 複数の家庭で共有する場合は、RLSで household_id をログインユーザーの家庭に限定することを推奨する
+-- （例: using (household_id = (auth.jwt() ->> 'household_id'))）。
+
+alter table public.baby_events add column if not exists household_id text;
+alter table public.baby_events add column if not exists baby_id text;
+
+create index if not exists baby_events_baby_type_slug_datetime_idx
+    on public.baby_events (baby_id, type_slug, "datetime" desc);
+create index if not exists baby_events_baby_datetime_idx
+    on public.baby_events (baby_id, "datetime");
+create index if not exists baby_events_baby_id_idx
+    on public.baby_events (baby_id, id);
+-- ロールアップの再計算用（baby_id のない既存の行を '' として同じ索引で引く）
+create index if not exists baby_events_baby_key_datetime_idx
+    on public.baby_events ((coalesce(baby_id, '')), "datetime");
+
+-- ---------------------------------------------------------
+-- 日次ロールアップを赤ちゃんごとに分ける（主キー: baby_id, day）
+-- baby_id を持たない既存のイベントは baby_id = '' の行に集計する
+-- ---------------------------------------------------------
+alter table public.baby_daily_rollup add column if not exists baby_id text not null default '';
+alter table public.baby_daily_rollup drop constraint if exists baby_daily_rollup_pkey;
+alter table public.baby_daily_rollup add primary key (baby_id, day);
+
+drop trigger if exists baby_events_rollup on public.baby_events;
+drop function if exists public.baby_rollup_backfill(date, date);
+drop function if exists public.baby_rollup_refresh_for_event(text, text);
+drop function if exists public.baby_rollup_refresh_day(date);
+
+create or replace function public.baby_rollup_refresh_day(p_baby_id text, p_day date)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    with events as (
+        select e."datetime"::timestamp as ts, e.type_slug, e.amount_ml
+        from public.baby_events e
+        where coalesce(e.baby_id, '') = p_baby_id
+          and e."datetime" >= (p_day - 1)
+          and e."datetime" < (p_day + 2)
+    ),
+    today as (
+        select * from events where ts >= p_day::timestamp and ts < (p_day + 1)::timestamp
+    ),
+    sleep_rows as (
+        select ts, type_slug,
+               lead(type_slug) over (order by ts) as next_slug,
+               lead(ts) over (order by ts) as next_ts
+        from events
+        where type_slug in ('sleep_start', 'sleep_end')
+    ),
+    sessions as (
+        select ts as s, next_ts as e
+        from sleep_rows
+        where type_slug = 'sleep_start' and next_slug = 'sleep_end'
+          and ts < (p_day + 1)::timestamp and next_ts > p_day::timestamp
+    ),
+    totals as (
+        select
+            (select sum(coalesce(amount_ml, 0)) from today where type_slug = 'formula')::numeric as milk_ml,
+            (select count(*) from today where type_slug = 'breast')::integer as breast_count,
+            (select count(*) from today where type_slug = 'diaper_pee')::integer as pee_count,
+            (select count(*) from today where type_slug = 'diaper_poop')::integer as poop_count,
+            (select round(sum(extract(epoch from (least(e, (p_day + 1)::timestamp) - greatest(s, p_day::timestamp))) / 3600)::numeric, 4)
+               from sessions) as sleep_hours,
+            (select count(*) from today) as event_count
+    )
+    insert into public.baby_daily_rollup (baby_id, day, milk_ml, breast_count, pee_count, poop_count, sleep_hours, updated_at)
+    select p_baby_id, p_day, t.milk_ml, t.breast_count, t.pee_count, t.poop_count, t.sleep_hours, now()
+    from totals t
+    where t.event_count > 0 or t.sleep_hours is not null
+    on conflict (baby_id, day) do update set
+        milk_ml = excluded.milk_ml,
+        breast_count = excluded.breast_count,
+        pee_count = excluded.pee_count,
+        poop_count = excluded.poop_count,
+        sleep_hours = excluded.sleep_hours,
+        updated_at = excluded.updated_at;
+
+    if not found then
+        delete from public.baby_daily_rollup where baby_id = p_baby_id and day = p_day;
+    end if;
+end;
+$$;
+
+create or replace function public.baby_rollup_refresh_for_event(p_baby_id text, p_datetime text, p_type_slug text)
+returns void
+language plpgsql
+as $$
+declare
+    d date := p_datetime::timestamp::date;
+    b text := coalesce(p_baby_id, '');
+begin
+    if p_type_slug in ('sleep_start', 'sleep_end') then
+        perform public.baby_rollup_refresh_day(b, d - 1);
+        perform public.baby_rollup_refresh_day(b, d + 1);
+    end if;
+    perform public.baby_rollup_refresh_day(b, d);
+end;
+$$;
+
+create or replace function public.baby_rollup_on_event()
+returns trigger
+language plpgsql
+as $$
+begin
+    if TG_OP in ('UPDATE', 'DELETE') then
+        perform public.baby_rollup_refresh_for_event(OLD.baby_id, OLD."datetime"::text, OLD.type_slug);
+    end if;
+    if TG_OP in ('INSERT', 'UPDATE') then
+        perform public.baby_rollup_refresh_for_event(NEW.baby_id, NEW."datetime"::text, NEW.type_slug);
+    end if;
+    return null;
+end;
+$$;
+
+create trigger baby_events_rollup
+    after insert or update or delete on public.baby_events
+    for each row execute function public.baby_rollup_on_event();
+
+-- p_baby_id を省略すると、期間内に記録のあるすべての赤ちゃんを作り直す。処理した（赤ちゃん×日）の数を返す。
+create or replace function public.baby_rollup_backfill(p_from date, p_to date, p_baby_id text default null)
+returns integer
+language plpgsql
+as $$
+declare
+    b text;
+    d date;
+    n integer := 0;
+begin
+    for b in
+        select distinct coalesce(e.baby_id, '')
+        from public.baby_events e
+        where (p_baby_id is null or coalesce(e.baby_id, '') = p_baby_id)
+          and e."datetime" >= (p_from - 1)
+          and e."datetime" < (p_to + 2)
+    loop
+        for d in select generate_series(p_from, p_to, interval '1 day')::date loop
+            perform public.baby_rollup_refresh_day(b, d);
+            n := n + 1;
+        end loop;
+    end loop;
+    return n;
+end;
+$$;
+
+grant execute on function public.baby_rollup_backfill(date, date, text) to authenticated;
+
+-- ---------------------------------------------------------
+-- baby_daily_totals に赤ちゃん・家庭での絞り込みを追加（省略時は従来どおり表全体）
+-- ---------------------------------------------------------
+drop function if exists public.baby_daily_totals(date, integer);
+
+create or replace function public.baby_daily_totals(
+    p_today date default (now() at time zone 'Asia/Tokyo')::date,
+    p_days integer default 14,
+    p_baby_id text default null,
+    p_household_id text default null
+)
+returns table(day date, milk_ml numeric, sleep_hours numeric)
+language sql
+stable
+set search_path = public
+as $$
+    with bounds as (
+        select (p_today - (p_days - 1))::date as first_day, p_today as last_day
+    ),
+    events as (
+        select e."datetime"::timestamp as ts, e.type_slug, e.amount_ml
+        from public.baby_events e, bounds b
+        where (p_baby_id is null or e.baby_id = p_baby_id)
+          and (p_household_id is null or e.household_id = p_household_id)
+          and e."datetime" >= (b.first_day - 1)
+          and e."datetime" < (b.last_day + 1)
+          and e.type_slug in ('formula', 'sleep_start', 'sleep_end')
+    ),
+    days as (
+        select generate_series(b.first_day, b.last_day, interval '1 day')::date as day
+        from bounds b
+    ),
+    milk as (
+        select ts::date as day, sum(coalesce(amount_ml, 0))::numeric as milk_ml
+        from events
+        where type_slug = 'formula'
+        group by 1
+    ),
+    sleep_rows as (
+        select ts, type_slug,
+               lead(type_slug) over (order by ts) as next_slug,
+               lead(ts) over (order by ts) as next_ts
+        from events
+        where type_slug in ('sleep_start', 'sleep_end')
+    ),
+    sessions as (
+        select ts as s, next_ts as e
+        from sleep_rows
+        where type_slug = 'sleep_start' and next_slug = 'sleep_end'
+    ),
+    sleep as (
+        select d.day,
+               sum(extract(epoch from (least(x.e, (d.day + 1)::timestamp) - greatest(x.s, d.day::timestamp))) / 3600)::numeric as sleep_hours
+        from days d
+        join sessions x on x.s < (d.day + 1)::timestamp and x.e > d.day::timestamp
+        group by d.day
+    )
+    select d.day, m.milk_ml, round(s.sleep_hours, 4)
+    from days d
+    left join milk m on m.day = d.day
+    left join sleep s on s.day = d.day
+    where m.milk_ml is not null or s.sleep_hours is not null
+    order by d.day
+$$;
+
+grant execute on function public.baby_daily_totals(date, integer, text, text) to anon, authenticated;
+
+-- ---------------------------------------------------------
+-- 修正・削除の回数を赤ちゃんごとにも数える（scope: baby_id、baby_id のない既存の行は ''）
+-- ---------------------------------------------------------
+-- 表全体の回数（'*'）はテナント指定なしの表示用にそのまま数える。
+-- 1行の UPDATE で baby_id を付け替えた場合は、前後の両方の赤ちゃんを数える。
+create or replace function public.baby_events_on_change()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform public.baby_event_changes_bump(coalesce(OLD.baby_id, ''));
+    if TG_OP = 'UPDATE' and NEW.baby_id is distinct from OLD.baby_id then
+        perform public.baby_event_changes_bump(coalesce(NEW.baby_id, ''));
+    end if;
+    perform public.baby_event_changes_bump('*');
+    return null;
+end;
+$$;
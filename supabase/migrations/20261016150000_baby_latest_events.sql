@@ -0,0 +1,70 @@
+-- ---------------------------------------------------------
+-- 分類ごとの最新イベント（経過時間カード・鮮度トークン用）
+-- ---------------------------------------------------------
+-- おむつ替え・授乳の経過時間カードと「今何してる」カードは、それぞれの分類の最新イベント1件だけを使う。
+-- 3つのカード分を1回の呼び出しで返し、あわせて最新id（category = 'any'）も返して
+-- ダッシュボードのキャッシュ無効化（鮮度トークン）の確認にも使う。
+--
+-- 分類:
+--   diaper  : diaper_pee, diaper_poop
+--   feeding : formula, breast
+--   sleep   : sleep_start, sleep_end
+--
+-- type_slug ごとに (baby_id, type_slug, "datetime" desc) 索引の先頭1行だけを読み（lateral ... limit 1）、
+-- DISTINCT ON (category) で分類ごとに最も新しい1行を選ぶ。記録が何年分たまっても読む行数は種別の数だけ。
+-- 最新idは (baby_id, id) 索引の末尾1行。
+--
+-- 'any' 行の changes 列には修正・削除の回数（baby_event_changes）を入れる（分類ごとの行は null）。
+-- p_baby_id の指定があればその赤ちゃんの回数、なければ表全体（'*'）の回数。記録がない間は 0。
+-- 読み込む表は public.baby_events に固定する（baby_daily_totals と同じ理由）。
+--
+-- 使い方: select * from baby_latest_events('b-123');
+
+create or replace function public.baby_latest_events(
+    p_baby_id text default null,
+    p_household_id text default null
+)
+returns table(category text, id bigint, "datetime" text, type_slug text, type_jp text, amount_ml numeric, changes bigint)
+language sql
+stable
+set search_path = public
+as $$
+    with slugs(category, type_slug) as (
+        values ('diaper', 'diaper_pee'), ('diaper', 'diaper_poop'),
+               ('feeding', 'formula'), ('feeding', 'breast'),
+               ('sleep', 'sleep_start'), ('sleep', 'sleep_end')
+    ),
+    per_slug as (
+        select s.category, e.id, e."datetime", e.type_slug, e.type_jp, e.amount_ml
+        from slugs s
+        cross join lateral (
+            select x.id, x."datetime", x.type_slug, x.type_jp, x.amount_ml
+            from public.baby_events x
+            where x.type_slug = s.type_slug
+              and (p_baby_id is null or x.baby_id = p_baby_id)
+              and (p_household_id is null or x.household_id = p_household_id)
+            order by x."datetime" desc
+            limit 1
+        ) e
+    ),
+    latest_per_category as (
+        select distinct on (p.category) p.category, p.id::bigint, p."datetime"::text, p.type_slug, p.type_jp, p.amount_ml::numeric,
+               null::bigint as changes
+        from per_slug p
+        order by p.category, p."datetime" desc
+    ),
+    latest_id as (
+        select 'any'::text as category, x.id::bigint, x."datetime"::text, x.type_slug, x.type_jp, x.amount_ml::numeric,
+               coalesce((select c.changes from public.baby_event_changes c where c.scope = coalesce(p_baby_id, '*')), 0) as changes
+        from public.baby_events x
+        where (p_baby_id is null or x.baby_id = p_baby_id)
+          and (p_household_id is null or x.household_id = p_household_id)
+        order by x.id desc
+        limit 1
+    )
+    select * from latest_per_category
+    union all
+    select * from latest_id
+$$;
+
+grant execute on function public.baby_latest_events(text, text) to anon, authenticated;
@@ -0,0 +1,79 @@
+-- ---------------------------------------------------------
+-- 家庭ごとの行レベルセキュリティ（RLS）
+-- ---------------------------------------------------------
+-- これまでダッシュボードは共有の SUPABASE_KEY（anon）で問い合わせ、表示する家庭・赤ちゃんは
+-- URLの ?baby_id= / ?household_id= で選んでいたため、値を書き換えれば他の家庭の記録を読めた。
+-- ダッシュボードは家庭ごとに発行した署名付きトークン（tenant_token.py。SUPABASE_JWT_SECRET で署名した
+-- role=authenticated の JWT に household_id / baby_id を入れたもの）で問い合わせるようにし、
+-- 読み書きできる行はこのトークンの household_id の行だけにする。
+--
+--   baby_events        : household_id = JWT の household_id の行だけ読み書き・修正・削除できる
+--   baby_daily_rollup  : その家庭の赤ちゃん（baby_events に household_id 付きで記録のある baby_id）の行だけ読める
+--   baby_event_changes : 同じく、その家庭の赤ちゃんの回数だけ読める
+--
+-- RPC（baby_daily_totals / baby_latest_events）は security invoker のため、上のポリシーがそのまま効く。
+-- anon からは表・RPCの権限を取り消す（トークンなしでは何も読めない）。
+--
+-- 夜間バッチ（digest_worker.py）・rollup_backfill.py・1家庭だけで使う構成のダッシュボードは、
+-- SUPABASE_KEY に service_role のキーを使う（RLSを通らず、表全体を読める）。このキーはサーバーの外に出さないこと。
+
+create or replace function public.baby_jwt_household_id()
+returns text
+language sql
+stable
+as $$
+    select auth.jwt() ->> 'household_id'
+$$;
+
+alter table public.baby_events enable row level security;
+alter table public.baby_daily_rollup enable row level security;
+alter table public.baby_event_changes enable row level security;
+
+drop policy if exists baby_events_household_select on public.baby_events;
+drop policy if exists baby_events_household_insert on public.baby_events;
+drop policy if exists baby_events_household_update on public.baby_events;
+drop policy if exists baby_events_household_delete on public.baby_events;
+
+create policy baby_events_household_select on public.baby_events
+    for select to authenticated
+    using (household_id = public.baby_jwt_household_id());
+create policy baby_events_household_insert on public.baby_events
+    for insert to authenticated
+    with check (household_id = public.baby_jwt_household_id());
+create policy baby_events_household_update on public.baby_events
+    for update to authenticated
+    using (household_id = public.baby_jwt_household_id())
+    with check (household_id = public.baby_jwt_household_id());
+create policy baby_events_household_delete on public.baby_events
+    for delete to authenticated
+    using (household_id = public.baby_jwt_household_id());
+
+drop policy if exists baby_daily_rollup_household_select on public.baby_daily_rollup;
+create policy baby_daily_rollup_household_select on public.baby_daily_rollup
+    for select to authenticated
+    using (exists (
+        select 1 from public.baby_events e
+        where e.baby_id = baby_daily_rollup.baby_id
+          and e.household_id = public.baby_jwt_household_id()
+    ));
+
+drop policy if exists baby_event_changes_household_select on public.baby_event_changes;
+create policy baby_event_changes_household_select on public.baby_event_changes
+    for select to authenticated
+    using (exists (
+        select 1 from public.baby_events e
+        where e.baby_id = baby_event_changes.scope
+          and e.household_id = public.baby_jwt_household_id()
+    ));
+
+-- トークンなし（anon）では読めないようにする
+revoke all on public.baby_events from anon;
+revoke select on public.baby_daily_rollup from anon;
+revoke select on public.baby_event_changes from anon;
+revoke execute on function public.baby_daily_totals(date, integer, text, text) from public, anon;
+revoke execute on function public.baby_latest_events(text, text) from public, anon;
+-- バックフィルは service_role で実行する（家庭のトークンからは呼ばせない）
+revoke execute on function public.baby_rollup_backfill(date, date, text) from public, authenticated;
+
+grant select, insert, update, delete on public.baby_events to authenticated;
+grant usage, select on all sequences in schema public to authenticated;
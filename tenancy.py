@@ -0,0 +1,140 @@
+"""
+テナント（家庭・赤ちゃん）の識別
+
+1つのダッシュボードで複数の家庭・赤ちゃんを扱うため、baby_events の household_id / baby_id 列で
+問い合わせを絞り込む。どの赤ちゃんを表示するかは URL のクエリパラメータ（?baby_id=...&household_id=...）か、
+環境変数 BABY_ID / BABY_HOUSEHOLD_ID で指定する。
+
+どちらも指定しない場合（Tenant()）は従来どおり絞り込みを行わない（1家庭だけで使う既存の構成向け）。
+
+複数の家庭で共有する構成（BABY_REQUIRE_TENANT=1）では、クエリパラメータの baby_id は誰でも書き換えられるため使わず、
+家庭ごとに発行した署名付きトークン（?token=...。tenant_token.py で発行）からテナントを決める。
+トークンは Supabase の JWT シークレット（SUPABASE_JWT_SECRET）で署名した JWT（HS256、PyJWT で発行・検証）で、
+role=authenticated と household_id / baby_id のクレームを持つ。ダッシュボードはこのトークンを
+そのまま Supabase への問い合わせの Authorization に使い、RLS（supabase/migrations/20261017120000_baby_rls.sql）で
+その家庭の行だけを読めるようにする。テナント（キャッシュのキー）にはトークンを含めないため、
+同じ赤ちゃんの別のリンクから開いてもイベントストア・キャッシュは共有する。
+
+推奨する索引（supabase/migrations/20261016140000_baby_tenancy.sql）:
+    (baby_id, type_slug, datetime desc)  種別ごとの最新・日次集計
+    (baby_id, datetime)                  カード用スナップショット（直近15日分の範囲読み）
+    (baby_id, id)                        鮮度トークン（最新id）の確認
+"""
+import time
+from typing import NamedTuple
+
+import jwt
+
+TENANT_COLUMNS = ("household_id", "baby_id")
+TOKEN_ALGORITHM = "HS256"
+TOKEN_AUDIENCE = "authenticated"
+
+
+class Tenant(NamedTuple):
+    """表示対象の家庭・赤ちゃん。キャッシュのキーにもそのまま使う（ハッシュ可能なタプル）"""
+
+    household_id: str | None = None
+    baby_id: str | None = None
+
+    @property
+    def is_scoped(self) -> bool:
+        return self.household_id is not None or self.baby_id is not None
+
+    @property
+    def rollup_key(self) -> str:
+        """日次ロールアップ表の baby_id（baby_id を持たない既存のイベントは '' に集計される）"""
+        return self.baby_id or ""
+
+    @property
+    def change_scope(self) -> str:
+        """修正・削除の回数（baby_event_changes）の scope。baby_id の指定がなければ表全体の '*'"""
+        return self.baby_id if self.baby_id is not None else "*"
+
+    def filters(self) -> dict:
+        """絞り込みに使う列と値（指定のあるものだけ）"""
+        return {column: value for column, value in zip(TENANT_COLUMNS, self) if value is not None}
+
+    def apply(self, query):
+        """Supabaseのクエリビルダーに eq 条件を付ける"""
+        for column, value in self.filters().items():
+            query = query.eq(column, value)
+        return query
+
+    def matches(self, record: dict) -> bool:
+        """リアルタイム通知などで受け取った行がこのテナントのものか"""
+        return all(str(record.get(column)) == str(value) for column, value in self.filters().items())
+
+    @property
+    def digest_scope(self) -> str | None:
+        """
+        夜間の分析（digest_store.py）を保存・検索するキー。分析は赤ちゃんごとに作るため baby_id だけで決め、
+        URLで household_id を付けたかどうかに左右されないようにする。
+        絞り込みのない構成（1家庭だけ）は 'default'、baby_id のない家庭単位の指定は None（分析を作らない・使わない）。
+        """
+        if self.baby_id is not None:
+            return f"baby_id={self.baby_id}"
+        return None if self.is_scoped else "default"
+
+    def label(self) -> str:
+        if not self.is_scoped:
+            return "default"
+        return "/".join(f"{column}={value}" for column, value in self.filters().items())
+
+
+SINGLE_TENANT = Tenant()
+
+
+class TenantTokenError(ValueError):
+    """署名付きトークンを確認できない（形式・署名・有効期限・クレームの不足）"""
+
+
+def issue_tenant_token(secret: str, household_id: str, baby_id: str, expires_in: int = 365 * 24 * 3600,
+                       now: float | None = None) -> str:
+    """
+    家庭・赤ちゃんの署名付きトークン（Supabase の authenticated ロールとして使えるJWT）を発行する。
+
+    Args:
+        secret: Supabase の JWT シークレット（SUPABASE_JWT_SECRET）
+        expires_in: 有効期間[秒]
+    """
+    issued_at = int(time.time() if now is None else now)
+    claims = {"role": "authenticated", "aud": TOKEN_AUDIENCE, "household_id": household_id, "baby_id": baby_id,
+              "iat": issued_at, "exp": issued_at + int(expires_in)}
+    return jwt.encode(claims, secret, algorithm=TOKEN_ALGORITHM)
+
+
+def tenant_from_token(token: str, secret: str | None) -> Tenant:
+    """
+    署名付きトークンを確認し、そのクレームの household_id / baby_id のテナントを返す。
+
+    Raises:
+        TenantTokenError: シークレットがない・形式が正しくない・署名が一致しない・期限切れ・household_id がない
+    """
+    if not secret:
+        raise TenantTokenError("SUPABASE_JWT_SECRET が設定されていません")
+    try:
+        claims = jwt.decode(token, secret, algorithms=[TOKEN_ALGORITHM], audience=TOKEN_AUDIENCE,
+                            options={"require": ["exp"]})
+    except jwt.ExpiredSignatureError:
+        raise TenantTokenError("トークンの有効期限が切れています") from None
+    except jwt.InvalidSignatureError:
+        raise TenantTokenError("トークンの署名が一致しません") from None
+    except jwt.InvalidTokenError:
+        raise TenantTokenError("トークンの形式が正しくありません") from None
+    if not claims.get("household_id"):
+        raise TenantTokenError("トークンに household_id がありません")
+    baby_id = claims.get("baby_id")
+    return Tenant(household_id=str(claims["household_id"]), baby_id=str(baby_id) if baby_id else None)
+
+
+def tenant_from_params(params, env) -> Tenant:
+    """
+    クエリパラメータ（st.query_params など）→ 環境変数の順にテナントを決める。
+
+    Args:
+        params: baby_id / household_id を持つ辞書風のオブジェクト
+        env: 環境変数（os.environ など）。BABY_ID / BABY_HOUSEHOLD_ID を見る
+    """
+    baby_id = params.get("baby_id") or env.get("BABY_ID") or None
+    household_id = params.get("household_id") or env.get("BABY_HOUSEHOLD_ID") or None
+    return Tenant(household_id=household_id, baby_id=baby_id)
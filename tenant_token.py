@@ -0,0 +1,46 @@
+"""
+家庭・赤ちゃんごとのダッシュボードのリンク（署名付きトークン）を発行する
+
+複数の家庭で共有する構成（BABY_REQUIRE_TENANT=1）では、ダッシュボードは ?token=... のトークンからだけ
+表示する家庭・赤ちゃんを決め、そのトークンで Supabase に問い合わせる（RLSでその家庭の行だけが読める）。
+トークンは Supabase の JWT シークレットで署名するため、ダッシュボードと同じ SUPABASE_JWT_SECRET を使う。
+
+使い方:
+    python tenant_token.py --household-id h-1 --baby-id b-123
+    python tenant_token.py --household-id h-1 --baby-id b-123 --days 30 --base-url https://baby.example.com/
+
+発行したリンクを知っている人は、有効期限までその赤ちゃんの記録を読み書きできる。
+取り消すときは JWT シークレットを変えて、すべての家庭のリンクを発行し直す。
+"""
+import argparse
+import os
+import sys
+from urllib.parse import urlencode
+
+from tenancy import issue_tenant_token
+
+
+def main():
+    parser = argparse.ArgumentParser(description="家庭・赤ちゃんごとのダッシュボードのリンクを発行する")
+    parser.add_argument("--household-id", required=True, help="家庭のID（RLSでこの家庭の行だけを読めるようにする）")
+    parser.add_argument("--baby-id", required=True, help="表示する赤ちゃんのID")
+    parser.add_argument("--days", type=int, default=365, help="有効期間（日）")
+    parser.add_argument("--base-url", default="http://localhost:8501/", help="ダッシュボードのURL")
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+    secret = os.getenv("SUPABASE_JWT_SECRET")
+    if not secret:
+        sys.exit("SUPABASE_JWT_SECRET が設定されていません（.env を確認してください）")
+
+    token = issue_tenant_token(secret, args.household_id, args.baby_id, expires_in=args.days * 24 * 3600)
+    print(token)
+    print(f"{args.base_url}?{urlencode({'token': token})}")
+
+
+if __name__ == "__main__":
+    main()
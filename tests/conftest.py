@@ -0,0 +1,41 @@
+"""
+テスト共通の準備
+
+リポジトリ直下のモジュール（dashboard.py など）を読み込めるようにし、
+dashboard.py をローカル代替（SQLite）につないで画面なしで読み込むフィクスチャを用意する。
+"""
+import logging
+import os
+import runpy
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def dashboard(tmp_path, monkeypatch):
+    """
+    SQLiteのローカル代替（SUPABASE_URL=sqlite:///...）を使う dashboard.py のグローバル変数の辞書。
+    画面は描画しない（__main__ として実行しない）。キャッシュとセッション状態はテストごとに空にする。
+    """
+    import streamlit as st
+    import streamlit.logger
+    from streamlit import config
+
+    monkeypatch.setenv("SUPABASE_URL", f"sqlite:///{tmp_path / 'events.db'}")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("BABY_EVENT_CACHE", "0")
+    monkeypatch.setenv("BABY_REALTIME", "0")
+    monkeypatch.setenv("BABY_KPI_PREWARM", "0")
+    # 画面なしで読み込むときの警告（missing ScriptRunContext など）を出さない
+    config.get_option("logger.level")
+    streamlit.logger.set_log_level("error")
+    logging.getLogger("baby_dashboard").setLevel(logging.ERROR)
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    st.session_state.clear()
+    return runpy.run_path(os.path.join(ROOT, "dashboard.py"), run_name="dashboard_under_test")
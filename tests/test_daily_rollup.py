@@ -0,0 +1,60 @@
+"""日次ロールアップ（baby_daily_rollup）の書き込み時の更新と、既存の履歴からの作り直し"""
+from datetime import date
+
+import pytest
+
+from local_backend import LocalSupabaseClient
+from rollup_backfill import backfill
+
+EVENTS = [
+    {"datetime": "2026-10-01T09:00:00", "type_slug": "formula", "type_jp": "ミルク", "amount_ml": 120},
+    {"datetime": "2026-10-01T10:00:00", "type_slug": "diaper_pee", "type_jp": "おしっこ"},
+    {"datetime": "2026-10-01T22:00:00", "type_slug": "sleep_start", "type_jp": "寝る"},
+    {"datetime": "2026-10-02T03:00:00", "type_slug": "sleep_end", "type_jp": "起きる"},
+    {"datetime": "2026-10-02T07:00:00", "type_slug": "breast", "type_jp": "母乳"},
+    {"datetime": "2026-10-02T08:00:00", "type_slug": "diaper_poop", "type_jp": "うんち"},
+]
+
+
+def _rollup(client, baby_id=""):
+    rows = (client.table("baby_daily_rollup")
+            .select("day, milk_ml, sleep_hours, breast_count, pee_count, poop_count")
+            .eq("baby_id", baby_id).order("day", desc=False).execute().data)
+    return {row.pop("day"): row for row in rows}
+
+
+def test_insert_updates_rollup_of_affected_days():
+    client = LocalSupabaseClient()
+    for event in EVENTS:
+        client.table("baby_events").insert(event).execute()
+
+    rollup = _rollup(client)
+    assert rollup["2026-10-01"]["milk_ml"] == pytest.approx(120)
+    assert rollup["2026-10-01"]["pee_count"] == 1
+    # 0時をまたぐ睡眠は、sleep_end が入った時点で両日に分けて計上する
+    assert rollup["2026-10-01"]["sleep_hours"] == pytest.approx(2.0)
+    assert rollup["2026-10-02"]["sleep_hours"] == pytest.approx(3.0)
+    assert rollup["2026-10-02"]["breast_count"] == 1
+    assert rollup["2026-10-02"]["poop_count"] == 1
+
+
+def test_backfill_rebuilds_the_same_rollup():
+    client = LocalSupabaseClient()
+    client.table("baby_events").insert(EVENTS).execute()
+    expected = _rollup(client)
+    client._conn.execute("delete from baby_daily_rollup")
+
+    updated = backfill(client, date(2026, 10, 1), date(2026, 10, 2), chunk_days=1, echo=lambda line: None)
+
+    assert updated == 2
+    assert _rollup(client) == expected
+
+
+def test_rollup_is_kept_per_baby():
+    client = LocalSupabaseClient()
+    client.table("baby_events").insert([{**event, "baby_id": "b-1"} for event in EVENTS[:2]]).execute()
+    client.table("baby_events").insert([{**EVENTS[0], "baby_id": "b-2", "amount_ml": 60}]).execute()
+
+    assert _rollup(client, "b-1")["2026-10-01"]["milk_ml"] == pytest.approx(120)
+    assert _rollup(client, "b-2")["2026-10-01"]["milk_ml"] == pytest.approx(60)
+    assert _rollup(client, "") == {}
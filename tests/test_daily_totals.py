@@ -0,0 +1,58 @@
+"""サーバー側の日次集計（RPC baby_daily_totals）と、RPCが使えないときのフォールバック"""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def _insert_events(client, today):
+    yesterday = today - timedelta(days=1)
+    client.table("baby_events").insert([
+        {"datetime": f"{yesterday}T09:00:00", "type_slug": "formula", "type_jp": "ミルク", "amount_ml": 120},
+        {"datetime": f"{yesterday}T13:00:00", "type_slug": "formula", "type_jp": "ミルク", "amount_ml": 80},
+        # 0時をまたぐ睡眠は両日に分けて計上する（前日1時間・当日2時間）
+        {"datetime": f"{yesterday}T23:00:00", "type_slug": "sleep_start", "type_jp": "寝る"},
+        {"datetime": f"{today}T02:00:00", "type_slug": "sleep_end", "type_jp": "起きる"},
+        {"datetime": f"{today}T06:00:00", "type_slug": "formula", "type_jp": "ミルク", "amount_ml": 100},
+    ]).execute()
+
+
+def test_rpc_totals_split_sleep_across_midnight(dashboard):
+    today = datetime.now().date()
+    _insert_events(dashboard["supabase_client"], today)
+
+    daily = dashboard["fetch_daily_totals"]("baby_events").set_index("date")
+
+    assert daily.loc[today - timedelta(days=1), "milk_ml"] == pytest.approx(200)
+    assert daily.loc[today - timedelta(days=1), "sleep_hours"] == pytest.approx(1.0)
+    assert daily.loc[today, "milk_ml"] == pytest.approx(100)
+    assert daily.loc[today, "sleep_hours"] == pytest.approx(2.0)
+
+
+def test_missing_rpc_falls_back_for_the_session(dashboard):
+    client = dashboard["supabase_client"]
+    _insert_events(client, datetime.now().date())
+    del client.rpc_handlers["baby_daily_totals"]
+
+    assert dashboard["fetch_daily_totals"]("baby_events") is None
+    assert not dashboard["rpc_available"]("baby_daily_totals")
+    # 時間が経っても、未作成の関数は呼び直さない
+    assert "baby_daily_totals" not in dashboard["st"].session_state.get("_rpc_retry_at", {})
+
+
+def test_failing_rpc_is_retried_after_cooldown(dashboard):
+    client = dashboard["supabase_client"]
+    _insert_events(client, datetime.now().date())
+    working = client.rpc_handlers["baby_daily_totals"]
+
+    def timeout(client, params):
+        raise TimeoutError("canceling statement due to statement timeout")
+
+    client.rpc_handlers["baby_daily_totals"] = timeout
+    assert dashboard["fetch_daily_totals"]("baby_events") is None
+    assert not dashboard["rpc_available"]("baby_daily_totals")
+
+    # 一時的な失敗は RPC_RETRY_SECONDS 後に再び試す
+    client.rpc_handlers["baby_daily_totals"] = working
+    dashboard["st"].session_state["_rpc_retry_at"]["baby_daily_totals"] = 0
+    assert dashboard["rpc_available"]("baby_daily_totals")
+    assert dashboard["fetch_daily_totals"]("baby_events") is not None
@@ -0,0 +1,65 @@
+"""夜間の分析バッチ（digest_worker.run_job）の再試行"""
+import time
+from types import SimpleNamespace
+
+from digest_store import DigestStore
+from digest_worker import DigestJob, RateLimitGate, backoff_delay, run_job
+from kpi_prompt import analysis_type
+from tenancy import Tenant
+
+QUESTION = "直近の睡眠の傾向を教えてください"
+
+
+def _fake_dashboard(responses):
+    """get_chat_response が responses の (回答, metrics) を順に返す dashboard の代わり"""
+    calls = []
+
+    def get_chat_response(prompt, instruction=None, metrics=None):
+        response, result = responses[len(calls)]
+        calls.append(prompt)
+        metrics.update(result)
+        return response
+
+    dash = SimpleNamespace(
+        GPT_MODEL="gpt-test",
+        build_gpt_instruction=lambda question, include_kpi=False: "instruction",
+        build_gpt_prompt=lambda question, kpi_json=None: f"{question}\n{kpi_json}",
+        get_chat_response=get_chat_response,
+        record_gpt_metrics=lambda question, metrics: None,
+    )
+    return dash, calls
+
+
+def test_rate_limited_job_waits_retry_after_and_succeeds():
+    rate_limited = {"error": "rate limit", "error_status": 429, "retry_after": 0.2}
+    dash, calls = _fake_dashboard([("エラーが発生しました", rate_limited), ("睡眠は安定しています", {"completed": True})])
+    store = DigestStore(":memory:")
+    job = DigestJob(Tenant(baby_id="b-1"), QUESTION, '{"sleep":[]}')
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        time.sleep(seconds)
+
+    result = run_job(dash, store, RateLimitGate(), job, backoff_base=0.01, sleep=sleep)
+
+    assert result.ok and result.attempts == 2
+    assert len(calls) == 2
+    # Retry-After（0.2秒）以上、ジッター（base まで）を足した分だけ待つ
+    assert 0.2 <= sum(sleeps) <= 0.2 + 0.01 + 0.05
+    assert store.get("baby_id=b-1", analysis_type(QUESTION))["response"] == "睡眠は安定しています"
+
+
+def test_client_errors_are_not_retried():
+    dash, calls = _fake_dashboard([("エラーが発生しました", {"error": "bad request", "error_status": 400})])
+    store = DigestStore(":memory:")
+
+    result = run_job(dash, store, RateLimitGate(), DigestJob(Tenant(baby_id="b-1"), QUESTION, "{}"), sleep=lambda s: None)
+
+    assert not result.ok and result.attempts == 1
+    assert store.count() == 0
+
+
+def test_backoff_delay_is_capped():
+    assert backoff_delay(10, base=1.0, cap=5.0) <= 5.0
+    assert backoff_delay(0, base=1.0, cap=5.0, retry_after=30.0) == 5.0
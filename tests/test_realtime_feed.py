@@ -0,0 +1,134 @@
+"""リアルタイム購読（RealtimeFeed）からイベントストアへの反映と、切断時の再接続"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from realtime import RealtimeSubscribeStates
+
+import realtime_feed
+from event_store import EventStore
+from realtime_feed import FakeChannel, RealtimeFeed, supabase_subscriber, wait_until
+from tenancy import Tenant
+
+
+def _record(id, minutes_ago, type_slug="formula", **extra):
+    stamp = (datetime.now() - timedelta(minutes=minutes_ago)).strftime("%Y-%m-%dT%H:%M:%S")
+    return {"id": id, "datetime": stamp, "type_slug": type_slug, "type_jp": type_slug, "amount_ml": 100.0, **extra}
+
+
+def test_insert_and_delete_update_store_and_category_versions():
+    store = EventStore()
+    changes = [
+        {"type": "INSERT", "record": _record(1, 30, "formula")},
+        {"type": "INSERT", "record": _record(2, 20, "diaper_pee", amount_ml=None)},
+        {"type": "DELETE", "record": {}, "old_record": {"id": 1}},
+    ]
+    channel = FakeChannel(changes)
+    feed = RealtimeFeed(store, channel).start()
+    try:
+        assert channel.replayed.wait(5)
+        assert wait_until(lambda: feed.received == 3)
+    finally:
+        feed.stop()
+
+    assert store.frame["id"].tolist() == [2]
+    assert store.version == 3
+    # おむつ替えは1回、授乳は追加と削除の2回だけ変わる（睡眠のカードは描き直さない）
+    assert store.category_versions == {"diaper": 1, "feeding": 2, "sleep": 0}
+
+
+def test_changes_for_other_babies_are_ignored():
+    store = EventStore(tenant=Tenant(baby_id="b-1"))
+    channel = FakeChannel([
+        {"type": "INSERT", "record": _record(1, 10, baby_id="b-2")},
+        {"type": "INSERT", "record": _record(2, 5, baby_id="b-1")},
+    ])
+    feed = RealtimeFeed(store, channel).start()
+    try:
+        assert channel.replayed.wait(5)
+    finally:
+        feed.stop()
+
+    assert store.frame["id"].tolist() == [2]
+
+
+def test_channel_error_clears_connected_and_reconnects():
+    attempts = []
+
+    async def flaky(on_change, on_ready):
+        attempts.append(len(attempts))
+        on_ready()
+        if len(attempts) == 1:
+            # 購読後にチャネルが CHANNEL_ERROR になった（supabase_subscriber は ConnectionError を送出する）
+            raise ConnectionError("realtime channel CHANNEL_ERROR")
+        await asyncio.Event().wait()
+
+    feed = RealtimeFeed(EventStore(), flaky).start()
+    try:
+        assert wait_until(lambda: len(attempts) == 2 and feed.connected)
+        assert isinstance(feed.last_error, ConnectionError)
+        # 再接続のたびに、購読前の取りこぼしをDBから取り込み直す
+        assert feed.catch_up_pending
+    finally:
+        feed.stop()
+    assert not feed.connected
+
+
+class _StatusChannel:
+    """subscribe に渡された状態の通知関数へ、用意した状態を順に流すだけのチャネル"""
+
+    def __init__(self, states):
+        self.states = states
+
+    def on_postgres_changes(self, *args, **kwargs):
+        pass
+
+    async def subscribe(self, callback=None):
+        for state in self.states:
+            callback(state, None)
+        return self
+
+
+class _StatusClient:
+    def __init__(self, states, connected=True):
+        self.realtime = SimpleNamespace(is_connected=connected)
+        self.states = states
+
+    def channel(self, name):
+        return _StatusChannel(self.states)
+
+    async def remove_all_channels(self):
+        pass
+
+
+def _run_subscriber(monkeypatch, client):
+    async def acreate_client(url, key):
+        return client
+
+    monkeypatch.setattr("supabase.acreate_client", acreate_client)
+    ready = []
+    subscribe = supabase_subscriber("http://localhost", "anon-key")
+    with pytest.raises(ConnectionError) as error:
+        asyncio.run(asyncio.wait_for(subscribe(lambda change: None, lambda: ready.append(True)), 5))
+    return ready, str(error.value)
+
+
+def test_subscriber_is_ready_only_after_subscribed(monkeypatch):
+    ready, error = _run_subscriber(monkeypatch, _StatusClient([RealtimeSubscribeStates.TIMED_OUT]))
+    assert ready == []
+    assert "TIMED_OUT" in error
+
+
+def test_subscriber_raises_on_channel_error_after_subscribed(monkeypatch):
+    client = _StatusClient([RealtimeSubscribeStates.SUBSCRIBED, RealtimeSubscribeStates.CHANNEL_ERROR])
+    ready, error = _run_subscriber(monkeypatch, client)
+    assert ready == [True]
+    assert "CHANNEL_ERROR" in error
+
+
+def test_subscriber_raises_when_socket_drops(monkeypatch):
+    monkeypatch.setattr(realtime_feed, "SOCKET_CHECK_SECONDS", 0.01)
+    ready, error = _run_subscriber(monkeypatch, _StatusClient([RealtimeSubscribeStates.SUBSCRIBED], connected=False))
+    assert ready == [True]
+    assert "socket" in error
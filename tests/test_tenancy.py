@@ -0,0 +1,33 @@
+"""署名付きトークン（tenancy.issue_tenant_token / tenant_from_token）の発行と確認"""
+import pytest
+
+from tenancy import Tenant, TenantTokenError, issue_tenant_token, tenant_from_token
+
+SECRET = "test-jwt-secret-0123456789abcdef0123"
+
+
+def test_token_round_trip_gives_household_and_baby():
+    token = issue_tenant_token(SECRET, "h-1", "b-1")
+
+    assert tenant_from_token(token, SECRET) == Tenant(household_id="h-1", baby_id="b-1")
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    token = issue_tenant_token("other-jwt-secret-0123456789abcdef012", "h-1", "b-1")
+
+    with pytest.raises(TenantTokenError, match="署名"):
+        tenant_from_token(token, SECRET)
+
+
+def test_expired_token_is_rejected():
+    token = issue_tenant_token(SECRET, "h-1", "b-1", expires_in=60, now=0)
+
+    with pytest.raises(TenantTokenError, match="有効期限"):
+        tenant_from_token(token, SECRET)
+
+
+def test_missing_secret_or_malformed_token_is_rejected():
+    with pytest.raises(TenantTokenError):
+        tenant_from_token(issue_tenant_token(SECRET, "h-1", "b-1"), None)
+    with pytest.raises(TenantTokenError, match="形式"):
+        tenant_from_token("not-a-jwt", SECRET)
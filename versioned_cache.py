@@ -0,0 +1,84 @@
+"""
+データの版ごとに1つの値を保持し、バックグラウンドで作っておくキャッシュ
+
+ダッシュボードの描画でデータの版（JSTの日付と鮮度トークン）が決まったら prewarm で値の作成を始め、
+ボタンが押されたときは wait で出来上がった値を受け取るだけにする。
+- 保持するのは最新の版の値1つだけ（古い版の作成が後から終わっても、新しい版の値を上書きしない）
+- 同じ版の作成は、複数のセッションから頼まれても1回だけ行う
+- 作成はそのたびに起動するデーモンスレッドで行う（版が変わったときだけなので、常駐のスレッドは持たない）
+"""
+import logging
+import threading
+from typing import Any, Callable
+
+logger = logging.getLogger("baby_dashboard")
+
+
+class VersionedCache:
+    """最新の版の値を1つだけ保持するキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, name: str = "value"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._version: str | None = None
+        self._value: Any = None
+        self._ticket = 0         # prewarm / put を受け付けた順番
+        self._stored_ticket = 0  # 保持している値の順番（これより古い作成結果は捨てる）
+        self._pending: dict[str, threading.Event] = {}
+
+    def get(self, version: str) -> Any | None:
+        """version の値（なければNone）"""
+        with self._lock:
+            return self._value if self._version == version else None
+
+    def put(self, version: str, value: Any):
+        with self._lock:
+            self._ticket += 1
+            self._store(self._ticket, version, value)
+
+    def prewarm(self, version: str, build: Callable[[], Any]) -> bool:
+        """
+        version の値がなく、作成中でもなければ、バックグラウンドで build() を実行して保持する。
+
+        Returns:
+            bool: 作成を始めたらTrue
+        """
+        with self._lock:
+            if self._version == version or version in self._pending:
+                return False
+            self._ticket += 1
+            done = self._pending[version] = threading.Event()
+            ticket = self._ticket
+        threading.Thread(target=self._build, args=(ticket, version, build, done),
+                         name=f"prewarm-{self.name}", daemon=True).start()
+        return True
+
+    def wait(self, version: str, timeout: float | None = None) -> Any | None:
+        """
+        version の値を返す。作成中なら最大 timeout 秒待つ。
+        値がない・作成中でない・作成に失敗した・間に合わない場合はNone（呼び出し側でその場で作る）。
+        """
+        with self._lock:
+            if self._version == version:
+                return self._value
+            done = self._pending.get(version)
+        if done is None or not done.wait(timeout):
+            return None
+        return self.get(version)
+
+    def _build(self, ticket: int, version: str, build: Callable[[], Any], done: threading.Event):
+        try:
+            value = build()
+            with self._lock:
+                self._store(ticket, version, value)
+        except Exception:
+            logger.exception("Failed to prewarm %s for version %s", self.name, version)
+        finally:
+            with self._lock:
+                self._pending.pop(version, None)
+            done.set()
+
+    def _store(self, ticket: int, version: str, value: Any):
+        # ロックを取った状態で呼ぶ
+        if ticket > self._stored_ticket:
+            self._version, self._value, self._stored_ticket = version, value, ticket